@@ -1,6 +1,6 @@
 import React from 'react';
 import { Recommendation as RecommendationType } from '../types/insights';
-import { getActionColor } from '../utils/formatters';
+import { getActionColor, formatPercentage } from '../utils/formatters';
 import { AlertPopup, ConfirmPopup } from './Popup';
 import { useAlert } from '../hooks/useAlert';
 
@@ -110,7 +110,7 @@ ${recommendation.why_despite_risks}
 
 💰 Investment Details:
 • Amount: ${recommendation.amount_ils}
-• Portfolio %: ${recommendation.percentage_of_portfolio}
+• Portfolio %: ${formatPercentage(recommendation.percentage_of_portfolio)}
 • Stop Loss: ${recommendation.stop_loss}
 
 Please help me understand this investment recommendation better. I'd like to discuss:
@@ -279,7 +279,7 @@ What are your thoughts on this recommendation?
               fontWeight: 600,
               color: appleColors.text.primary
             }}>
-              {recommendation.percentage_of_portfolio}
+              {formatPercentage(recommendation.percentage_of_portfolio)}
             </div>
           </div>
           <div style={{ textAlign: 'center' }}>
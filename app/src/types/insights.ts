@@ -16,11 +16,11 @@ export interface Recommendation {
   symbol: string;
   action: 'לקנות' | 'למכור' | 'להחזיק';
   action_hebrew: string;
-  amount_ils: string;
-  percentage_of_portfolio: string;
-  current_price: string;
-  target_price: string;
-  stop_loss: string;
+  amount_ils: number | string;
+  percentage_of_portfolio: number | string;
+  current_price: number | string;
+  target_price: number | string;
+  stop_loss: number | string;
   confidence: 'גבוה' | 'בינוני' | 'נמוך';
   reason: string;
   timeframe: string;
@@ -45,6 +45,7 @@ export interface SectorAnalysis {
 export interface Alert {
   type: 'רווחים' | 'חדשות' | 'טכני';
   symbol: string;
+  title?: string;
   message: string;
   priority: 'גבוה' | 'בינוני' | 'נמוך';
   action_required: string;
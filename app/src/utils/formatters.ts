@@ -26,6 +26,10 @@ export const formatDate = (date: string): string => {
   }
 };
 
+// Numeric fields are stored as numbers; older insights stored strings like "15%"
+export const formatPercentage = (value: number | string): string =>
+  typeof value === 'number' ? `${value}%` : value;
+
 export const getActionColor = (action: string) => {
   switch (action) {
     case 'לקנות':
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Afternoon Delta Merge for Investment Assistant
+Applies the change records returned by the afternoon model to the morning insight
+"""
+
+import copy
+import logging
+from typing import Dict, List, Optional
+
+from market_data import normalize_symbol
+
+logger = logging.getLogger(__name__)
+
+CHANGE_OPS = ('add', 'update', 'remove')
+RECOMMENDATION_FIELDS = ('action', 'current_price', 'target_price', 'stop_loss', 'reason')
+
+
+def _apply_changes(recommendations: List[Dict], changes: List[Dict]) -> List[Dict]:
+    """Apply add/update/remove records to a copy of the morning recommendations"""
+    merged = [copy.deepcopy(rec) for rec in recommendations]
+    by_symbol = {normalize_symbol(rec.get('symbol')): rec for rec in merged}
+
+    for change in changes:
+        op = str(change.get('op', '')).lower()
+        symbol = normalize_symbol(change.get('symbol'))
+        if op not in CHANGE_OPS or not symbol:
+            logger.warning(f"Ignoring malformed change record: {change}")
+            continue
+
+        if op == 'remove':
+            rec = by_symbol.pop(symbol, None)
+            if rec is not None:
+                merged.remove(rec)
+            continue
+
+        fields = {k: change[k] for k in RECOMMENDATION_FIELDS if change.get(k) not in (None, '')}
+        rec = by_symbol.get(symbol)
+        if rec is None:
+            rec = {'symbol': symbol}
+            merged.append(rec)
+            by_symbol[symbol] = rec
+        rec.update(fields)
+        rec['change'] = op
+
+    return merged
+
+
+def merge_afternoon_delta(morning_insight: Optional[Dict], delta: Dict) -> Dict:
+    """
+    Build the full afternoon view (same shape the afternoon endpoints always
+    returned) from the morning insight and the model's change records.
+    """
+    morning_insight = morning_insight or {}
+    changes = delta.get('changes') or []
+    alerts = delta.get('alerts') or []
+
+    morning_market = morning_insight.get('market_overview') or {}
+    delta_market = delta.get('market_overview') or {}
+    market_overview = {
+        'sentiment': delta_market.get('sentiment') or morning_market.get('sentiment', 'neutral'),
+        'key_events': delta_market.get('key_events', ''),
+        'changes_since_morning': delta_market.get('changes_since_morning', ''),
+    }
+
+    update_summary = dict(delta.get('update_summary') or {})
+    update_summary.setdefault('change_count', len(changes) + len(alerts))
+    update_summary.setdefault('has_significant_changes', update_summary['change_count'] > 0)
+    update_summary.setdefault('priority_level', 'medium' if update_summary['has_significant_changes'] else 'low')
+
+    return {
+        'market_overview': market_overview,
+        'recommendations': _apply_changes(morning_insight.get('recommendations') or [], changes),
+        'alerts': alerts,
+        'changes': changes,
+        'update_summary': update_summary,
+        'morning_insight_id': morning_insight.get('id'),
+    }
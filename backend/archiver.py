@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Insight Archiver for Investment Assistant
+Moves old daily_insights into date-partitioned gzip NDJSON files (GCS or local disk)
+and leaves a thin tombstone in Firestore
+"""
+
+import gzip
+import io
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PREFIX = 'daily_insights'
+DEFAULT_ARCHIVE_AFTER_DAYS = 30
+
+
+class LocalArchiveBackend:
+    """Archive files under a local directory"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def uri(self, path: str) -> str:
+        return f"file://{os.path.join(self.root, path)}"
+
+    def write(self, path: str, data: bytes) -> str:
+        full_path = os.path.join(self.root, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = full_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+        return self.uri(path)
+
+    def list(self, prefix: str) -> List[str]:
+        base = os.path.join(self.root, prefix)
+        paths = []
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                if name.endswith('.ndjson.gz'):
+                    paths.append(os.path.relpath(os.path.join(dirpath, name), self.root))
+        return sorted(paths)
+
+    def open_read(self, path: str):
+        return open(os.path.join(self.root, path), 'rb')
+
+
+class GCSArchiveBackend:
+    """Archive files in a Cloud Storage bucket"""
+
+    def __init__(self, bucket_name: str, client=None):
+        from google.cloud import storage
+        self.bucket_name = bucket_name
+        self.bucket = (client or storage.Client()).bucket(bucket_name)
+
+    def uri(self, path: str) -> str:
+        return f"gs://{self.bucket_name}/{path}"
+
+    def write(self, path: str, data: bytes) -> str:
+        blob = self.bucket.blob(path)
+        blob.upload_from_string(data, content_type='application/x-ndjson')
+        return self.uri(path)
+
+    def list(self, prefix: str) -> List[str]:
+        return sorted(blob.name for blob in self.bucket.list_blobs(prefix=prefix) if blob.name.endswith('.ndjson.gz'))
+
+    def open_read(self, path: str):
+        # Chunked download, so large partitions are never held in memory
+        return self.bucket.blob(path).open('rb')
+
+
+def get_archive_backend(config: Dict):
+    """Pick the backend from config: a bucket wins, otherwise the local directory"""
+    if config.get('ARCHIVE_BUCKET'):
+        return GCSArchiveBackend(config['ARCHIVE_BUCKET'])
+    return LocalArchiveBackend(config.get('ARCHIVE_LOCAL_DIR') or 'data/archive')
+
+
+def _insight_date(insight: Dict) -> Optional[date]:
+    value = insight.get('generated_at') or insight.get('timestamp')
+    if isinstance(value, datetime):
+        return value.date()
+    try:
+        return datetime.fromisoformat(str(value)[:19]).date()
+    except ValueError:
+        return None
+
+
+def partition_path(day: date, run_id: str) -> str:
+    """daily_insights/2025/07/14/part-<run_id>.ndjson.gz"""
+    return f"{ARCHIVE_PREFIX}/{day:%Y/%m/%d}/part-{run_id}.ndjson.gz"
+
+
+def _path_date(path: str) -> Optional[date]:
+    parts = path.split('/')
+    try:
+        return date(int(parts[-4]), int(parts[-3]), int(parts[-2]))
+    except (IndexError, ValueError):
+        return None
+
+
+def encode_partition(insights: Iterable[Dict]) -> bytes:
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
+        for insight in insights:
+            line = json.dumps(insight, ensure_ascii=False, default=str, separators=(',', ':'))
+            gz.write(line.encode('utf-8') + b'\n')
+    return buffer.getvalue()
+
+
+def build_tombstone(insight: Dict, archive_uri: str) -> Dict:
+    """Keep just enough in Firestore to list the insight and find it in the archive"""
+    market_overview = insight.get('market_overview') or {}
+    recommendations = insight.get('recommendations') or []
+    return {
+        'archived': True,
+        'archive_uri': archive_uri,
+        'archived_at': datetime.utcnow().isoformat(),
+        'type': insight.get('type'),
+        'generated_at': insight.get('generated_at'),
+        'timestamp': insight.get('timestamp'),
+        'prompt_version': insight.get('prompt_version'),
+        'market_overview': {'sentiment': market_overview.get('sentiment')},
+        'recommendations': [],
+        'recommendation_symbols': [rec.get('symbol') for rec in recommendations if isinstance(rec, dict)],
+    }
+
+
+def archive_insights(fetch_insights_before: Callable[[str], Iterable[Dict]],
+                     replace_with_tombstones: Callable[[Dict[str, Dict]], None],
+                     backend, archive_after_days: int = DEFAULT_ARCHIVE_AFTER_DAYS,
+                     dry_run: bool = False) -> Dict:
+    """
+    Archive every insight generated more than `archive_after_days` ago.
+
+    Each day's insights go to one partition file per run; tombstones are only
+    written after the partition upload succeeded, so a failed run can simply be retried.
+    """
+    cutoff = (datetime.utcnow() - timedelta(days=archive_after_days)).isoformat()
+    run_id = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+
+    by_day: Dict[date, List[Dict]] = {}
+    skipped = 0
+    for insight in fetch_insights_before(cutoff):
+        day = _insight_date(insight)
+        if insight.get('archived') or day is None:
+            skipped += 1
+            continue
+        by_day.setdefault(day, []).append(insight)
+
+    partitions = []
+    archived = 0
+    for day in sorted(by_day):
+        insights = by_day[day]
+        path = partition_path(day, run_id)
+        if dry_run:
+            partitions.append({'path': backend.uri(path), 'insights': len(insights)})
+            continue
+        data = encode_partition(insights)
+        uri = backend.write(path, data)
+        replace_with_tombstones({insight['id']: build_tombstone(insight, uri) for insight in insights if insight.get('id')})
+        partitions.append({'path': uri, 'insights': len(insights), 'bytes': len(data)})
+        archived += len(insights)
+        logger.info(f"Archived {len(insights)} insights for {day} to {uri} ({len(data)} bytes)")
+
+    return {
+        'cutoff': cutoff,
+        'dry_run': dry_run,
+        'archived': archived,
+        'skipped': skipped,
+        'partitions': partitions,
+    }
+
+
+def iter_archived_insights(backend, start: Optional[date] = None, end: Optional[date] = None,
+                           insight_type: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Stream archived insights in date order, one line at a time, so years of
+    archives can be scanned without loading a partition into memory.
+    """
+    for path in backend.list(ARCHIVE_PREFIX):
+        day = _path_date(path)
+        if day is None or (start and day < start) or (end and day > end):
+            continue
+        with backend.open_read(path) as raw, gzip.GzipFile(fileobj=raw, mode='rb') as gz:
+            for line in gz:
+                if not line.strip():
+                    continue
+                insight = json.loads(line)
+                if insight_type and insight.get('type') != insight_type:
+                    continue
+                yield insight
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Recommendation Backtester for Investment Assistant
+Resolves every stored recommendation against cached price history with
+vectorized first-touch logic (target hit, stop hit or expired)
+"""
+
+import re
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from market_data import PriceHistory, normalize_symbol, parse_number
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HORIZON_DAYS = 30
+MAX_HORIZON_DAYS = 365
+
+# Outcome codes
+OUTCOME_NO_DATA = 0
+OUTCOME_TARGET = 1
+OUTCOME_STOP = 2
+OUTCOME_EXPIRED = 3
+OUTCOME_OPEN = 4
+OUTCOME_NAMES = {
+    OUTCOME_NO_DATA: 'no_data',
+    OUTCOME_TARGET: 'target_hit',
+    OUTCOME_STOP: 'stop_hit',
+    OUTCOME_EXPIRED: 'expired',
+    OUTCOME_OPEN: 'open',
+}
+
+GROUP_FIELDS = ('confidence', 'rec_type', 'sector')
+
+_TIMEFRAME_UNITS = [
+    (('year', 'שנה', 'שנים'), 365),
+    (('month', 'חודש'), 30),
+    (('week', 'שבוע'), 7),
+    (('day', 'יום', 'ימים'), 1),
+]
+
+
+def parse_timeframe_days(timeframe) -> int:
+    """
+    Convert a free-text timeframe ("1-2 weeks", "3-6 חודשים") to calendar days.
+    Uses the upper bound of a range; falls back to DEFAULT_HORIZON_DAYS.
+    """
+    text = str(timeframe or '').lower()
+    numbers = [float(n) for n in re.findall(r'\d+(?:\.\d+)?', text)]
+    for words, days in _TIMEFRAME_UNITS:
+        if any(word in text for word in words):
+            count = max(numbers) if numbers else 1
+            return int(min(count * days, MAX_HORIZON_DAYS))
+    return DEFAULT_HORIZON_DAYS
+
+
+def _direction(action) -> int:
+    action = str(action or '').strip().lower()
+    if action.startswith('sell') or action.startswith('למכור') or action.startswith('מכירה'):
+        return -1
+    return 1
+
+
+def _entry_date(insight: Dict) -> Optional[np.datetime64]:
+    for key in ('generated_at', 'timestamp'):
+        value = insight.get(key)
+        if not value:
+            continue
+        try:
+            if isinstance(value, datetime):
+                return np.datetime64(value.date(), 'D')
+            return np.datetime64(str(value)[:10], 'D')
+        except ValueError:
+            continue
+    return None
+
+
+class RecommendationSet:
+    """Column-oriented view of historical recommendations"""
+
+    __slots__ = ('symbols', 'entry_date', 'entry_price', 'target', 'stop', 'direction',
+                 'horizon_days', 'confidence', 'rec_type', 'sector', 'insight_ids')
+
+    def __init__(self, rows: List[Dict]):
+        self.symbols = np.array([r['symbol'] for r in rows], dtype=str)
+        self.entry_date = np.array([r['entry_date'] for r in rows], dtype='datetime64[D]')
+        self.entry_price = np.array([r['entry_price'] for r in rows], dtype=np.float64)
+        self.target = np.array([r['target'] for r in rows], dtype=np.float64)
+        self.stop = np.array([r['stop'] for r in rows], dtype=np.float64)
+        self.direction = np.array([r['direction'] for r in rows], dtype=np.int8)
+        self.horizon_days = np.array([r['horizon_days'] for r in rows], dtype=np.int64)
+        self.confidence = np.array([r['confidence'] for r in rows], dtype=object)
+        self.rec_type = np.array([r['rec_type'] for r in rows], dtype=object)
+        self.sector = np.array([r['sector'] for r in rows], dtype=object)
+        self.insight_ids = np.array([r['insight_id'] for r in rows], dtype=object)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+
+def load_recommendations(insights: Iterable[Dict]) -> RecommendationSet:
+    """Flatten stored daily insights into a RecommendationSet"""
+    rows = []
+    for insight in insights:
+        entry_date = _entry_date(insight)
+        if entry_date is None:
+            continue
+
+        sector_by_symbol = {}
+        for sector in insight.get('sector_analysis') or []:
+            for pick in sector.get('top_picks') or []:
+                sector_by_symbol.setdefault(normalize_symbol(pick), sector.get('sector') or 'Unknown')
+
+        for rec in insight.get('recommendations') or []:
+            symbol = normalize_symbol(rec.get('symbol'))
+            if not symbol:
+                continue
+            rows.append({
+                'symbol': symbol,
+                'entry_date': entry_date,
+                'entry_price': parse_number(rec.get('current_price')) or np.nan,
+                'target': parse_number(rec.get('target_price')) or np.nan,
+                'stop': parse_number(rec.get('stop_loss')) or np.nan,
+                'direction': _direction(rec.get('action')),
+                'horizon_days': parse_timeframe_days(rec.get('timeframe')),
+                'confidence': str(rec.get('confidence') or 'Unknown'),
+                'rec_type': str(rec.get('type') or 'Unknown'),
+                'sector': sector_by_symbol.get(symbol, 'Unknown'),
+                'insight_id': insight.get('id'),
+            })
+    return RecommendationSet(rows)
+
+
+class BacktestResult:
+    """Per-recommendation outcome arrays aligned with the input RecommendationSet"""
+
+    __slots__ = ('recs', 'outcome', 'exit_price', 'returns', 'days_held')
+
+    def __init__(self, recs, outcome, exit_price, returns, days_held):
+        self.recs = recs
+        self.outcome = outcome
+        self.exit_price = exit_price
+        self.returns = returns
+        self.days_held = days_held
+
+    def _stats(self, mask: np.ndarray) -> Dict:
+        outcome = self.outcome[mask]
+        closed = np.isin(outcome, (OUTCOME_TARGET, OUTCOME_STOP, OUTCOME_EXPIRED))
+        returns = self.returns[mask][closed]
+        stats = {
+            'count': int(mask.sum()),
+            'closed': int(closed.sum()),
+            **{name: int((outcome == code).sum()) for code, name in OUTCOME_NAMES.items()},
+        }
+        if closed.any():
+            stats.update({
+                'hit_rate': round(float((outcome == OUTCOME_TARGET).sum() / closed.sum()), 4),
+                'win_rate': round(float((returns > 0).mean()), 4),
+                'mean_return_pct': round(float(returns.mean() * 100), 2),
+                'median_return_pct': round(float(np.median(returns) * 100), 2),
+                'p10_return_pct': round(float(np.percentile(returns, 10) * 100), 2),
+                'p90_return_pct': round(float(np.percentile(returns, 90) * 100), 2),
+                'avg_days_held': round(float(self.days_held[mask][closed].mean()), 1),
+            })
+        return stats
+
+    def summary(self, group_by: Iterable[str] = GROUP_FIELDS) -> Dict:
+        """Overall stats plus stats for each value of every grouping field"""
+        summary = {'overall': self._stats(np.ones(len(self.recs), dtype=bool))}
+        for field in group_by:
+            values = getattr(self.recs, field)
+            summary[f'by_{field}'] = {
+                str(value): self._stats(values == value) for value in np.unique(values)
+            }
+        return summary
+
+
+def run_backtest(recs: RecommendationSet, history: PriceHistory) -> BacktestResult:
+    """
+    Resolve every recommendation in one vectorized pass.
+
+    Each recommendation is given a window of trading sessions from its entry
+    date to entry + horizon; the first session whose high/low touches the
+    target or stop decides the outcome. When both are touched in the same
+    session the stop is assumed to have been hit first.
+    """
+    n = len(recs)
+    outcome = np.full(n, OUTCOME_NO_DATA, dtype=np.int8)
+    exit_price = np.full(n, np.nan)
+    returns = np.full(n, np.nan)
+    days_held = np.zeros(n, dtype=np.int64)
+    if n == 0 or len(history.dates) == 0:
+        return BacktestResult(recs, outcome, exit_price, returns, days_held)
+
+    rows = history.rows_for(recs.symbols.tolist())
+    start = np.searchsorted(history.dates, recs.entry_date, side='left')
+    end = np.searchsorted(history.dates, recs.entry_date + recs.horizon_days, side='right')
+    usable = (rows >= 0) & (start < len(history.dates))
+    if not usable.any():
+        return BacktestResult(recs, outcome, exit_price, returns, days_held)
+
+    idx = np.flatnonzero(usable)
+    r, s, e = rows[idx], start[idx], end[idx]
+    width = int((e - s).max())
+    if width <= 0:
+        # Every window is empty (e.g. horizons ending before the next session), nothing to resolve
+        return BacktestResult(recs, outcome, exit_price, returns, days_held)
+    cols = s[:, None] + np.arange(width)[None, :]
+    in_window = cols < e[:, None]
+    cols = np.minimum(cols, len(history.dates) - 1)
+
+    high = history.high[r[:, None], cols]
+    low = history.low[r[:, None], cols]
+    close = history.close[r[:, None], cols]
+    in_window &= ~np.isnan(close)
+
+    entry = recs.entry_price[idx]
+    entry = np.where(np.isnan(entry), close[:, 0], entry)
+    target = recs.target[idx]
+    stop = recs.stop[idx]
+    direction = recs.direction[idx].astype(np.float64)
+    is_long = direction > 0
+
+    with np.errstate(invalid='ignore'):
+        target_touch = np.where(is_long[:, None], high >= target[:, None], low <= target[:, None])
+        stop_touch = np.where(is_long[:, None], low <= stop[:, None], high >= stop[:, None])
+    target_touch &= in_window
+    stop_touch &= in_window
+
+    never = width
+    first_target = np.where(target_touch.any(axis=1), target_touch.argmax(axis=1), never)
+    first_stop = np.where(stop_touch.any(axis=1), stop_touch.argmax(axis=1), never)
+
+    hit_stop = (first_stop <= first_target) & (first_stop < never)
+    hit_target = (first_target < first_stop)
+    window_complete = history.dates[-1] >= (recs.entry_date[idx] + recs.horizon_days[idx])
+    untouched = ~hit_stop & ~hit_target
+
+    last_valid = np.where(in_window.any(axis=1), width - 1 - in_window[:, ::-1].argmax(axis=1), 0)
+    last_close = close[np.arange(len(idx)), last_valid]
+
+    sub_outcome = np.select(
+        [hit_stop, hit_target, untouched & window_complete],
+        [OUTCOME_STOP, OUTCOME_TARGET, OUTCOME_EXPIRED],
+        default=OUTCOME_OPEN,
+    )
+    sub_exit = np.select([hit_stop, hit_target], [stop, target], default=last_close)
+    sub_days = np.select([hit_stop, hit_target], [first_stop, first_target], default=last_valid)
+
+    # Recommendations with no usable entry price stay as no_data
+    priced = ~np.isnan(entry) & in_window.any(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sub_returns = direction * (sub_exit / entry - 1.0)
+
+    outcome[idx] = np.where(priced, sub_outcome, OUTCOME_NO_DATA)
+    exit_price[idx] = np.where(priced, sub_exit, np.nan)
+    returns[idx] = np.where(priced, sub_returns, np.nan)
+    days_held[idx] = np.where(priced, sub_days, 0)
+
+    logger.info(f"Backtested {n} recommendations: {int(priced.sum())} priced, {n - int(priced.sum())} without data")
+    return BacktestResult(recs, outcome, exit_price, returns, days_held)
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+Batch Generation for Investment Assistant
+Daily insights for many investor profiles: provider batch JSONL files,
+bounded-concurrency ingestion with validation and bulk writes, and a
+streaming mode with a per-minute token rate limit
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from context import get_profile_prompt, PROMPT_VERSION
+from enum_codes import expand_insight_codes
+from llm_client import extract_json
+from models import Insight
+from token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INSIGHT_TYPE = 'profile_insight'
+BATCH_ENDPOINT = '/v1/chat/completions'
+# custom_id is "<batch day>|<profile id>" so ingest knows which day a result belongs to
+CUSTOM_ID_SEPARATOR = '|'
+
+# Provider limits per batch input file
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+DEFAULT_CONCURRENCY = 8
+BULK_WRITE_SIZE = 400
+MAX_REPORTED_ERRORS = 50
+
+
+def load_profiles(path: str) -> List[Dict]:
+    """Profiles from a JSON array or JSONL file; each needs a unique `id`"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        profiles = json.loads(text)
+    else:
+        profiles = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    seen = set()
+    for profile in profiles:
+        profile_id = str(profile.get('id') or '')
+        if not profile_id or profile_id in seen:
+            raise ValueError(f"Every profile needs a unique id (got {profile_id!r})")
+        seen.add(profile_id)
+    return profiles
+
+
+def build_messages(system_prompt: str, profile: Dict, date: str, market_facts: Optional[str] = None) -> List[Dict]:
+    return [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': get_profile_prompt(profile, date, market_facts)},
+    ]
+
+
+def batch_day(date: str) -> str:
+    """YYYY-MM-DD for a prompt date such as 'October 19, 2026'"""
+    return datetime.strptime(date, '%B %d, %Y').strftime('%Y-%m-%d')
+
+
+def build_custom_id(profile_id: str, day: str) -> str:
+    return f"{day}{CUSTOM_ID_SEPARATOR}{profile_id}"
+
+
+def split_custom_id(custom_id: str) -> Tuple[Optional[str], str]:
+    """(batch day, profile id); the day is None for ids written before it was carried"""
+    day, separator, profile_id = str(custom_id or '').partition(CUSTOM_ID_SEPARATOR)
+    if not separator:
+        return None, day
+    return day, profile_id
+
+
+def build_batch_requests(profiles: Iterable[Dict], system_prompt: str, route: Dict,
+                         date: str, market_facts: Optional[str] = None) -> Iterator[Dict]:
+    """One provider batch request line per profile, keyed by batch day and profile id"""
+    day = batch_day(date)
+    for profile in profiles:
+        yield {
+            'custom_id': build_custom_id(str(profile['id']), day),
+            'method': 'POST',
+            'url': BATCH_ENDPOINT,
+            'body': {
+                'model': route['model'],
+                'messages': build_messages(system_prompt, profile, date, market_facts),
+                'temperature': route.get('temperature', 0.7),
+                'max_tokens': route['max_tokens'],
+            },
+        }
+
+
+def write_batch_files(requests: Iterable[Dict], out_dir: str, prefix: str = 'batch') -> List[str]:
+    """Write request lines, starting a new file at the provider's request/size limits"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    f, lines, size = None, 0, 0
+    try:
+        for request in requests:
+            line = (json.dumps(request, ensure_ascii=False) + '\n').encode('utf-8')
+            if f is None or lines >= MAX_REQUESTS_PER_FILE or size + len(line) > MAX_BYTES_PER_FILE:
+                if f is not None:
+                    f.close()
+                paths.append(os.path.join(out_dir, f"{prefix}-{len(paths) + 1:03d}.jsonl"))
+                f, lines, size = open(paths[-1], 'wb'), 0, 0
+            f.write(line)
+            lines += 1
+            size += len(line)
+    finally:
+        if f is not None:
+            f.close()
+    logger.info(f"Wrote {len(paths)} batch request file(s) to {out_dir}")
+    return paths
+
+
+def finalize_profile_insight(data: Dict, profile_id: str, generated_at: Optional[str] = None) -> Dict:
+    """
+    Same expansion and validation as the daily insight, tagged with the profile.
+    The model-written `timestamp` is dropped: it is what the user's own feed
+    orders by, and generated_at is the authoritative time.
+    """
+    expand_insight_codes(data)
+    data.pop('timestamp', None)
+    data['source'] = 'investment_assistant_batch'
+    data['generated_at'] = generated_at or datetime.utcnow().isoformat()
+    data['type'] = PROFILE_INSIGHT_TYPE
+    data['profile_id'] = profile_id
+    data['prompt_version'] = PROMPT_VERSION
+    return Insight.from_dict(data, strict=True).to_firestore()
+
+
+def parse_result_line(line: str) -> Tuple[str, Dict]:
+    """(profile_id, validated insight) from one provider batch output line"""
+    record = json.loads(line)
+    day, profile_id = split_custom_id(record.get('custom_id'))
+    if record.get('error'):
+        raise ValueError(f"Provider error: {record['error']}")
+    response = record.get('response') or {}
+    if response.get('status_code') != 200:
+        raise ValueError(f"Provider status {response.get('status_code')}")
+    content = response['body']['choices'][0]['message']['content']
+    data, _ = extract_json(content)
+    # Stamped with the day the batch was prepared for, not the (possibly next) day it is ingested
+    generated_at = f"{day}T{datetime.utcnow().strftime('%H:%M:%S')}" if day else None
+    return profile_id, finalize_profile_insight(data, profile_id, generated_at)
+
+
+def _iter_lines(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def ingest_results(paths: Iterable[str], write_bulk: Callable[[List[Dict]], object],
+                   concurrency: int = DEFAULT_CONCURRENCY, bulk_size: int = BULK_WRITE_SIZE) -> Dict:
+    """
+    Parse and validate result lines on a bounded worker pool (at most
+    2 x concurrency lines in flight, so huge files are never held in memory)
+    and write valid insights in bulk.
+    """
+    report = {'ok': 0, 'failed': 0, 'errors': []}
+    pending_docs: List[Dict] = []
+    slots = threading.BoundedSemaphore(concurrency * 2)
+
+    def parse(line):
+        try:
+            return parse_result_line(line), None
+        except Exception as e:
+            return None, e
+        finally:
+            slots.release()
+
+    def collect(future):
+        parsed, error = future.result()
+        if error is not None:
+            report['failed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append(str(error)[:300])
+            return
+        report['ok'] += 1
+        pending_docs.append(parsed[1])
+        if len(pending_docs) >= bulk_size:
+            write_bulk(pending_docs[:])
+            pending_docs.clear()
+
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for line in _iter_lines(paths):
+            slots.acquire()
+            futures.append(executor.submit(parse, line))
+            while futures and futures[0].done():
+                collect(futures.pop(0))
+        for future in futures:
+            collect(future)
+    if pending_docs:
+        write_bulk(pending_docs)
+
+    logger.info(f"Batch ingest: {report['ok']} stored, {report['failed']} failed")
+    return report
+
+
+class TokenRateLimiter:
+    """
+    Token bucket refilled continuously at `tokens_per_minute`. Callers reserve
+    an estimate before a request and settle with the actual usage afterwards.
+    """
+
+    def __init__(self, tokens_per_minute: int, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.capacity = float(tokens_per_minute)
+        self.available = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.clock = clock
+        self.sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: int) -> None:
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                wait = (tokens - self.available) / self.rate
+            self.sleep(wait)
+
+    def settle(self, reserved: int, actual: int) -> None:
+        """Return unused tokens, or charge the overrun, once the real usage is known"""
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + reserved - actual)
+
+
+def run_streaming(profiles: List[Dict], complete: Callable[[List[Dict], Dict], Dict],
+                  write_bulk: Callable[[List[Dict]], object], system_prompt: str, route: Dict,
+                  date: str, tokens_per_minute: int, market_facts: Optional[str] = None,
+                  concurrency: int = DEFAULT_CONCURRENCY, bulk_size: int = BULK_WRITE_SIZE) -> Dict:
+    """
+    Generate profile insights with concurrent live calls instead of a provider
+    batch, keeping estimated prompt + completion tokens under the per-minute limit.
+    """
+    limiter = TokenRateLimiter(tokens_per_minute)
+    report = {'ok': 0, 'failed': 0, 'errors': [], 'tokens': 0}
+    pending_docs: List[Dict] = []
+    lock = threading.Lock()
+
+    def generate(profile):
+        messages = build_messages(system_prompt, profile, date, market_facts)
+        reserved = sum(count_tokens(m['content']) for m in messages) + route['max_tokens']
+        limiter.acquire(reserved)
+        try:
+            result = complete(messages, route)
+        except Exception:
+            limiter.settle(reserved, reserved)
+            raise
+        usage = result.get('usage') or {}
+        actual = usage.get('total_tokens') or reserved
+        limiter.settle(reserved, actual)
+        data, _ = extract_json(result['choices'][0]['message']['content'])
+        return finalize_profile_insight(data, str(profile['id'])), actual
+
+    def run(profile):
+        try:
+            doc, tokens = generate(profile)
+        except Exception as e:
+            with lock:
+                report['failed'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append(f"{profile.get('id')}: {str(e)[:300]}")
+            return
+        with lock:
+            report['ok'] += 1
+            report['tokens'] += tokens
+            pending_docs.append(doc)
+            batch = pending_docs[:] if len(pending_docs) >= bulk_size else None
+            if batch:
+                pending_docs.clear()
+        if batch:
+            write_bulk(batch)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, profiles))
+    if pending_docs:
+        write_bulk(pending_docs)
+
+    logger.info(f"Streaming batch: {report['ok']} stored, {report['failed']} failed, {report['tokens']} tokens")
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Batch insight generation for many investor profiles')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    prepare = sub.add_parser('prepare', help='Write provider batch JSONL request files')
+    prepare.add_argument('--profiles', required=True)
+    prepare.add_argument('--out', required=True)
+    prepare.add_argument('--date')
+
+    ingest = sub.add_parser('ingest', help='Validate batch result files and bulk-write them to Firestore')
+    ingest.add_argument('results', nargs='+')
+    ingest.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+
+    stream = sub.add_parser('stream', help='Generate with concurrent live calls under a token rate limit')
+    stream.add_argument('--profiles', required=True)
+    stream.add_argument('--date')
+    stream.add_argument('--tokens-per-minute', type=int, required=True)
+    stream.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+
+    shared = sub.add_parser('shared', help='Shared market context once, then a small overlay call per profile')
+    shared.add_argument('--profiles', required=True)
+    shared.add_argument('--date')
+    shared.add_argument('--tokens-per-minute', type=int, required=True)
+    shared.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+
+    args = parser.parse_args(argv)
+
+    # Imported lazily: main initializes Firestore and config at import time
+    from main import SYSTEM_PROMPT, config, get_llm_client
+    from firestore.client import store_insights_bulk
+    from firestore.schema import PROFILE_INSIGHTS_COLLECTION
+    from market_data import get_price_history
+    from model_router import load_policy, ROUTE_DAILY
+    from screener import get_market_facts
+
+    route = load_policy(config.get('MODEL_ROUTING_POLICY'))[ROUTE_DAILY]
+    date = getattr(args, 'date', None) or datetime.now().strftime('%B %d, %Y')
+
+    def write_bulk(documents):
+        return store_insights_bulk(documents, PROFILE_INSIGHTS_COLLECTION)
+
+    if args.command == 'ingest':
+        report = ingest_results(args.results, write_bulk, args.concurrency)
+    else:
+        profiles = load_profiles(args.profiles)
+        market_facts = get_market_facts(get_price_history(), config.get('SCREENER_TOP_K', 10))
+        if args.command == 'prepare':
+            paths = write_batch_files(build_batch_requests(profiles, SYSTEM_PROMPT, route, date, market_facts), args.out)
+            report = {'profiles': len(profiles), 'files': paths}
+        elif args.command == 'shared':
+            from main import get_model_router, get_shared_context_cache
+            from shared_context import run_shared_pipeline
+            report = run_shared_pipeline(profiles, get_model_router(), get_shared_context_cache(), write_bulk,
+                                         SYSTEM_PROMPT, batch_day(date), args.tokens_per_minute, date, market_facts,
+                                         args.concurrency)
+        else:
+            def complete(messages, route):
+                return get_llm_client().chat(messages, model=route['model'], temperature=route.get('temperature', 0.7),
+                                             max_tokens=route['max_tokens'], timeout=route.get('timeout', 30))
+            report = run_streaming(profiles, complete, write_bulk, SYSTEM_PROMPT, route, date,
+                                   args.tokens_per_minute, market_facts, args.concurrency)
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if not report.get('failed') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""
+Record/Replay Cassettes for Investment Assistant
+Captures outbound HTTP (OpenAI, Gmail), Secret Manager reads and Firestore
+client calls into a JSON cassette, and replays them offline with the original,
+scaled, fixed or no latency - for deterministic benchmarks and profiling of
+the generation pipeline without live services.
+"""
+
+import argparse
+import base64
+import hashlib
+import inspect
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import types
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+KIND_HTTP = 'http'
+KIND_SECRET = 'secret'
+KIND_FIRESTORE = 'firestore'
+
+# 'sequence' replays each (kind, target) in recorded order; 'strict' also requires identical request bodies
+MATCH_SEQUENCE = 'sequence'
+MATCH_STRICT = 'strict'
+
+LATENCY_ORIGINAL = 'original'
+LATENCY_NONE = 'none'
+
+FIRESTORE_MODULE = 'firestore.client'
+FIRESTORE_FUNCTIONS = (
+    'store_insight', 'store_insights_bulk', 'get_insights', 'get_latest_insight', 'stream_insights',
+    'get_insights_since', 'get_document', 'set_document', 'stream_insights_before', 'replace_insights',
+    'add_documents_bulk', 'stream_documents_since',
+)
+
+# google.cloud.firestore.Client calls that narrow a reference or query, and the calls that hit the server
+FIRESTORE_CHAIN_METHODS = (
+    'collection', 'document', 'where', 'order_by', 'limit', 'limit_to_last', 'offset', 'select',
+    'start_at', 'start_after', 'end_at', 'end_before',
+)
+FIRESTORE_TERMINAL_METHODS = ('stream', 'get', 'set', 'update', 'delete', 'add')
+# Chain steps whose first argument (a collection or field name) is part of the replay target
+FIRESTORE_NAMED_STEPS = ('collection', 'where', 'order_by')
+
+# Secret payload keys whose values are never written to a cassette
+SENSITIVE_KEY = re.compile(r'KEY|SECRET|TOKEN|PASSWORD|CREDENTIAL', re.IGNORECASE)
+REDACTED = 'REDACTED'
+
+
+class CassetteMiss(LookupError):
+    """Replay reached a call that is not (or no longer) in the cassette"""
+
+
+def _body_hash(body) -> str:
+    if body is None:
+        return ''
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha256(body).hexdigest()[:16]
+
+
+def _to_json(value):
+    """Round-trip through JSON so recorded values replay exactly as they were stored"""
+    return json.loads(json.dumps(value, default=str, ensure_ascii=False))
+
+
+def redact_secret(payload: str) -> str:
+    try:
+        data = json.loads(payload)
+    except (TypeError, ValueError):
+        return REDACTED
+    if not isinstance(data, dict):
+        return REDACTED
+    return json.dumps({k: (REDACTED if SENSITIVE_KEY.search(k) and v else v) for k, v in data.items()})
+
+
+def _snapshot_to_json(value):
+    if hasattr(value, 'to_dict') and hasattr(value, 'id'):
+        return {'id': value.id, 'exists': getattr(value, 'exists', True), 'data': value.to_dict()}
+    return value
+
+
+class RecordedSnapshot:
+    """Replayed stand-in for a Firestore DocumentSnapshot"""
+
+    def __init__(self, recorded: Dict):
+        self.id = recorded['id']
+        self.exists = recorded['exists']
+        self._data = recorded['data']
+
+    def to_dict(self) -> Optional[Dict]:
+        return json.loads(json.dumps(self._data)) if self.exists else None
+
+
+def _snapshot_from_json(value):
+    if isinstance(value, dict) and set(value) == {'id', 'exists', 'data'}:
+        return RecordedSnapshot(value)
+    return value
+
+
+class FirestoreRef:
+    """
+    A google.cloud.firestore reference or query under a cassette. Chained calls
+    (collection, where, order_by, ...) only extend the chain; terminal calls
+    (stream, get, set, ...) are recorded and replayed like the firestore.client
+    functions. In replay there is no real client behind it.
+    """
+
+    def __init__(self, cassette: 'Cassette', ref, chain: tuple = ()):
+        self._cassette = cassette
+        self._ref = ref
+        self._chain = chain
+
+    def __getattr__(self, attr):
+        if attr in FIRESTORE_CHAIN_METHODS:
+            def chained(*args, **kwargs):
+                ref = getattr(self._ref, attr)(*args, **kwargs) if self._ref is not None else None
+                return FirestoreRef(self._cassette, ref, self._chain + ((attr, args, kwargs),))
+            return chained
+        if attr in FIRESTORE_TERMINAL_METHODS:
+            return self._terminal(attr)
+        if self._ref is None:
+            raise CassetteMiss(f"Firestore client {attr} is not available in replay")
+        return getattr(self._ref, attr)
+
+    def _target(self, method: str) -> str:
+        steps = []
+        for name, args, _ in self._chain:
+            named = name in FIRESTORE_NAMED_STEPS and args and isinstance(args[0], str)
+            steps.append(f"{name}({args[0]})" if named else name)
+        return '.'.join(['Client'] + steps + [method])
+
+    def _terminal(self, method: str) -> Callable:
+        def original(chain, *args, **kwargs):
+            result = getattr(self._ref, method)(*args, **kwargs)
+            if isinstance(result, (list, tuple)) or inspect.isgenerator(result):
+                return [_snapshot_to_json(value) for value in result]
+            return _snapshot_to_json(result)
+
+        call = self._cassette._wrap_firestore(self._target(method), original if self._ref is not None else None)
+
+        def terminal(*args, **kwargs):
+            # The chain's values (ids, filter values) go into the request, so strict matching sees them
+            chain = [{'method': name, 'args': list(args), 'kwargs': kwargs} for name, args, kwargs in self._chain]
+            result = call(chain, *args, **kwargs)
+            if isinstance(result, list):
+                snapshots = [_snapshot_from_json(value) for value in result]
+                return iter(snapshots) if method == 'stream' else snapshots
+            return _snapshot_from_json(result)
+
+        return terminal
+
+
+class Cassette:
+    """
+    One recording session. Use as a context manager, or install()/uninstall();
+    record mode writes the cassette file on uninstall.
+    """
+
+    def __init__(self, path: str, mode: str = MODE_REPLAY, latency=LATENCY_ORIGINAL,
+                 latency_scale: float = 1.0, match: str = MATCH_SEQUENCE, redact: bool = True,
+                 sleep: Callable[[float], None] = time.sleep):
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.match = match
+        self.redact = redact
+        self.sleep = sleep
+        self.interactions: List[Dict] = []
+        self.replayed = 0
+        self._queues: Dict[tuple, deque] = {}
+        self._lock = threading.Lock()
+        self._undo: List[Callable[[], None]] = []
+        if mode == MODE_REPLAY:
+            self.load()
+
+    # --- storage ----------------------------------------------------------
+
+    def load(self) -> None:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version: {data.get('version')}")
+        self.interactions = data['interactions']
+        self.rewind()
+
+    def rewind(self) -> None:
+        """Start replaying from the first interaction again (for repeated benchmark runs)"""
+        self._queues = {}
+        for interaction in self.interactions:
+            self._queues.setdefault(self._match_key(interaction), deque()).append(interaction)
+        self.replayed = 0
+
+    def save(self) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CASSETTE_VERSION, 'interactions': self.interactions}, f, ensure_ascii=False, indent=1)
+        logger.info(f"Recorded {len(self.interactions)} interactions to {self.path}")
+
+    def _match_key(self, interaction: Dict) -> tuple:
+        key = (interaction['kind'], interaction['target'])
+        return key + (interaction.get('body_hash', ''),) if self.match == MATCH_STRICT else key
+
+    # --- record / replay core ----------------------------------------------
+
+    def _record(self, kind: str, target: str, request: Dict, response, elapsed: float,
+                error: Optional[str] = None, body_hash: str = '', generator: bool = False) -> None:
+        with self._lock:
+            self.interactions.append({
+                'kind': kind,
+                'target': target,
+                'body_hash': body_hash,
+                'request': request,
+                'response': response,
+                'error': error,
+                'elapsed': round(elapsed, 4),
+                'generator': generator,
+            })
+
+    def _next(self, kind: str, target: str, body_hash: str = '') -> Dict:
+        key = (kind, target) + ((body_hash,) if self.match == MATCH_STRICT else ())
+        with self._lock:
+            queue = self._queues.get(key)
+            if not queue:
+                raise CassetteMiss(f"No recorded {kind} interaction left for {target}")
+            self.replayed += 1
+            interaction = queue.popleft()
+        self._wait(interaction.get('elapsed') or 0.0)
+        return interaction
+
+    def _wait(self, recorded: float) -> None:
+        if self.latency == LATENCY_NONE:
+            return
+        seconds = recorded * self.latency_scale if self.latency == LATENCY_ORIGINAL else float(self.latency)
+        if seconds > 0:
+            self.sleep(seconds)
+
+    def _patch(self, owner, attr: str, replacement) -> None:
+        original = getattr(owner, attr)
+        setattr(owner, attr, replacement)
+        self._undo.append(lambda: setattr(owner, attr, original))
+
+    # --- HTTP (requests) ----------------------------------------------------
+
+    def _install_http(self) -> None:
+        original_send = requests.Session.send
+        cassette = self
+
+        def send(session, prepared, **kwargs):
+            target = f"{prepared.method} {prepared.url.split('?')[0]}"
+            body_hash = _body_hash(prepared.body)
+            if cassette.mode == MODE_REPLAY:
+                interaction = cassette._next(KIND_HTTP, target, body_hash)
+                if interaction['error']:
+                    raise requests.ConnectionError(interaction['error'])
+                return cassette._build_response(prepared, interaction['response'])
+
+            started = time.monotonic()
+            body = prepared.body.decode('utf-8', 'replace') if isinstance(prepared.body, bytes) else prepared.body
+            # Request headers are never stored: they carry API keys and OAuth tokens
+            request_record = {'method': prepared.method, 'url': prepared.url, 'body': body}
+            try:
+                response = original_send(session, prepared, **kwargs)
+            except Exception as e:
+                cassette._record(KIND_HTTP, target, request_record, None, time.monotonic() - started, str(e), body_hash)
+                raise
+            cassette._record(KIND_HTTP, target, request_record, {
+                'status_code': response.status_code,
+                'reason': response.reason,
+                'headers': {k: v for k, v in response.headers.items() if k.lower() == 'content-type'},
+                'content': base64.b64encode(response.content).decode('ascii'),
+            }, time.monotonic() - started, body_hash=body_hash)
+            return response
+
+        self._patch(requests.Session, 'send', send)
+
+    @staticmethod
+    def _build_response(prepared, recorded: Dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = recorded['status_code']
+        response.reason = recorded.get('reason')
+        response.headers = CaseInsensitiveDict(recorded.get('headers') or {})
+        response._content = base64.b64decode(recorded['content'])
+        # Mark the body as read so iter_lines()/iter_content() replay it (streamed completions)
+        response._content_consumed = True
+        response.encoding = 'utf-8'
+        response.url = prepared.url
+        response.request = prepared
+        return response
+
+    # --- Secret Manager -------------------------------------------------------
+
+    def _install_secrets(self) -> None:
+        try:
+            from google.cloud import secretmanager
+        except ImportError:
+            logger.warning("google-cloud-secret-manager not installed - secrets are not captured")
+            return
+        cassette = self
+        real_client = secretmanager.SecretManagerServiceClient
+
+        class CassetteSecretClient:
+            def __init__(self, *args, **kwargs):
+                self._client = real_client(*args, **kwargs) if cassette.mode == MODE_RECORD else None
+
+            def access_secret_version(self, request=None, name=None, **kwargs):
+                secret_name = name or (request or {}).get('name', '')
+                if cassette.mode == MODE_REPLAY:
+                    interaction = cassette._next(KIND_SECRET, secret_name)
+                    if interaction['error']:
+                        raise RuntimeError(interaction['error'])
+                    data = interaction['response'].encode('utf-8')
+                    return types.SimpleNamespace(payload=types.SimpleNamespace(data=data))
+
+                started = time.monotonic()
+                try:
+                    response = self._client.access_secret_version(request=request, name=name, **kwargs)
+                except Exception as e:
+                    cassette._record(KIND_SECRET, secret_name, {'name': secret_name}, None, time.monotonic() - started, str(e))
+                    raise
+                payload = response.payload.data.decode('UTF-8')
+                cassette._record(KIND_SECRET, secret_name, {'name': secret_name},
+                                 redact_secret(payload) if cassette.redact else payload, time.monotonic() - started)
+                return response
+
+            def __getattr__(self, attr):
+                if self._client is None:
+                    raise CassetteMiss(f"Secret Manager {attr} is not available in replay")
+                return getattr(self._client, attr)
+
+        self._patch(secretmanager, 'SecretManagerServiceClient', CassetteSecretClient)
+
+    # --- Firestore client functions -------------------------------------------
+
+    def _wrap_firestore(self, name: str, original: Optional[Callable]) -> Callable:
+        cassette = self
+        is_generator = original is not None and inspect.isgeneratorfunction(original)
+
+        def call(*args, **kwargs):
+            request = _to_json({'args': args, 'kwargs': kwargs})
+            body_hash = _body_hash(json.dumps(request, sort_keys=True))
+            if cassette.mode == MODE_REPLAY:
+                interaction = cassette._next(KIND_FIRESTORE, name, body_hash)
+                if interaction['error']:
+                    raise RuntimeError(interaction['error'])
+                result = interaction['response']
+                return iter(result) if interaction.get('generator') else result
+
+            started = time.monotonic()
+            try:
+                result = original(*args, **kwargs)
+                if is_generator:
+                    result = list(result)
+            except Exception as e:
+                cassette._record(KIND_FIRESTORE, name, request, None, time.monotonic() - started, str(e), body_hash)
+                raise
+            cassette._record(KIND_FIRESTORE, name, request, _to_json(result), time.monotonic() - started,
+                             body_hash=body_hash, generator=is_generator)
+            return iter(result) if is_generator else result
+
+        call.__name__ = name
+        return call
+
+    def _install_firestore(self) -> None:
+        module = sys.modules.get(FIRESTORE_MODULE)
+        if module is None and self.mode == MODE_RECORD:
+            import firestore.client as module
+        if module is None:
+            # Offline replay: nothing may connect to Firestore, so the client module is never imported
+            module = types.ModuleType(FIRESTORE_MODULE)
+            # Collection names and id helpers come from the Firebase-free schema module
+            from firestore import schema
+            for name in dir(schema):
+                if not name.startswith('_'):
+                    setattr(module, name, getattr(schema, name))
+            for name in FIRESTORE_FUNCTIONS:
+                setattr(module, name, None)
+            sys.modules[FIRESTORE_MODULE] = module
+            self._undo.append(lambda: sys.modules.pop(FIRESTORE_MODULE, None))
+
+        for name in FIRESTORE_FUNCTIONS:
+            original = getattr(module, name, None)
+            wrapped = self._wrap_firestore(name, original)
+            # Modules that did `from firestore.client import ...` hold their own reference
+            for other in list(sys.modules.values()):
+                if other is not module and original is not None and getattr(other, name, None) is original:
+                    self._patch(other, name, wrapped)
+            self._patch(module, name, wrapped)
+
+    def _install_firestore_client(self) -> None:
+        """Services that build their own google.cloud.firestore.Client (EmailService) go through FirestoreRef"""
+        try:
+            from google.cloud import firestore as cloud_firestore
+        except ImportError:
+            logger.warning("google-cloud-firestore not installed - Firestore client queries are not captured")
+            return
+        cassette = self
+        real_client = cloud_firestore.Client
+
+        class CassetteFirestoreClient(FirestoreRef):
+            def __init__(self, *args, **kwargs):
+                # Replay never constructs a real client, so no credentials or network are needed
+                client = real_client(*args, **kwargs) if cassette.mode == MODE_RECORD else None
+                super().__init__(cassette, client)
+
+        self._patch(cloud_firestore, 'Client', CassetteFirestoreClient)
+
+    # --- lifecycle --------------------------------------------------------------
+
+    def install(self) -> 'Cassette':
+        self._install_http()
+        self._install_secrets()
+        self._install_firestore()
+        self._install_firestore_client()
+        logger.info(f"Cassette {self.path} installed in {self.mode} mode")
+        return self
+
+    def uninstall(self) -> None:
+        while self._undo:
+            self._undo.pop()()
+        if self.mode == MODE_RECORD:
+            self.save()
+
+    def __enter__(self) -> 'Cassette':
+        return self.install()
+
+    def __exit__(self, *exc) -> None:
+        self.uninstall()
+
+
+def _parse_latency(value: str):
+    return value if value in (LATENCY_ORIGINAL, LATENCY_NONE) else float(value)
+
+
+def run_paths(paths: List[str], method: str = 'GET') -> List[Dict]:
+    """Call app endpoints in-process; main is imported here so the cassette is installed first"""
+    import main
+    # A hedged duplicate request would consume the next call's recording
+    main.get_llm_client().hedge_enabled = False
+    client = main.app.test_client()
+    results = []
+    for path in paths:
+        started = time.perf_counter()
+        response = client.open(path, method=method)
+        results.append({'path': path, 'status': response.status_code, 'seconds': round(time.perf_counter() - started, 4)})
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Record or replay the generation pipeline against a cassette')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    record = sub.add_parser('record', help='Call endpoints against live services and record every exchange')
+    record.add_argument('cassette')
+    record.add_argument('paths', nargs='+')
+    record.add_argument('--method', default='GET')
+    record.add_argument('--no-redact', action='store_true')
+
+    replay = sub.add_parser('replay', help='Call endpoints offline from a cassette and report timings')
+    replay.add_argument('cassette')
+    replay.add_argument('paths', nargs='+')
+    replay.add_argument('--method', default='GET')
+    replay.add_argument('--latency', default=LATENCY_ORIGINAL, help="'original', 'none' or fixed seconds per call")
+    replay.add_argument('--latency-scale', type=float, default=1.0)
+    replay.add_argument('--match', choices=[MATCH_SEQUENCE, MATCH_STRICT], default=MATCH_SEQUENCE)
+    replay.add_argument('--repeat', type=int, default=1)
+    replay.add_argument('--budget-seconds', type=float, help='Fail if the median run is slower than this')
+    replay.add_argument('--profile', help='Write cProfile stats of all runs to this file')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        with Cassette(args.cassette, MODE_RECORD, redact=not args.no_redact):
+            results = run_paths(args.paths, args.method)
+        print(json.dumps({'runs': [results]}, indent=2))
+        return 0 if all(r['status'] < 400 for r in results) else 1
+
+    cassette = Cassette(args.cassette, MODE_REPLAY, _parse_latency(args.latency), args.latency_scale, args.match)
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+    runs = []
+    with cassette:
+        for _ in range(args.repeat):
+            cassette.rewind()
+            if profiler:
+                profiler.enable()
+            runs.append(run_paths(args.paths, args.method))
+            if profiler:
+                profiler.disable()
+    if profiler:
+        profiler.dump_stats(args.profile)
+
+    totals = sorted(sum(r['seconds'] for r in run) for run in runs)
+    median = totals[len(totals) // 2]
+    report = {'runs': runs, 'median_seconds': round(median, 4), 'replayed_per_run': cassette.replayed}
+    print(json.dumps(report, indent=2))
+    failed = any(r['status'] >= 400 for run in runs for r in run)
+    if args.budget_seconds is not None and median > args.budget_seconds:
+        logger.error(f"Median replay {median:.3f}s exceeds budget {args.budget_seconds}s")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    from logging_setup import configure_logging
+    configure_logging('INFO', 'text')
+    sys.exit(main())
@@ -67,6 +67,14 @@ class ConfigService:
             # Application Configuration
             'FLASK_ENV': config_secret.get('FLASK_ENV') if config_secret else os.getenv('FLASK_ENV', 'production'),
             'LOG_LEVEL': config_secret.get('LOG_LEVEL') if config_secret else os.getenv('LOG_LEVEL', 'INFO'),
+            'LOG_FORMAT': config_secret.get('LOG_FORMAT', 'json') if config_secret else os.getenv('LOG_FORMAT', 'json'),
+            'LOG_PAYLOAD_MAX_CHARS': int(config_secret.get('LOG_PAYLOAD_MAX_CHARS', '500')) if config_secret else int(os.getenv('LOG_PAYLOAD_MAX_CHARS', '500')),
+            'LOG_PAYLOAD_SAMPLE_RATE': float(config_secret.get('LOG_PAYLOAD_SAMPLE_RATE', '1.0')) if config_secret else float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '1.0')),
+            'PROFILING_SECRET': config_secret.get('PROFILING_SECRET') if config_secret else os.getenv('PROFILING_SECRET'),
+            'PROFILING_SAMPLE_RATE': float(config_secret.get('PROFILING_SAMPLE_RATE', '0')) if config_secret else float(os.getenv('PROFILING_SAMPLE_RATE', '0')),
+            'PROFILING_MODE': config_secret.get('PROFILING_MODE', 'cprofile') if config_secret else os.getenv('PROFILING_MODE', 'cprofile'),
+            'PROFILING_DIR': config_secret.get('PROFILING_DIR', 'data/profiles') if config_secret else os.getenv('PROFILING_DIR', 'data/profiles'),
+            'PROFILING_MAX_PROFILES': int(config_secret.get('PROFILING_MAX_PROFILES', '50')) if config_secret else int(os.getenv('PROFILING_MAX_PROFILES', '50')),
             'TIMEZONE': config_secret.get('TIMEZONE') if config_secret else os.getenv('TIMEZONE', 'Asia/Jerusalem'),
             
             # Investment Configuration
@@ -79,14 +87,52 @@ class ConfigService:
             'MARKET_DATA_PROVIDER': config_secret.get('MARKET_DATA_PROVIDER') if config_secret else os.getenv('MARKET_DATA_PROVIDER', 'yfinance'),
             'UPDATE_FREQUENCY': config_secret.get('UPDATE_FREQUENCY') if config_secret else os.getenv('UPDATE_FREQUENCY', 'daily'),
             'SCHEDULE_TIME': config_secret.get('SCHEDULE_TIME') if config_secret else os.getenv('SCHEDULE_TIME', '08:30'),
+            'MIDDAY_SCHEDULE_TIME': config_secret.get('MIDDAY_SCHEDULE_TIME', '13:00') if config_secret else os.getenv('MIDDAY_SCHEDULE_TIME', '13:00'),
+            'END_OF_DAY_SCHEDULE_TIME': config_secret.get('END_OF_DAY_SCHEDULE_TIME', '17:00') if config_secret else os.getenv('END_OF_DAY_SCHEDULE_TIME', '17:00'),
+            'SCHEDULER_MODE': config_secret.get('SCHEDULER_MODE', 'external') if config_secret else os.getenv('SCHEDULER_MODE', 'external'),
+            'SCHEDULER_MISFIRE_GRACE_SECONDS': int(config_secret.get('SCHEDULER_MISFIRE_GRACE_SECONDS', '900')) if config_secret else int(os.getenv('SCHEDULER_MISFIRE_GRACE_SECONDS', '900')),
+            'MARKET_DATA_CACHE': config_secret.get('MARKET_DATA_CACHE') if config_secret else os.getenv('MARKET_DATA_CACHE'),
+            'SCREENER_TOP_K': int(config_secret.get('SCREENER_TOP_K', '10')) if config_secret else int(os.getenv('SCREENER_TOP_K', '10')),
+            'TRIGGER_PROVIDER': config_secret.get('TRIGGER_PROVIDER', 'price_history') if config_secret else os.getenv('TRIGGER_PROVIDER', 'price_history'),
+            'TRIGGER_REPLAY_FILE': config_secret.get('TRIGGER_REPLAY_FILE') if config_secret else os.getenv('TRIGGER_REPLAY_FILE'),
+            'TRIGGER_STOP_PROXIMITY_PCT': float(config_secret.get('TRIGGER_STOP_PROXIMITY_PCT', '1.0')) if config_secret else float(os.getenv('TRIGGER_STOP_PROXIMITY_PCT', '1.0')),
+            'TRIGGER_VOLUME_SPIKE_RATIO': float(config_secret.get('TRIGGER_VOLUME_SPIKE_RATIO', '3.0')) if config_secret else float(os.getenv('TRIGGER_VOLUME_SPIKE_RATIO', '3.0')),
+            'TRIGGER_DEBOUNCE_SECONDS': int(config_secret.get('TRIGGER_DEBOUNCE_SECONDS', '1800')) if config_secret else int(os.getenv('TRIGGER_DEBOUNCE_SECONDS', '1800')),
+            'TRIGGER_MAX_UPDATES_PER_HOUR': int(config_secret.get('TRIGGER_MAX_UPDATES_PER_HOUR', '2')) if config_secret else int(os.getenv('TRIGGER_MAX_UPDATES_PER_HOUR', '2')),
+            'TRIGGER_HYSTERESIS_PCT': float(config_secret.get('TRIGGER_HYSTERESIS_PCT', '0.5')) if config_secret else float(os.getenv('TRIGGER_HYSTERESIS_PCT', '0.5')),
+            'NOVELTY_WINDOW_DAYS': int(config_secret.get('NOVELTY_WINDOW_DAYS', '14')) if config_secret else int(os.getenv('NOVELTY_WINDOW_DAYS', '14')),
+            
+            # Insight Storage Configuration
+            'STORAGE_DEDUPE_TEXT': config_secret.get('STORAGE_DEDUPE_TEXT', 'false') if config_secret else os.getenv('STORAGE_DEDUPE_TEXT', 'false'),
+            'STORAGE_COMPRESS_FIELDS': config_secret.get('STORAGE_COMPRESS_FIELDS', '') if config_secret else os.getenv('STORAGE_COMPRESS_FIELDS', ''),
+            'STORAGE_SIZE_BUDGET': int(config_secret.get('STORAGE_SIZE_BUDGET', '65536')) if config_secret else int(os.getenv('STORAGE_SIZE_BUDGET', '65536')),
+            'SEARCH_INDEX_DIR': config_secret.get('SEARCH_INDEX_DIR', 'data/search_index') if config_secret else os.getenv('SEARCH_INDEX_DIR', 'data/search_index'),
+            
+            # Archive Configuration
+            'ARCHIVE_BUCKET': config_secret.get('ARCHIVE_BUCKET') if config_secret else os.getenv('ARCHIVE_BUCKET'),
+            'ARCHIVE_LOCAL_DIR': config_secret.get('ARCHIVE_LOCAL_DIR', 'data/archive') if config_secret else os.getenv('ARCHIVE_LOCAL_DIR', 'data/archive'),
+            'ARCHIVE_AFTER_DAYS': int(config_secret.get('ARCHIVE_AFTER_DAYS', '30')) if config_secret else int(os.getenv('ARCHIVE_AFTER_DAYS', '30')),
             
             # Email Configuration for Afternoon Updates
             'AFTERNOON_UPDATE_1PM': config_secret.get('AFTERNOON_UPDATE_1PM', 'true') if config_secret else os.getenv('AFTERNOON_UPDATE_1PM', 'true'),
             'AFTERNOON_UPDATE_5PM': config_secret.get('AFTERNOON_UPDATE_5PM', 'true') if config_secret else os.getenv('AFTERNOON_UPDATE_5PM', 'true'),
             'EMAIL_SIGNIFICANT_CHANGES_ONLY': config_secret.get('EMAIL_SIGNIFICANT_CHANGES_ONLY', 'true') if config_secret else os.getenv('EMAIL_SIGNIFICANT_CHANGES_ONLY', 'true'),
+            'AFTERNOON_PRECHECK': config_secret.get('AFTERNOON_PRECHECK', 'true') if config_secret else os.getenv('AFTERNOON_PRECHECK', 'true'),
             
             # OpenAI Configuration
             'OPENAI_API_KEY': config_secret.get('OPENAI_API_KEY') if config_secret else os.getenv('OPENAI_API_KEY'),
+            'MODEL_ROUTING_POLICY': config_secret.get('MODEL_ROUTING_POLICY') if config_secret else os.getenv('MODEL_ROUTING_POLICY'),
+            'PROMPT_EXPERIMENTS': config_secret.get('PROMPT_EXPERIMENTS') if config_secret else os.getenv('PROMPT_EXPERIMENTS'),
+            'PROMPT_EXPERIMENT_SALT': config_secret.get('PROMPT_EXPERIMENT_SALT', '') if config_secret else os.getenv('PROMPT_EXPERIMENT_SALT', ''),
+            'AFTERNOON_FIRST_PASS': config_secret.get('AFTERNOON_FIRST_PASS', 'true') if config_secret else os.getenv('AFTERNOON_FIRST_PASS', 'true'),
+            'LLM_HEDGE_ENABLED': config_secret.get('LLM_HEDGE_ENABLED', 'true') if config_secret else os.getenv('LLM_HEDGE_ENABLED', 'true'),
+            'LLM_HEDGE_DELAY_SECONDS': float(config_secret.get('LLM_HEDGE_DELAY_SECONDS', '12')) if config_secret else float(os.getenv('LLM_HEDGE_DELAY_SECONDS', '12')),
+            'LLM_BREAKER_FAILURES': int(config_secret.get('LLM_BREAKER_FAILURES', '3')) if config_secret else int(os.getenv('LLM_BREAKER_FAILURES', '3')),
+            'LLM_BREAKER_RESET_SECONDS': int(config_secret.get('LLM_BREAKER_RESET_SECONDS', '60')) if config_secret else int(os.getenv('LLM_BREAKER_RESET_SECONDS', '60')),
+            'USAGE_LEDGER_SINK': config_secret.get('USAGE_LEDGER_SINK', 'firestore') if config_secret else os.getenv('USAGE_LEDGER_SINK', 'firestore'),
+            'USAGE_LEDGER_LOCAL_DIR': config_secret.get('USAGE_LEDGER_LOCAL_DIR', 'data/usage') if config_secret else os.getenv('USAGE_LEDGER_LOCAL_DIR', 'data/usage'),
+            'USAGE_LEDGER_FLUSH_SIZE': int(config_secret.get('USAGE_LEDGER_FLUSH_SIZE', '50')) if config_secret else int(os.getenv('USAGE_LEDGER_FLUSH_SIZE', '50')),
+            'USAGE_LEDGER_FLUSH_SECONDS': float(config_secret.get('USAGE_LEDGER_FLUSH_SECONDS', '60')) if config_secret else float(os.getenv('USAGE_LEDGER_FLUSH_SECONDS', '60')),
             
             # Development Configuration
             'DEBUG': config_secret.get('DEBUG', 'false') if config_secret else os.getenv('DEBUG', 'false'),
@@ -94,7 +140,7 @@ class ConfigService:
         }
         
         # Convert string booleans to actual booleans
-        for key in ['AFTERNOON_UPDATE_1PM', 'AFTERNOON_UPDATE_5PM', 'EMAIL_SIGNIFICANT_CHANGES_ONLY', 'DEBUG', 'LOCAL_TESTING']:
+        for key in ['AFTERNOON_UPDATE_1PM', 'AFTERNOON_UPDATE_5PM', 'EMAIL_SIGNIFICANT_CHANGES_ONLY', 'AFTERNOON_PRECHECK', 'STORAGE_DEDUPE_TEXT', 'LLM_HEDGE_ENABLED', 'AFTERNOON_FIRST_PASS', 'DEBUG', 'LOCAL_TESTING']:
             if isinstance(config[key], str):
                 config[key] = config[key].lower() == 'true'
         
@@ -6,22 +6,59 @@ This file generates more visual, actionable, and user-friendly investment insigh
 
 from datetime import datetime
 
-def get_investor_profile():
+# The investor the daily insight is written for; batch runs pass their own profiles
+DEFAULT_INVESTOR_PROFILE = {
+    'initial_investment': 30000,
+    'monthly_investment': 2000,
+    'currency': 'ILS',
+    'platform': 'Kablani Trade (Phoenix)',
+    'strategy': 'Aggressive growth with calculated risk',
+    'risk_level': 'HIGH',
+    'risk_note': 'backed by pension funds and other conservative investments',
+    'goal': 'Beat the market significantly, not just match it',
+}
+
+def get_investor_profile(profile=None):
+    profile = {**DEFAULT_INVESTOR_PROFILE, **(profile or {})}
+    risk = profile['risk_level']
+    if profile.get('risk_note'):
+        risk = f"{risk} ({profile['risk_note']})"
     return (
         "INVESTOR PROFILE:\n"
-        "- Initial capital: 30,000 ILS\n"
-        "- Monthly investment: 2,000 ILS\n"
-        "- Platform: Kablani Trade (Phoenix)\n"
-        "- Strategy: Aggressive growth with calculated risk\n"
-        "- Risk tolerance: HIGH (backed by pension funds and other conservative investments)\n"
-        "- Goal: Beat the market significantly, not just match it\n"
+        f"- Initial capital: {profile['initial_investment']:,} {profile['currency']}\n"
+        f"- Monthly investment: {profile['monthly_investment']:,} {profile['currency']}\n"
+        f"- Platform: {profile['platform']}\n"
+        f"- Strategy: {profile['strategy']}\n"
+        f"- Risk tolerance: {risk}\n"
+        f"- Goal: {profile['goal']}\n"
     )
 
-def get_portfolio_strategy():
+# Target allocation in percent; also drives the Monte Carlo simulator
+PORTFOLIO_ALLOCATION = {
+    'long_term': {'sp500': 25, 'qqq': 25, 'growth_stocks': 20},
+    'short_term': {'momentum_stocks': 15, 'leveraged_etfs': 10, 'crypto': 5},
+}
+
+ALLOCATION_LABELS = {
+    'sp500': 'S&P 500',
+    'qqq': 'QQQ',
+    'growth_stocks': 'growth stocks',
+    'momentum_stocks': 'momentum stocks',
+    'leveraged_etfs': 'leveraged ETFs',
+    'crypto': 'crypto',
+}
+
+def _format_sleeve(allocation, sleeve):
+    return ", ".join(f"{ALLOCATION_LABELS.get(k, k)} ({v}%)" for k, v in allocation[sleeve].items())
+
+def get_portfolio_strategy(allocation=None):
+    allocation = allocation or PORTFOLIO_ALLOCATION
+    long_total = sum(allocation['long_term'].values())
+    short_total = sum(allocation['short_term'].values())
     return (
         "PORTFOLIO STRATEGY:\n"
-        "- 70% long-term: S&P 500 (25%), QQQ (25%), growth stocks (20%)\n"
-        "- 30% short-term: momentum stocks (15%), leveraged ETFs (10%), crypto (5%)\n"
+        f"- {long_total}% long-term: {_format_sleeve(allocation, 'long_term')}\n"
+        f"- {short_total}% short-term: {_format_sleeve(allocation, 'short_term')}\n"
         "- Focus on market-beating opportunities, not generic recommendations\n"
     )
 
@@ -36,21 +73,17 @@ def get_investment_philosophy():
         "- Always provide specific amounts and allocation percentages\n"
     )
 
-def get_full_context():
+def get_full_context(profile=None):
     return (
         "You are a professional investment advisor for an Israeli investor with the following profile:\n\n"
-        + get_investor_profile() + "\n"
-        + get_portfolio_strategy() + "\n"
+        + get_investor_profile(profile) + "\n"
+        + get_portfolio_strategy((profile or {}).get('allocation')) + "\n"
         + get_investment_philosophy()
     )
 
-def get_prompt(date=None):
-    if date is None:
-        date = datetime.now().strftime('%B %d, %Y')
-    context = get_full_context()
-    return f"""{context}
-
-SPECIAL INSTRUCTIONS FOR GPT:
+def get_instructions_segment():
+    """Behavioural instructions for the model"""
+    return """SPECIAL INSTRUCTIONS FOR GPT:
 You are NOT a generic investment advisor. You are a high-performance, high-risk-tolerant investment intelligence engine built to find RARE, EXPLOSIVE market opportunities — before they become mainstream.
 
 - You must use ALL available tools (e.g., volume spikes, dark pool data, option sweeps, momentum scans, pre-market gaps, insider trades) to detect micro caps, lesser-known stocks, or leveraged instruments that may rise FAST.
@@ -62,8 +95,11 @@ You are NOT a generic investment advisor. You are a high-performance, high-risk-
 - Avoid lazy, repeated suggestions (e.g., “Buy QQQ” without a new trigger).
 - Use volume/price breakouts, short squeeze setups, sector rotation, or contrarian indicators to support ideas.
 - Always think: What would a hedge fund do BEFORE retail investors notice?
+"""
 
-Generate a comprehensive daily investment insight for {date} with the following ENHANCED structure:
+def get_structure_segment():
+    """Sections the insight must cover"""
+    return """Generate a comprehensive daily investment insight for the date given in TODAY'S INPUT below, with the following ENHANCED structure:
 
 1. MARKET OVERVIEW (Market Review):
 - What happened yesterday and what to expect today
@@ -105,84 +141,94 @@ For each position provide:
 - Friendly and simple explanation
 - What you need to do now
 
-Return the result as a valid JSON with the following ENHANCED structure:
-{{
+"""
+
+def get_schema_segment():
+    """JSON output schema"""
+    return """Return the result as a valid JSON with the following ENHANCED structure:
+{
     "timestamp": "ISO timestamp",
-    "title": "Daily Investment Insights - {date}",
+    "title": "Daily Investment Insights - <today's date>",
     "date": "DD/MM/YYYY",
     "currency": "ILS",
-    "market_overview": {{
+    "market_overview": {
         "summary": "Market summary - what happened and what's expected",
-        "sentiment": "Positive/Negative/Neutral",
+        "sentiment": "POS|NEG|NEU",
         "key_events": [
-            {{
+            {
                 "event": "Important event",
                 "importance": "Why it's important for you to know this",
                 "impact": "How it affects your investments"
-            }}
+            }
         ],
         "trending_sectors": ["Sector 1", "Sector 2"],
         "action_items": ["Action 1 you need to take", "Action 2 you need to take"]
-    }},
+    },
     "recommendations": [
-        {{
+        {
             "symbol": "NVDA",
-            "action": "Buy/Sell/Hold",
+            "action": "BUY|SELL|HOLD",
             "action_hebrew": "Detailed action in Hebrew",
-            "amount_ils": "5000",
-            "percentage_of_portfolio": "15%",
-            "current_price": "750",
-            "target_price": "850",
-            "stop_loss": "700",
-            "confidence": "High/Medium/Low",
+            "amount_ils": 5000,
+            "percentage_of_portfolio": 15,
+            "current_price": 750,
+            "target_price": 850,
+            "stop_loss": 700,
+            "confidence": "H|M|L",
             "reason": "Detailed reasoning based on FACTS why to buy/sell",
             "timeframe": "1-2 weeks / 3-6 months",
             "risks": "What are the risks",
             "why_despite_risks": "Why this recommendation is still valid",
-            "type": "Short term/Long term",
+            "type": "ST|LT",
             "catalyst": "Specific event or catalyst that created this opportunity"
-        }}
+        }
     ],
     "sector_analysis": [
-        {{
+        {
             "sector": "AI/Technology",
-            "status": "Positive/Negative/Neutral",
-            "recommendation": "Buy/Hold/Avoid",
+            "status": "POS|NEG|NEU",
+            "recommendation": "BUY|HOLD|AVOID",
             "action_required": "What action is required based on the analysis",
             "top_picks": ["Stock 1", "Stock 2"],
             "reason": "Why the sector is interesting",
             "risks": "What are the sector risks",
             "why_despite_risks": "Why to recommend despite risks",
             "portfolio_impact": "How it affects your portfolio"
-        }}
+        }
     ],
     "alerts": [
-        {{
-            "type": "Earnings/News/Technical",
+        {
+            "type": "EARN|NEWS|TECH",
             "symbol": "NVDA",
             "message": "What the alert says",
-            "priority": "High/Medium/Low",
+            "priority": "H|M|L",
             "action_required": "What action is required",
-            "urgency": "Urgent/Medium/Not urgent",
+            "urgency": "URG|MED|LOW",
             "immediate_action": "Sell immediately something you hold / Buy immediately something you don't have"
-        }}
+        }
     ],
-    "risk_management": {{
-        "current_risk": "High/Medium/Low",
+    "risk_management": {
+        "current_risk": "H|M|L",
         "risk_type": "General portfolio risk management / For that day",
         "explanation": "Friendly and simple explanation",
         "immediate_actions": ["Action 1 you need to take now", "Action 2"],
         "stop_loss_levels": ["NVDA: 700", "TSLA: 110"],
         "hedging_strategies": ["Hedging strategy 1", "Hedging strategy 2"]
-    }}
-}}
+    }
+}
+
+"""
 
-CRITICAL REQUIREMENTS:
+def get_requirements_segment():
+    """Hard output requirements"""
+    return """CRITICAL REQUIREMENTS:
 - Provide exactly 5 HIGH-QUALITY, UNIQUE investment recommendations
 - Only recommend if you are 90%+ confident it will help make significant money
 - Focus on RARE opportunities that emerged TODAY due to specific events
 - Base ALL recommendations on FACTS only, no speculation or made-up data
-- All values in the JSON should be in Hebrew (except JSON keys)
+- All free-text values in the JSON should be in Hebrew (except JSON keys)
+- Enum fields must use exactly one of the ASCII codes shown in the schema (e.g. "BUY", "H", "POS"), never Hebrew words
+- amount_ils, percentage_of_portfolio, current_price, target_price and stop_loss must be plain JSON numbers
 - Provide specific amounts in ILS for each recommendation
 - Focus on market-beating opportunities, not generic advice
 - Consider the investor's aggressive risk tolerance
@@ -194,4 +240,75 @@ CRITICAL REQUIREMENTS:
 - Ensure all Hebrew text is properly encoded and doesn't break JSON structure
 - Stop-loss levels must include stock symbol (e.g., "NVDA: 700")
 - Each recommendation must have a specific catalyst or event that created the opportunity
-""" 
\ No newline at end of file
+"""
+
+def get_market_facts_section(market_facts=None):
+    if not market_facts:
+        return ""
+    return (
+        "\nSCREENED MARKET FACTS (computed from real price/volume data, ranked by signal strength):\n"
+        + market_facts + "\n"
+        "Use these facts as the starting point for volume spikes, gaps and breakouts. "
+        "Prefer candidates from this list over unverified names.\n"
+    )
+
+def get_exclusion_section(excluded_symbols=None):
+    if not excluded_symbols:
+        return ""
+    return (
+        "\nRECENTLY RECOMMENDED (last days, most repeated first):\n"
+        + ", ".join(excluded_symbols) + "\n"
+        "Do not recommend these again unless there is a NEW catalyst since the last recommendation, "
+        "and say what changed in the catalyst field.\n"
+    )
+
+def get_dynamic_segment(date, market_facts=None, excluded_symbols=None):
+    """Per-call tail: everything that changes between calls goes here, after the static prefix"""
+    return (
+        "TODAY'S INPUT:\n"
+        f"- Date: {date}\n"
+        + get_market_facts_section(market_facts)
+        + get_exclusion_section(excluded_symbols)
+    )
+
+# Bump whenever any static segment changes, so cached-prefix hit rates and
+# stored insights can be attributed to a prompt version
+PROMPT_VERSION = 'daily-v3'
+
+STATIC_SEGMENT_BUILDERS = [
+    ('context', get_full_context),
+    ('instructions', get_instructions_segment),
+    ('structure', get_structure_segment),
+    ('schema', get_schema_segment),
+    ('requirements', get_requirements_segment),
+]
+
+def build_static_segments():
+    return [(name, builder().rstrip("\n") + "\n") for name, builder in STATIC_SEGMENT_BUILDERS]
+
+# Precompiled once per process; byte-identical across calls so provider-side
+# prompt caching can reuse it
+STATIC_SEGMENTS = build_static_segments()
+STATIC_PREFIX = "\n".join(text for _, text in STATIC_SEGMENTS) + "\n"
+
+def get_prompt_segments(date=None, market_facts=None, excluded_symbols=None):
+    """Ordered (name, text) segments: the static prefix parts followed by the dynamic tail"""
+    if date is None:
+        date = datetime.now().strftime('%B %d, %Y')
+    return STATIC_SEGMENTS + [('dynamic', get_dynamic_segment(date, market_facts, excluded_symbols))]
+
+def get_profile_prompt(profile, date=None, market_facts=None):
+    """
+    Daily prompt for another investor profile (batch generation): the profile
+    context replaces the default one, everything else is the shared static text.
+    """
+    if date is None:
+        date = datetime.now().strftime('%B %d, %Y')
+    context = get_full_context(profile).rstrip("\n") + "\n"
+    shared = [text for name, text in STATIC_SEGMENTS if name != 'context']
+    return "\n".join([context] + shared) + "\n" + get_dynamic_segment(date, market_facts)
+
+def get_prompt(date=None, market_facts=None, excluded_symbols=None):
+    if date is None:
+        date = datetime.now().strftime('%B %d, %Y')
+    return STATIC_PREFIX + get_dynamic_segment(date, market_facts, excluded_symbols)
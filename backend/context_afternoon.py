@@ -8,67 +8,111 @@ import os
 from datetime import datetime, timedelta
 from typing import Dict, List
 
-def get_afternoon_prompt(time_of_day: str = "1:00 PM") -> str:
+AFTERNOON_PROMPT_VERSION = 'afternoon-v2'
+
+def get_afternoon_instructions() -> str:
     """
-    Generate specialized prompt for afternoon updates
-    Focuses on changes since morning and important developments
+    Static part of the afternoon prompt. It asks only for change records
+    relative to the morning digest; the backend merges them into a full view.
     """
-    
-    # Determine market context based on time
-    if time_of_day == "1:00 PM":
-        market_context = "🕐 MIDDAY UPDATE (1:00 PM Israel Time) - Focus on changes since morning and intraday opportunities."
-    else:  # 5:00 PM
-        market_context = "🕔 END-OF-DAY UPDATE (5:00 PM Israel Time) - Focus on today's summary and tomorrow's preparation."
-    
-    base_prompt = f"""
-    {market_context}
-    
-    You are an investment advisor providing a targeted update. Only include information if there are SIGNIFICANT CHANGES or IMPORTANT DEVELOPMENTS.
-    
-    CRITERIA FOR INCLUDING INFORMATION:
-    • New stock recommendations
+    return """
+    You are an investment advisor providing a targeted update on top of this morning's insight.
+    The MORNING DIGEST at the end of this prompt lists this morning's recommendations.
+    Do NOT repeat it. Report only what CHANGED, as change records.
+    
+    CRITERIA FOR A CHANGE RECORD:
+    • New stock recommendations (op "add")
+    • Changed action, target or stop for a morning recommendation (op "update", only the changed fields)
+    • A morning recommendation that is no longer valid, e.g. stop hit (op "remove")
     • Significant price movements (>3%)
     • Changes in market sentiment
     • New high-priority alerts
     • Important news events
     
-    If no significant changes occurred, indicate this clearly.
+    If no significant changes occurred, return empty "changes" and "alerts" lists.
     
     Return ONLY valid JSON with this structure:
-    {{
-        "market_overview": {{
+    {
+        "market_overview": {
             "sentiment": "bullish|bearish|neutral",
             "key_events": "תיאור קצר של אירועים חשובים",
             "changes_since_morning": "מה השתנה מאז עדכון הבוקר"
-        }},
-        "recommendations": [
-            {{
+        },
+        "changes": [
+            {
+                "op": "add|update|remove",
                 "symbol": "סמל_מניה",
                 "action": "buy|sell|hold",
-                "current_price": "מחיר נוכחי",
-                "target_price": "מחיר יעד",
+                "current_price": 0,
+                "target_price": 0,
+                "stop_loss": 0,
                 "reason": "למה המלצה זו השתנתה או חדשה"
-            }}
+            }
         ],
         "alerts": [
-            {{
+            {
                 "title": "כותרת התראה",
                 "description": "תיאור מפורט",
                 "priority": "high|medium|low"
-            }}
+            }
         ],
-        "update_summary": {{
+        "update_summary": {
             "has_significant_changes": true|false,
             "change_count": 0,
             "priority_level": "high|medium|low"
-        }}
-    }}
+        }
+    }
     
-    IMPORTANT: If no significant changes, set "has_significant_changes": false and keep other fields minimal.
+    IMPORTANT: Omit fields that did not change. Use "market_overview": null if sentiment did not change.
+    If no significant changes, set "has_significant_changes": false.
     ALL TEXT IN THE RESPONSE MUST BE IN HEBREW.
     """
+
+# Precompiled once per process so the prefix is byte-identical across calls
+AFTERNOON_STATIC_PREFIX = get_afternoon_instructions()
+
+def build_morning_digest(morning_insight: Dict = None) -> str:
+    """
+    Compact digest of the morning insight for the afternoon prompt:
+    one line per recommendation with symbol, action, entry, target and stop.
+    """
+    if not morning_insight:
+        return "No morning insight is available - treat every recommendation as new."
+    
+    market = morning_insight.get('market_overview') or {}
+    lines = [f"Morning sentiment: {market.get('sentiment', 'N/A')}"]
+    for rec in morning_insight.get('recommendations') or []:
+        lines.append(
+            f"- {rec.get('symbol', '?')}: {rec.get('action', '?')} "
+            f"@{rec.get('current_price', '?')} target {rec.get('target_price', '?')} "
+            f"stop {rec.get('stop_loss', '?')}"
+        )
+    return "\n".join(lines)
+
+def get_afternoon_prompt(time_of_day: str = "1:00 PM", morning_insight: Dict = None, triggers: List[str] = None) -> str:
+    """
+    Generate specialized prompt for afternoon updates
+    Static instructions first, then the time context and the morning digest
+    """
+    
+    # Determine market context based on time
+    if triggers:
+        market_context = (
+            "⚡ TRIGGERED INTRADAY UPDATE - these price/volume events just fired:\n"
+            + "\n".join(f"    • {t}" for t in triggers)
+            + "\n    Only return changes for the affected symbols unless the events change the wider picture."
+        )
+    elif time_of_day == "1:00 PM":
+        market_context = "🕐 MIDDAY UPDATE (1:00 PM Israel Time) - Focus on changes since morning and intraday opportunities."
+    else:  # 5:00 PM
+        market_context = "🕔 END-OF-DAY UPDATE (5:00 PM Israel Time) - Focus on today's summary and tomorrow's preparation."
     
-    return base_prompt
+    return (
+        AFTERNOON_STATIC_PREFIX
+        + f"\n    {market_context}\n\n"
+        + "MORNING DIGEST:\n"
+        + build_morning_digest(morning_insight) + "\n"
+    )
 
 def get_market_data_context() -> str:
     """Get current market data context for afternoon updates"""
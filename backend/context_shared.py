@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Investment Assistant - Shared Market Context Prompts
+Two-stage multi-profile generation: one shared market/sector prompt per day,
+then a short per-profile personalization prompt that references it.
+"""
+
+from datetime import datetime
+
+from context import get_investor_profile, get_portfolio_strategy, get_instructions_segment, get_dynamic_segment
+
+# Bump whenever either prompt changes
+SHARED_PROMPT_VERSION = 'shared-v1'
+
+def get_shared_schema_segment():
+    return """Return the result as a valid JSON with the following structure:
+{
+    "market_overview": {
+        "summary": "Market summary - what happened and what's expected",
+        "sentiment": "POS|NEG|NEU",
+        "key_events": [
+            {"event": "Important event", "importance": "Why it's important", "impact": "How it affects investments"}
+        ],
+        "trending_sectors": ["Sector 1", "Sector 2"],
+        "action_items": ["Action 1", "Action 2"]
+    },
+    "candidate_ideas": [
+        {
+            "symbol": "NVDA",
+            "action": "BUY|SELL|HOLD",
+            "current_price": 750,
+            "target_price": 850,
+            "stop_loss": 700,
+            "confidence": "H|M|L",
+            "type": "ST|LT",
+            "risk": "H|M|L",
+            "reason": "Detailed reasoning based on FACTS",
+            "timeframe": "1-2 weeks / 3-6 months",
+            "risks": "What are the risks",
+            "why_despite_risks": "Why the idea is still valid",
+            "catalyst": "Specific event or catalyst"
+        }
+    ],
+    "sector_analysis": [
+        {
+            "sector": "AI/Technology",
+            "status": "POS|NEG|NEU",
+            "recommendation": "BUY|HOLD|AVOID",
+            "action_required": "What action is required",
+            "top_picks": ["Stock 1", "Stock 2"],
+            "reason": "Why the sector is interesting",
+            "risks": "Sector risks"
+        }
+    ],
+    "alerts": [
+        {
+            "type": "EARN|NEWS|TECH",
+            "symbol": "NVDA",
+            "message": "What the alert says",
+            "priority": "H|M|L",
+            "urgency": "URG|MED|LOW"
+        }
+    ]
+}
+"""
+
+def get_shared_prompt(date=None, market_facts=None):
+    """Profile-independent part of the daily insight, generated once per day"""
+    if date is None:
+        date = datetime.now().strftime('%B %d, %Y')
+    return (
+        "You are a professional investment advisor covering Israeli and US markets for many investors "
+        "with different risk levels and capital.\n\n"
+        + get_instructions_segment() + "\n"
+        + "Generate the SHARED part of today's insight: market overview, sector analysis, alerts, and a pool of "
+        "10 candidate ideas spanning risk levels (mark each idea's own risk as H, M or L). "
+        "Do NOT size positions - amounts are decided per investor later.\n\n"
+        + get_shared_schema_segment() + "\n"
+        + "REQUIREMENTS:\n"
+        "- All free-text values in Hebrew; enum fields use exactly the ASCII codes shown\n"
+        "- Prices are plain JSON numbers\n"
+        "- Base everything on FACTS only; each idea needs a specific catalyst\n"
+        "- Return only valid JSON without additional text\n\n"
+        + get_dynamic_segment(date, market_facts)
+    )
+
+def build_shared_digest(shared):
+    """One compact line per candidate idea, for the per-profile prompt"""
+    market = shared.get('market_overview') or {}
+    lines = [f"Market sentiment: {market.get('sentiment', 'N/A')}"]
+    for idea in shared.get('candidate_ideas') or []:
+        lines.append(
+            f"- {idea.get('symbol', '?')} | {idea.get('action', '?')} | risk {idea.get('risk', '?')} | "
+            f"{idea.get('type', '?')} | @{idea.get('current_price', '?')} target {idea.get('target_price', '?')} "
+            f"stop {idea.get('stop_loss', '?')} | {str(idea.get('catalyst', ''))[:80]}"
+        )
+    return "\n".join(lines)
+
+def get_profile_overlay_prompt(profile, shared_digest):
+    """Cheap personalization: choose ideas from the shared pool and size them for one investor"""
+    return (
+        "You size today's shared investment ideas for one investor.\n\n"
+        + get_investor_profile(profile) + "\n"
+        + get_portfolio_strategy((profile or {}).get('allocation')) + "\n"
+        + "TODAY'S SHARED IDEAS (choose only from these):\n"
+        + shared_digest + "\n\n"
+        + """Pick up to 5 ideas that fit this investor's risk tolerance and capital, and return only this JSON:
+{
+    "recommendations": [
+        {"symbol": "NVDA", "amount_ils": 5000, "percentage_of_portfolio": 15, "action_hebrew": "Short action in Hebrew"}
+    ],
+    "risk_management": {
+        "current_risk": "H|M|L",
+        "explanation": "Short explanation in Hebrew",
+        "stop_loss_levels": ["NVDA: 700"]
+    }
+}
+Amounts are plain JSON numbers in ILS and must fit the investor's capital. Return only valid JSON.
+"""
+    )
@@ -1,21 +1,20 @@
 #!/usr/bin/env python3
 """
 Daily Insight Cron Job
-This script is designed to be called by Google Cloud Scheduler
-to generate daily investment insights at 8:00 AM Israel time.
+Runs the daily insight pipeline in-process through the scheduler (deadline,
+retries and run history included), so the trigger no longer times out while
+generation is still running. Use --http to call the deployed service instead.
 """
 
 import os
 import sys
 import logging
-from datetime import datetime
 import requests
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from logging_setup import configure_logging, request_context
+
+# Configure logging (queued, structured records; LOG_LEVEL applies here too)
+configure_logging(os.getenv('LOG_LEVEL', 'INFO'), os.getenv('LOG_FORMAT', 'json'))
 logger = logging.getLogger(__name__)
 
 def trigger_daily_insight():
@@ -24,8 +23,8 @@ def trigger_daily_insight():
         # Get the service URL from environment or use default
         service_url = os.getenv('SERVICE_URL', 'https://investment-assistant-cp6yzmvf2q-uc.a.run.app')
         
-        # Make request to the daily insight endpoint
-        response = requests.get(f"{service_url}/api/insights/daily", timeout=30)
+        # Generation alone can take ~30s, so allow well beyond that
+        response = requests.get(f"{service_url}/api/insights/daily", timeout=300)
         
         if response.status_code == 200:
             logger.info("Daily insight generated successfully")
@@ -38,13 +37,25 @@ def trigger_daily_insight():
         logger.error(f"Error triggering daily insight: {str(e)}")
         return False
 
+def run_daily_insight(job='daily'):
+    """Run a pipeline job in this process"""
+    from scheduler import main as scheduler_main
+    # One ID for every record of this run, including those from the pipeline itself
+    with request_context(f"cron-{job}"):
+        return scheduler_main(['run', job]) == 0
+
 if __name__ == "__main__":
+    args = sys.argv[1:]
     logger.info("Starting daily insight generation...")
-    success = trigger_daily_insight()
+    if '--http' in args:
+        success = trigger_daily_insight()
+    else:
+        job = next((a for a in args if not a.startswith('--')), 'daily')
+        success = run_daily_insight(job)
     
     if success:
         logger.info("Daily insight generation completed successfully")
         sys.exit(0)
     else:
         logger.error("Daily insight generation failed")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
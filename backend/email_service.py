@@ -13,8 +13,15 @@ from google.cloud import secretmanager
 from google.cloud import firestore
 import requests
 
+from models import Insight, InsightValidationError
+from storage_codec import decode_insight
+
 logger = logging.getLogger(__name__)
 
+def _fmt(value) -> str:
+    """Format an optional price for email display"""
+    return 'N/A' if value is None else f"{value:g}"
+
 class EmailService:
     def __init__(self):
         from config_service import config_service
@@ -107,7 +114,8 @@ class EmailService:
             
             insights = []
             for doc in docs:
-                insight_data = doc.to_dict()
+                # Same decoding as firestore.client: deduplicated text and compressed fields are restored
+                insight_data = decode_insight(doc.to_dict())
                 insight_data['id'] = doc.id
                 insights.append(insight_data)
             
@@ -171,9 +179,20 @@ class EmailService:
         
         return len(changes) > 0, changes
     
+    def _parse_insights(self, insights: List[Dict]) -> List[Insight]:
+        """Parse stored insights leniently, skipping documents that no longer fit the schema"""
+        models = []
+        for insight in insights:
+            try:
+                models.append(Insight.from_dict(insight, strict=False))
+            except InsightValidationError as e:
+                logger.warning(f"Skipping insight {insight.get('id', 'N/A')} in email: {e}")
+        return models
+    
     def create_email_content(self, insights: List[Dict], changes: List[str], time_of_day: str) -> Tuple[str, str, str]:
         """Create email subject and content"""
         subject = f"🔔 Investment Update - {time_of_day} - {len(changes)} Important Changes"
+        models = self._parse_insights(insights)
         
         # Create HTML content
         html_content = f"""
@@ -206,32 +225,33 @@ class EmailService:
         """
         
         # Add insights content
-        for insight in insights:
+        for model in models:
+            market = model.market_overview
+            key_events = '; '.join(e.event for e in market.key_events) or 'N/A'
             html_content += f"""
                 <div class="insight-card">
                     <h3>📊 Market Overview</h3>
-                    <p><strong>Sentiment:</strong> {insight.get('market_overview', {}).get('sentiment', 'N/A')}</p>
-                    <p><strong>Key Events:</strong> {insight.get('market_overview', {}).get('key_events', 'N/A')}</p>
+                    <p><strong>Sentiment:</strong> {market.sentiment or 'N/A'}</p>
+                    <p><strong>Key Events:</strong> {key_events}</p>
                     
                     <h3>💡 Recommendations</h3>
             """
             
-            if 'recommendations' in insight:
-                for rec in insight['recommendations']:
-                    html_content += f"""
-                        <div class="recommendation">
-                            <strong>{rec.get('symbol', 'N/A')}</strong> - {rec.get('action', 'N/A')}<br>
-                            <small>Price: {rec.get('current_price', 'N/A')} | Target: {rec.get('target_price', 'N/A')}</small>
-                        </div>
-                    """
+            for rec in model.recommendations:
+                html_content += f"""
+                    <div class="recommendation">
+                        <strong>{rec.symbol}</strong> - {rec.action or 'N/A'}<br>
+                        <small>Price: {_fmt(rec.current_price)} | Target: {_fmt(rec.target_price)}</small>
+                    </div>
+                """
             
-            if 'alerts' in insight:
+            if model.alerts:
                 html_content += "<h3>⚠️ Alerts</h3>"
-                for alert in insight['alerts']:
+                for alert in model.alerts:
                     html_content += f"""
                         <div class="alert">
-                            <strong>{alert.get('title', 'N/A')}</strong><br>
-                            {alert.get('description', 'N/A')}
+                            <strong>{alert.headline}</strong><br>
+                            {alert.message}
                         </div>
                     """
             
@@ -254,23 +274,24 @@ CHANGES DETECTED:
 LATEST INSIGHTS:
 """
         
-        for insight in insights:
+        for model in models:
+            market = model.market_overview
+            key_events = '; '.join(e.event for e in market.key_events) or 'N/A'
             text_content += f"""
 Market Overview:
-- Sentiment: {insight.get('market_overview', {}).get('sentiment', 'N/A')}
-- Key Events: {insight.get('market_overview', {}).get('key_events', 'N/A')}
+- Sentiment: {market.sentiment or 'N/A'}
+- Key Events: {key_events}
 
 Recommendations:
 """
             
-            if 'recommendations' in insight:
-                for rec in insight['recommendations']:
-                    text_content += f"- {rec.get('symbol', 'N/A')}: {rec.get('action', 'N/A')} (Price: {rec.get('current_price', 'N/A')}, Target: {rec.get('target_price', 'N/A')})\n"
+            for rec in model.recommendations:
+                text_content += f"- {rec.symbol}: {rec.action or 'N/A'} (Price: {_fmt(rec.current_price)}, Target: {_fmt(rec.target_price)})\n"
             
-            if 'alerts' in insight:
+            if model.alerts:
                 text_content += "\nAlerts:\n"
-                for alert in insight['alerts']:
-                    text_content += f"- {alert.get('title', 'N/A')}: {alert.get('description', 'N/A')}\n"
+                for alert in model.alerts:
+                    text_content += f"- {alert.headline}: {alert.message}\n"
         
         return subject, html_content, text_content
     
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Enum Codes for Investment Assistant
+The model emits short ASCII codes; this module expands them into the Hebrew
+display values the frontend expects
+"""
+
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+SENTIMENT_CODES = {'POS': 'חיובי', 'NEG': 'שלילי', 'NEU': 'ניטרלי'}
+ACTION_CODES = {'BUY': 'לקנות', 'SELL': 'למכור', 'HOLD': 'להחזיק'}
+LEVEL_CODES = {'H': 'גבוה', 'M': 'בינוני', 'L': 'נמוך'}
+TERM_CODES = {'ST': 'קצר טווח', 'LT': 'ארוך טווח'}
+SECTOR_ACTION_CODES = {'BUY': 'לקנות', 'HOLD': 'להחזיק', 'AVOID': 'להימנע'}
+ALERT_TYPE_CODES = {'EARN': 'רווחים', 'NEWS': 'חדשות', 'TECH': 'טכני'}
+URGENCY_CODES = {'URG': 'דחוף', 'MED': 'בינוני', 'LOW': 'לא דחוף'}
+
+# English words the model sometimes returns instead of a code, with candidate codes
+ENGLISH_ALIASES = {
+    'POSITIVE': ('POS',), 'BULLISH': ('POS',), 'NEGATIVE': ('NEG',), 'BEARISH': ('NEG',), 'NEUTRAL': ('NEU',),
+    'HIGH': ('H',), 'MEDIUM': ('M', 'MED'), 'LOW': ('L',),
+    'SHORT TERM': ('ST',), 'LONG TERM': ('LT',),
+    'EARNINGS': ('EARN',), 'TECHNICAL': ('TECH',),
+    'URGENT': ('URG',), 'NOT URGENT': ('LOW',),
+}
+
+# Where each code table applies: section -> {field: codes}
+FIELD_CODES = {
+    'market_overview': {'sentiment': SENTIMENT_CODES},
+    'recommendations': {'action': ACTION_CODES, 'confidence': LEVEL_CODES, 'type': TERM_CODES},
+    'sector_analysis': {'status': SENTIMENT_CODES, 'recommendation': SECTOR_ACTION_CODES},
+    'alerts': {'type': ALERT_TYPE_CODES, 'priority': LEVEL_CODES, 'urgency': URGENCY_CODES},
+    'risk_management': {'current_risk': LEVEL_CODES},
+}
+
+
+def expand_code(value, codes: Dict[str, str]):
+    """
+    Expand one enum code to its Hebrew display value.
+    Values that are already Hebrew (or unknown) are returned unchanged.
+    """
+    if not isinstance(value, str):
+        return value
+    key = value.strip().upper()
+    if key in codes:
+        return codes[key]
+    for alias in ENGLISH_ALIASES.get(key, ()):
+        if alias in codes:
+            return codes[alias]
+    return value
+
+
+def _expand_section(item: Dict, field_codes: Dict[str, Dict[str, str]]) -> None:
+    for field, codes in field_codes.items():
+        if field in item:
+            item[field] = expand_code(item[field], codes)
+
+
+def expand_insight_codes(insight: Dict) -> Dict:
+    """
+    Expand enum codes of a daily insight in place.
+    The API contract (Hebrew enum literals) is unchanged; numeric fields are
+    coerced by the insight model.
+    """
+    for section, field_codes in FIELD_CODES.items():
+        value = insight.get(section)
+        if isinstance(value, dict):
+            _expand_section(value, field_codes)
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, dict):
+                    _expand_section(item, field_codes)
+    return insight
+
@@ -1,20 +1,123 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 
+from storage_codec import decode_insight
+from firestore.schema import LATEST_COLLECTION, PROFILE_INSIGHTS_COLLECTION, insight_document_id
+
 if not firebase_admin._apps:
     cred = credentials.ApplicationDefault()
     firebase_admin.initialize_app(cred, {'projectId': 'investment-advisor-bot-2025'})
 
 db = firestore.client()
 
+@firestore.transactional
+def _upsert_with_latest(transaction, insight_ref, latest_ref, data):
+    latest = latest_ref.get(transaction=transaction)
+    current = latest.to_dict() if latest.exists else {}
+    transaction.set(insight_ref, data)
+    # Never let a late retry or backfill of an older date replace a newer latest view
+    if str(data.get('generated_at') or '') >= str(current.get('generated_at') or ''):
+        transaction.set(latest_ref, dict(data, id=insight_ref.id))
+
 def store_insight(data):
-    return db.collection("daily_insights").add(data)
+    """Upsert the insight and its latest/<type> view in one transaction; returns the document id"""
+    doc_id = insight_document_id(data)
+    insight_ref = db.collection("daily_insights").document(doc_id)
+    latest_ref = db.collection(LATEST_COLLECTION).document(data.get('type') or 'insight')
+    _upsert_with_latest(db.transaction(), insight_ref, latest_ref, data)
+    return doc_id
+
+def store_insights_bulk(documents, collection_name="daily_insights"):
+    """
+    Upsert many insights with batched writes; returns the document ids.
+    Unlike store_insight this does not update the latest/<type> view: bulk
+    writes carry backfills and other investors' profile insights, neither of
+    which may replace the user's latest insight of a type. Profile insights
+    go to PROFILE_INSIGHTS_COLLECTION.
+    """
+    collection = db.collection(collection_name)
+    doc_ids = []
+    # Firestore batches are limited to 500 writes
+    for start in range(0, len(documents), 400):
+        batch = db.batch()
+        for data in documents[start:start + 400]:
+            doc_id = insight_document_id(data)
+            batch.set(collection.document(doc_id), data)
+            doc_ids.append(doc_id)
+        batch.commit()
+    return doc_ids
+
+def _insight_from_doc(doc):
+    insight_data = decode_insight(doc.to_dict())
+    insight_data['id'] = doc.id
+    return insight_data
 
 def get_insights():
     docs = db.collection("daily_insights").order_by("timestamp", direction=firestore.Query.DESCENDING).limit(10).stream()
     insights = []
     for doc in docs:
-        insight_data = doc.to_dict()
-        insight_data['id'] = doc.id
-        insights.append(insight_data)
+        insights.append(_insight_from_doc(doc))
+    return insights
+
+def get_latest_insight(insight_type="daily_insight"):
+    doc = db.collection(LATEST_COLLECTION).document(insight_type).get()
+    if doc.exists:
+        return decode_insight(doc.to_dict())
+    # Fall back to a query for data written before the latest view existed
+    docs = db.collection("daily_insights").order_by("generated_at", direction=firestore.Query.DESCENDING).limit(20).stream()
+    for doc in docs:
+        insight_data = _insight_from_doc(doc)
+        if insight_data.get('type') == insight_type:
+            return insight_data
+    return None
+
+def stream_insights(insight_type="daily_insight"):
+    docs = db.collection("daily_insights").where("type", "==", insight_type).stream()
+    for doc in docs:
+        yield _insight_from_doc(doc)
+
+def get_insights_since(generated_after=None, insight_type="daily_insight"):
+    query = db.collection("daily_insights")
+    if generated_after:
+        query = query.where("generated_at", ">", generated_after)
+    insights = []
+    for doc in query.stream():
+        insight_data = _insight_from_doc(doc)
+        if insight_data.get('type') == insight_type:
+            insights.append(insight_data)
     return insights
+
+def add_documents_bulk(collection_name, documents):
+    """Append documents with generated ids using batched writes"""
+    collection = db.collection(collection_name)
+    for start in range(0, len(documents), 400):
+        batch = db.batch()
+        for data in documents[start:start + 400]:
+            batch.set(collection.document(), data)
+        batch.commit()
+
+def stream_documents_since(collection_name, field, value):
+    for doc in db.collection(collection_name).where(field, ">=", value).stream():
+        yield doc.to_dict()
+
+def get_document(collection, doc_id):
+    doc = db.collection(collection).document(doc_id).get()
+    return doc.to_dict() if doc.exists else None
+
+def set_document(collection, doc_id, data):
+    return db.collection(collection).document(doc_id).set(data)
+
+def stream_insights_before(generated_before):
+    docs = db.collection("daily_insights").where("generated_at", "<", generated_before).stream()
+    for doc in docs:
+        yield _insight_from_doc(doc)
+
+def replace_insights(documents):
+    collection = db.collection("daily_insights")
+    items = list(documents.items())
+    # Firestore batches are limited to 500 writes
+    for start in range(0, len(items), 400):
+        batch = db.batch()
+        for doc_id, data in items[start:start + 400]:
+            batch.set(collection.document(doc_id), data)
+        batch.commit()
@@ -0,0 +1,33 @@
+"""
+Collection names and document ids, kept apart from the client so they can be
+imported without initializing Firebase (cassette replay, batch tooling)
+"""
+
+from datetime import datetime
+
+LATEST_COLLECTION = "latest"
+# Other investors' insights, kept out of the user's daily_insights feed
+PROFILE_INSIGHTS_COLLECTION = "profile_insights"
+
+# Types that legitimately occur more than once a day get a time-of-day slot in their id
+REPEATABLE_TYPES = {'afternoon_insight_triggered'}
+
+def insight_document_id(data):
+    """
+    Deterministic id per (type, date), so a retried write replaces instead of
+    duplicating. Repeatable types add a slot (`slot`, else the HHMMSS of
+    generated_at) so each occurrence keeps its own document.
+    """
+    insight_type = data.get('type') or 'insight'
+    generated_at = str(data.get('generated_at') or data.get('timestamp') or '')
+    day = generated_at[:10]
+    if not day:
+        generated_at = datetime.utcnow().isoformat()
+        day = generated_at[:10]
+    doc_id = f"{insight_type}_{day}"
+    if insight_type in REPEATABLE_TYPES:
+        slot = data.get('slot') or generated_at[11:19].replace(':', '') or datetime.utcnow().strftime('%H%M%S')
+        doc_id = f"{doc_id}_{slot}"
+    if data.get('profile_id'):
+        return f"{doc_id}_{data['profile_id']}"
+    return doc_id
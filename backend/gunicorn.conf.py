@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn settings for Investment Assistant
+Loaded automatically from the working directory; starts the in-process
+scheduler once the worker has imported the app. SCHEDULER_MODE=in_process
+assumes a single worker, as in the Dockerfiles.
+"""
+
+
+def post_worker_init(worker):
+    from main import start_in_process_scheduler
+    start_in_process_scheduler()
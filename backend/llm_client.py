@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+LLM Client for Investment Assistant
+OpenAI chat completions with hedged requests and a circuit breaker,
+plus JSON extraction from model replies
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+OPENAI_CHAT_URL = 'https://api.openai.com/v1/chat/completions'
+
+DEFAULT_HEDGE_DELAY_SECONDS = 12.0
+DEFAULT_HEDGE_PERCENTILE = 95
+MIN_LATENCY_SAMPLES = 20
+LATENCY_SAMPLES = 200
+# Days of usage-ledger latencies a new process starts from
+LATENCY_SEED_DAYS = 30
+
+BREAKER_CLOSED = 'closed'
+BREAKER_OPEN = 'open'
+BREAKER_HALF_OPEN = 'half_open'
+
+
+class LLMError(Exception):
+    """The provider returned an error or an unusable response"""
+
+
+class CircuitOpenError(LLMError):
+    """The breaker is open; the call was not attempted"""
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for the hedge delay"""
+
+    def __init__(self, size: int = LATENCY_SAMPLES):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def extend(self, samples: Iterable[float]) -> None:
+        with self._lock:
+            self._samples.extend(samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and fails fast for
+    `reset_seconds`; then lets one probe call through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_seconds: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == BREAKER_OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = BREAKER_HALF_OPEN
+                self._probing = False
+            if self.state == BREAKER_CLOSED:
+                return True
+            if self.state == BREAKER_HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = BREAKER_CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == BREAKER_HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != BREAKER_OPEN:
+                    logger.warning(f"LLM circuit breaker opened after {self.failures} failures")
+                self.state = BREAKER_OPEN
+                self.opened_at = time.monotonic()
+
+    def to_dict(self) -> Dict:
+        return {'state': self.state, 'consecutive_failures': self.failures}
+
+
+class LLMClient:
+    """
+    Chat completions are streamed, so a request can be abandoned mid-reply:
+    closing an unfinished streamed response drops its connection, which
+    stops the provider generating (and billing) the rest of the losing
+    hedge. Each request runs on its own short-lived thread rather than a
+    shared pool, so concurrent batch calls and hedges never queue behind
+    each other and inflate the latency the hedge delay is derived from.
+    Latencies are tracked per key (the route, or the model by default) so
+    fast small-model calls do not pull down the large model's hedge delay.
+    A key is not hedged until it has MIN_LATENCY_SAMPLES samples (seed them
+    from the usage ledger for rarely called routes), and never sooner than
+    `hedge_delay_seconds`; the hedge gets the full timeout of its own.
+    """
+
+    def __init__(self, api_key: Optional[str], hedge_enabled: bool = True,
+                 hedge_delay_seconds: float = DEFAULT_HEDGE_DELAY_SECONDS,
+                 hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.api_key = api_key
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.hedge_percentile = hedge_percentile
+        self.breaker = breaker or CircuitBreaker()
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._latencies_lock = threading.Lock()
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self._hedges_lock = threading.Lock()
+        self._local = threading.local()
+
+    def latencies(self, key: str) -> LatencyTracker:
+        with self._latencies_lock:
+            tracker = self._latencies.get(key)
+            if tracker is None:
+                tracker = self._latencies[key] = LatencyTracker()
+            return tracker
+
+    def seed_latencies(self, key: str, samples: Iterable[float]) -> None:
+        """Latencies recorded before this process started (samples are otherwise kept in memory only)"""
+        self.latencies(key).extend(samples)
+
+    def hedge_delay(self, key: str) -> Optional[float]:
+        """
+        Observed p95 latency for `key`, at least hedge_delay_seconds; None (no
+        hedging) until there are enough samples to know what slow means.
+        """
+        observed = self.latencies(key).percentile(self.hedge_percentile)
+        return max(observed, self.hedge_delay_seconds) if observed is not None else None
+
+    @staticmethod
+    def _start(func, *args) -> Future:
+        """Run `func` on a dedicated daemon thread; a future cancelled before it starts never runs"""
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(func(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='llm-request', daemon=True).start()
+        return future
+
+    def _post(self, payload: Dict, deadline: float, cancel: threading.Event, latencies: LatencyTracker,
+              parts: List[str]) -> Optional[Dict]:
+        """
+        One streamed request; returns None if it was cancelled (another request
+        won). Content deltas are appended to `parts` as they arrive.
+        """
+        if cancel.is_set():
+            return None
+        started = time.monotonic()
+        with requests.Session() as session:
+            response = session.post(
+                OPENAI_CHAT_URL,
+                headers={'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'},
+                json=dict(payload, stream=True, stream_options={'include_usage': True}),
+                timeout=max(deadline - started, 1),
+                stream=True
+            )
+            # Closing a response whose body was not fully read closes its connection
+            with response:
+                if response.status_code != 200:
+                    raise LLMError(f"OpenAI API error: {response.status_code} - {response.text}")
+                if 'text/event-stream' in response.headers.get('Content-Type', ''):
+                    result = _read_stream(response, deadline, cancel, parts)
+                else:
+                    result = response.json()
+        if result is not None:
+            latencies.add(time.monotonic() - started)
+        return result
+
+    def chat(self, messages: List[Dict], model: str = 'gpt-4o', temperature: float = 0.7,
+             max_tokens: int = 4000, timeout: float = 30, hedge: Optional[bool] = None,
+             latency_key: Optional[str] = None) -> Dict:
+        """
+        One chat completion. With hedging, a second identical request is sent if
+        the first has not answered within the hedge delay for `latency_key`
+        (default: the model); the first good response wins and the other
+        request is aborted mid-stream. Each request has `timeout` seconds from
+        when it was sent.
+        """
+        self._local.attempts = 0
+        self._local.loser_usage = None
+        if not self.api_key:
+            raise LLMError("OpenAI API key not configured")
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM provider circuit breaker is open")
+
+        payload = {'model': model, 'messages': messages, 'temperature': temperature, 'max_tokens': max_tokens}
+        deadline = time.monotonic() + timeout
+        cancel = threading.Event()
+        latency_key = latency_key or model
+        latencies = self.latencies(latency_key)
+        hedge_delay = self.hedge_delay(latency_key)
+        hedge = (self.hedge_enabled if hedge is None else hedge) and hedge_delay is not None and hedge_delay < timeout
+        streamed = [[]]
+        futures = [self._start(self._post, payload, deadline, cancel, latencies, streamed[0])]
+        self._local.attempts = 1
+        last_error = None
+
+        try:
+            done, _ = wait(futures, timeout=hedge_delay if hedge else timeout)
+            if hedge and not done:
+                logger.info(f"LLM call ({latency_key}) slower than {hedge_delay:.1f}s - sending hedged request")
+                streamed.append([])
+                deadline = time.monotonic() + timeout
+                futures.append(self._start(self._post, payload, deadline, cancel, latencies, streamed[1]))
+                with self._hedges_lock:
+                    self.hedges_sent += 1
+                self._local.attempts = 2
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if result is None:
+                        continue
+                    if len(futures) > 1:
+                        winner = futures.index(future)
+                        with self._hedges_lock:
+                            self.hedges_won += winner == 1
+                        self._local.loser_usage = _loser_usage(futures[1 - winner], streamed[1 - winner], result, model)
+                    self.breaker.record_success()
+                    return result
+        finally:
+            # Stop the other request mid-stream, and anything not yet started from starting at all
+            cancel.set()
+            for future in futures:
+                future.cancel()
+
+        self.breaker.record_failure()
+        if last_error is None:
+            raise LLMError(f"OpenAI API timed out after {timeout}s")
+        if isinstance(last_error, LLMError):
+            raise last_error
+        raise LLMError(f"OpenAI API request failed: {last_error}")
+
+    def last_attempts(self) -> int:
+        """Requests sent by this thread's most recent chat() call (2 when it was hedged)"""
+        return getattr(self._local, 'attempts', 0)
+
+    def last_loser_usage(self) -> Optional[Dict]:
+        """Billed usage of the losing request of this thread's most recent hedged chat() call"""
+        return getattr(self._local, 'loser_usage', None)
+
+    def stats(self) -> Dict:
+        return {
+            'breaker': self.breaker.to_dict(),
+            'hedge_delay_seconds': {key: _round(self.hedge_delay(key)) for key in sorted(self._latencies)},
+            'hedges_sent': self.hedges_sent,
+            'hedges_won': self.hedges_won,
+        }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def _loser_usage(future: Future, parts: List[str], winner: Dict, model: str) -> Optional[Dict]:
+    """
+    What the provider bills for the request that lost a hedge: its own usage if
+    it also finished, otherwise the (identical) prompt plus the completion
+    streamed before it was aborted - a lower bound, as tokens generated after
+    the last chunk read are not seen. A request that failed or never started
+    is not billed.
+    """
+    if future.cancelled():
+        return None
+    if future.done():
+        if future.exception() is not None:
+            return None
+        if future.result() is not None:
+            return future.result().get('usage')
+    usage = winner.get('usage') or {}
+    return {
+        'prompt_tokens': usage.get('prompt_tokens') or 0,
+        'completion_tokens': count_tokens(''.join(parts), model) if parts else 0,
+        'prompt_tokens_details': usage.get('prompt_tokens_details') or {},
+    }
+
+
+def _read_stream(response: requests.Response, deadline: float, cancel: threading.Event,
+                 parts: Optional[List[str]] = None) -> Optional[Dict]:
+    """
+    Assemble a streamed (server-sent events) completion into the shape of a
+    non-streamed response. Returns None as soon as `cancel` is set.
+    """
+    parts = [] if parts is None else parts
+    result = {'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''}, 'finish_reason': None}]}
+    for line in response.iter_lines():
+        if cancel.is_set():
+            return None
+        if time.monotonic() > deadline:
+            raise LLMError("OpenAI API stream exceeded its deadline")
+        if not line or not line.startswith(b'data:'):
+            continue
+        data = line[len(b'data:'):].strip()
+        if data == b'[DONE]':
+            break
+        chunk = json.loads(data)
+        for field in ('id', 'model', 'created'):
+            if field in chunk:
+                result[field] = chunk[field]
+        if chunk.get('usage'):
+            result['usage'] = chunk['usage']
+        for choice in chunk.get('choices') or []:
+            delta = choice.get('delta') or {}
+            if delta.get('content'):
+                parts.append(delta['content'])
+            if choice.get('finish_reason'):
+                result['choices'][0]['finish_reason'] = choice['finish_reason']
+    result['choices'][0]['message']['content'] = ''.join(parts)
+    return result
+
+
+def extract_json(content: str) -> Tuple[Dict, str]:
+    """
+    Parse the JSON object out of a model reply. Returns (data, strategy) where
+    strategy names the first approach that worked; raises json.JSONDecodeError
+    from the last one if none did.
+    """
+    # Strategy 1: Look for JSON between curly braces
+    start_idx = content.find('{')
+    end_idx = content.rfind('}') + 1
+    if start_idx != -1 and end_idx > start_idx:
+        try:
+            return json.loads(content[start_idx:end_idx]), 'braces'
+        except json.JSONDecodeError as e:
+            logger.warning(f"Strategy 1 failed: {e}")
+
+    # Strategy 2: Remove markdown formatting and parse
+    try:
+        cleaned_content = content.replace('```json', '').replace('```', '').strip()
+        return json.loads(cleaned_content), 'cleaned'
+    except json.JSONDecodeError as e:
+        logger.warning(f"Strategy 2 failed: {e}")
+
+    # Strategy 3: Fix common JSON issues (surrounding text, raw newlines, trailing commas)
+    fixed_content = content
+    start_idx = fixed_content.find('{')
+    if start_idx != -1:
+        fixed_content = fixed_content[start_idx:]
+    end_idx = fixed_content.rfind('}')
+    if end_idx != -1:
+        fixed_content = fixed_content[:end_idx + 1]
+    fixed_content = fixed_content.replace('\n', ' ').replace('\r', ' ')
+    fixed_content = re.sub(r',(\s*[}\]])', r'\1', fixed_content)
+    return json.loads(fixed_content), 'fixed'
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Logging Setup for Investment Assistant
+Non-blocking logging: request threads only enqueue records, a background
+listener formats them as JSON lines carrying the request and generation IDs,
+and large payloads (model replies) are truncated or sampled by configuration
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+from usage_ledger import current_generation
+
+DEFAULT_PAYLOAD_MAX_CHARS = 500
+DEFAULT_MAX_MESSAGE_CHARS = 8000
+QUEUE_SIZE = 10000
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_request_id = contextvars.ContextVar('log_request_id', default=None)
+
+_settings = {
+    'payload_max_chars': DEFAULT_PAYLOAD_MAX_CHARS,
+    'payload_sample_rate': 1.0,
+}
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+_output_handler: Optional[logging.Handler] = None
+
+
+def get_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None):
+    """Tag every record logged inside the block with a request ID"""
+    token = _request_id.set(request_id or uuid.uuid4().hex[:16])
+    try:
+        yield _request_id.get()
+    finally:
+        _request_id.reset(token)
+
+
+def set_request_id(request_id: Optional[str] = None) -> contextvars.Token:
+    return _request_id.set(request_id or uuid.uuid4().hex[:16])
+
+
+def reset_request_id(token: contextvars.Token) -> None:
+    _request_id.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copies the request and generation IDs onto the record. It runs on the
+    logging thread, before the record is queued, since context variables are
+    not visible to the listener thread.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        generation = current_generation()
+        record.request_id = _request_id.get()
+        record.generation_id = generation.generation_id if generation is not None else None
+        return True
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that keeps the exception text separate instead of folding it into the message"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self._exception_formatter = logging.Formatter()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Never block a request thread on logging; the record is dropped instead
+            pass
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, max_message_chars: int = DEFAULT_MAX_MESSAGE_CHARS):
+        super().__init__()
+        self.max_message_chars = max_message_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        if len(message) > self.max_message_chars:
+            message = message[:self.max_message_chars] + f"... [{len(message) - self.max_message_chars} chars truncated]"
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'severity': record.levelname,
+            'logger': record.name,
+            'message': message,
+            'thread': record.threadName,
+        }
+        for field in ('request_id', 'generation_id', 'payload_chars'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level='INFO', log_format: str = 'json', payload_max_chars: int = DEFAULT_PAYLOAD_MAX_CHARS,
+                      payload_sample_rate: float = 1.0, stream=None) -> None:
+    """
+    Route the root logger through a queue to a background listener. Safe to
+    call again (e.g. once config is loaded): level, format and payload
+    settings are updated in place.
+    """
+    global _listener, _queue_handler, _output_handler
+    root = logging.getLogger()
+    root.setLevel(str(level or 'INFO').upper())
+    _settings['payload_max_chars'] = payload_max_chars
+    _settings['payload_sample_rate'] = payload_sample_rate
+
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+    if _listener is None:
+        log_queue = queue.Queue(QUEUE_SIZE)
+        _output_handler = logging.StreamHandler(stream or sys.stdout)
+        _queue_handler = StructuredQueueHandler(log_queue)
+        _queue_handler.addFilter(ContextFilter())
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler)
+        _listener = logging.handlers.QueueListener(log_queue, _output_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    _output_handler.setFormatter(formatter)
+
+
+def shutdown_logging() -> None:
+    """Drain the queue and stop the listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+        logging.getLogger().removeHandler(_queue_handler)
+
+
+def log_payload(logger: logging.Logger, label: str, payload: Optional[str], level: int = logging.DEBUG) -> None:
+    """
+    Log a large payload such as a raw model reply: sampled by
+    LOG_PAYLOAD_SAMPLE_RATE and truncated to LOG_PAYLOAD_MAX_CHARS. The
+    full length is always recorded.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    payload = payload or ''
+    if _settings['payload_sample_rate'] < 1.0 and random.random() >= _settings['payload_sample_rate']:
+        logger.log(level, f"{label}: {len(payload)} chars (not sampled)", extra={'payload_chars': len(payload)})
+        return
+    max_chars = _settings['payload_max_chars']
+    shown = payload if len(payload) <= max_chars else payload[:max_chars] + '...'
+    logger.log(level, f"{label}: {shown}", extra={'payload_chars': len(payload)})
@@ -5,28 +5,58 @@ Essential APIs for daily insights and Firestore operations.
 """
 
 import os
+import atexit
 import logging
-import requests
 import json
-from datetime import datetime
-from flask import Flask, jsonify, request
+import itertools
+import threading
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
+from flask import Flask, jsonify, request, g, send_file
 from dotenv import load_dotenv
 
 # Import Firestore client
-from firestore.client import store_insight, get_insights
-from context import get_prompt
-from context_afternoon import get_afternoon_prompt
+from firestore.client import (
+    store_insight, get_insights, get_latest_insight, stream_insights,
+    get_insights_since, get_document, set_document, stream_insights_before, replace_insights,
+    add_documents_bulk, stream_documents_since
+)
+from firestore.schema import PROFILE_INSIGHTS_COLLECTION
+from context import get_prompt, get_prompt_segments, PROMPT_VERSION
+from context_afternoon import get_afternoon_prompt, AFTERNOON_PROMPT_VERSION
+from afternoon_delta import merge_afternoon_delta
+from enum_codes import expand_insight_codes
+from models import Insight
 from email_service import EmailService
 from config_service import config_service
+from market_data import get_price_history
+from screener import get_market_facts
+from significance import precheck_from_history
+from backtest import load_recommendations, run_backtest, GROUP_FIELDS
+from tracker import run_tracker_update, TRACKER_COLLECTION, TRACKER_DOCUMENT, SNAPSHOT_COLLECTION
+from token_counter import measure_segments
+from llm_client import LLMClient, CircuitBreaker, CircuitOpenError, extract_json, LATENCY_SAMPLES, LATENCY_SEED_DAYS
+from model_router import ModelRouter, load_policy, delta_needs_escalation, hit_token_limit, ROUTE_DAILY, ROUTE_AFTERNOON, ROUTE_AFTERNOON_FIRST_PASS
+from storage_codec import encode_insight
+from search_index import get_search_index
+from novelty import NoveltyWindow, NOVELTY_COLLECTION, NOVELTY_DOCUMENT
+from triggers import TriggerEngine, TriggerRules, get_provider
+from scheduler import Scheduler, build_jobs, RUNS_COLLECTION
+from archiver import archive_insights, iter_archived_insights, get_archive_backend, DEFAULT_ARCHIVE_AFTER_DAYS
+from usage_ledger import UsageLedger, LocalLedgerSink, FirestoreLedgerSink, aggregate, mark_parsed, OUTCOME_ERROR
+from prompt_experiments import (
+    PromptExperiments, load_weights, tag_insight, schema_completeness, experiment_report, KIND_DAILY, KIND_AFTERNOON
+)
+from shared_context import SharedContextCache, load_profile_insight, SHARED_CONTEXT_COLLECTION
+from logging_setup import configure_logging, set_request_id, reset_request_id, get_request_id, log_payload
+from profiling import ProfilingMiddleware, ProfileStore, stage, timed_stage
+from monte_carlo import simulate_cached, DEFAULT_PATHS, DEFAULT_YEARS, MAX_PATHS, MAX_YEARS
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queued JSON records; reapplied below once config is loaded)
+configure_logging(os.getenv('LOG_LEVEL', 'INFO'), os.getenv('LOG_FORMAT', 'json'))
 logger = logging.getLogger(__name__)
 
 # Initialize Flask app
@@ -34,9 +64,143 @@ app = Flask(__name__)
 
 # Configuration
 config = config_service.get_config()
+configure_logging(
+    config.get('LOG_LEVEL') or 'INFO',
+    config.get('LOG_FORMAT', 'json'),
+    payload_max_chars=config.get('LOG_PAYLOAD_MAX_CHARS', 500),
+    payload_sample_rate=config.get('LOG_PAYLOAD_SAMPLE_RATE', 1.0)
+)
 PROJECT_ID = config.get('PROJECT_ID', 'investment-advisor-bot-2025')
 OPENAI_API_KEY = config.get('OPENAI_API_KEY')
 
+_profile_store = None
+
+def get_profile_store():
+    global _profile_store
+    if _profile_store is None:
+        _profile_store = ProfileStore(config.get('PROFILING_DIR', 'data/profiles'), config.get('PROFILING_MAX_PROFILES', 50))
+    return _profile_store
+
+# Opt-in request profiling: signed requests (PROFILING_SECRET) and/or a sample of all requests
+if config.get('PROFILING_SECRET') or config.get('PROFILING_SAMPLE_RATE', 0) > 0:
+    app.wsgi_app = ProfilingMiddleware(
+        app.wsgi_app,
+        get_profile_store(),
+        secret=config.get('PROFILING_SECRET'),
+        sample_rate=config.get('PROFILING_SAMPLE_RATE', 0),
+        mode=config.get('PROFILING_MODE', 'cprofile')
+    )
+
+SYSTEM_PROMPT = 'You are a professional investment advisor specializing in Israeli and US markets. Provide precise, actionable recommendations with specific amounts and detailed analysis. Focus on market-beating opportunities, not generic advice. ALWAYS return valid JSON only, no additional text.'
+
+_llm_client = None
+
+def get_llm_client():
+    """Shared OpenAI client (hedging and circuit breaker state live for the process)"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient(
+            OPENAI_API_KEY,
+            hedge_enabled=config.get('LLM_HEDGE_ENABLED', True),
+            hedge_delay_seconds=config.get('LLM_HEDGE_DELAY_SECONDS', 12.0),
+            breaker=CircuitBreaker(
+                failure_threshold=config.get('LLM_BREAKER_FAILURES', 3),
+                reset_seconds=config.get('LLM_BREAKER_RESET_SECONDS', 60)
+            )
+        )
+        seed_hedge_latencies(_llm_client)
+    return _llm_client
+
+def seed_hedge_latencies(client):
+    """
+    Per-route latencies from the usage ledger, so routes that run once or
+    twice a day (the daily insight) reach enough samples to be hedged at all
+    """
+    try:
+        by_route = {}
+        for record in get_usage_ledger().records_since(LATENCY_SEED_DAYS):
+            if record.get('outcome') != OUTCOME_ERROR and record.get('route') and record.get('latency_seconds'):
+                by_route.setdefault(record['route'], []).append((record.get('timestamp') or '', record['latency_seconds']))
+        for route, samples in by_route.items():
+            client.seed_latencies(route, [seconds for _, seconds in sorted(samples)[-LATENCY_SAMPLES:]])
+        logger.info(f"Seeded hedge latencies for {len(by_route)} routes")
+    except Exception as e:
+        logger.warning(f"Could not seed hedge latencies from the usage ledger: {e}")
+
+_usage_ledger = None
+
+def get_usage_ledger():
+    """Per-call token/cost/latency ledger, flushed in bulk (and once more at exit)"""
+    global _usage_ledger
+    if _usage_ledger is None:
+        if config.get('USAGE_LEDGER_SINK') == 'local':
+            sink = LocalLedgerSink(config.get('USAGE_LEDGER_LOCAL_DIR', 'data/usage'))
+        else:
+            sink = FirestoreLedgerSink(add_documents_bulk, stream_documents_since)
+        _usage_ledger = UsageLedger(
+            sink,
+            flush_size=config.get('USAGE_LEDGER_FLUSH_SIZE', 50),
+            flush_seconds=config.get('USAGE_LEDGER_FLUSH_SECONDS', 60)
+        )
+        atexit.register(_usage_ledger.flush)
+    return _usage_ledger
+
+_prompt_experiments = None
+
+def get_prompt_experiments():
+    """Prompt variant weights from PROMPT_EXPERIMENTS; control only when unset"""
+    global _prompt_experiments
+    if _prompt_experiments is None:
+        _prompt_experiments = PromptExperiments(
+            load_weights(config.get('PROMPT_EXPERIMENTS')),
+            salt=config.get('PROMPT_EXPERIMENT_SALT') or ''
+        )
+    return _prompt_experiments
+
+_model_router = None
+
+def get_model_router():
+    """Per-insight-type model routing over the shared LLM client"""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter(
+            get_llm_client(),
+            load_policy(config.get('MODEL_ROUTING_POLICY')),
+            first_pass_enabled=config.get('AFTERNOON_FIRST_PASS', True),
+            ledger=get_usage_ledger()
+        )
+    return _model_router
+
+def serve_cached_insight(insight_type, error):
+    """Fallback while the LLM circuit is open: the last stored insight of this type"""
+    cached = get_latest_insight(insight_type)
+    if not cached:
+        raise error
+    logger.warning(f"LLM unavailable ({error}) - serving cached {insight_type} {cached.get('id')}")
+    return jsonify({
+        "status": "success",
+        "message": "LLM provider unavailable - serving the last stored insight",
+        "served_from_cache": True,
+        "data": cached
+    })
+
+@app.before_request
+def bind_request_id():
+    """Tag this request's log records with the caller's request/trace ID or a new one"""
+    incoming = request.headers.get('X-Request-ID') or request.headers.get('X-Cloud-Trace-Context', '').split('/')[0]
+    g.request_id_token = set_request_id(incoming or None)
+
+@app.after_request
+def add_request_id_header(response):
+    response.headers['X-Request-ID'] = get_request_id() or ''
+    return response
+
+@app.teardown_request
+def unbind_request_id(error=None):
+    token = g.pop('request_id_token', None)
+    if token is not None:
+        reset_request_id(token)
+
 @app.route('/')
 def hello():
     """Health check endpoint"""
@@ -56,126 +220,144 @@ def health():
         'project_id': PROJECT_ID,
         'services': {
             'firestore': 'connected',
-            'openai': 'configured' if OPENAI_API_KEY else 'not_configured'
+            'openai': 'configured' if OPENAI_API_KEY else 'not_configured',
+            'llm': get_llm_client().stats()
         }
     })
 
+@timed_stage('validate')
+def finalize_daily_insight(insight_data):
+    """
+    Expand compact enum codes to Hebrew display values, add metadata and
+    validate/coerce through the typed model (off-schema values are dropped; raises
+    InsightValidationError only when no valid recommendations remain)
+    """
+    expand_insight_codes(insight_data)
+    insight_data['source'] = 'investment_assistant'
+    insight_data['generated_at'] = datetime.utcnow().isoformat()
+    insight_data['type'] = 'daily_insight'
+    insight_data['prompt_version'] = PROMPT_VERSION
+    insight_data['novelty_flags'] = get_novelty_window().flag_repeats(insight_data)
+    if insight_data['novelty_flags']:
+        logger.info(f"Novelty filter flagged {len(insight_data['novelty_flags'])} repeated recommendations")
+    return Insight.from_dict(insight_data).to_firestore()
+
+_novelty_window = None
+_novelty_lock = threading.Lock()
+
+def get_novelty_window():
+    """Process-wide rolling window, loaded from Firestore on first use"""
+    global _novelty_window
+    with _novelty_lock:
+        if _novelty_window is None:
+            _novelty_window = load_novelty_window(config.get('NOVELTY_WINDOW_DAYS', 14))
+    return _novelty_window
+
+def load_novelty_window(window_days):
+    try:
+        doc = get_document(NOVELTY_COLLECTION, NOVELTY_DOCUMENT)
+        if doc is None:
+            return NoveltyWindow.from_insights(get_recent_daily_insights(window_days), window_days)
+        return NoveltyWindow.from_document(doc, window_days)
+    except Exception as e:
+        logger.warning(f"Failed to load novelty window, starting empty: {e}")
+        return NoveltyWindow(window_days)
+
+def get_recent_daily_insights(window_days):
+    since = (datetime.utcnow() - timedelta(days=window_days)).isoformat()
+    return get_insights_since(since, 'daily_insight')
+
+def record_novelty(insight_data):
+    """Add a stored daily insight to the novelty window (replacing its day's entries) and persist it"""
+    try:
+        window = get_novelty_window()
+        # Serialized so a slower writer cannot persist an older snapshot last
+        with _novelty_lock:
+            if window.add_insight(insight_data):
+                set_document(NOVELTY_COLLECTION, NOVELTY_DOCUMENT, window.to_document())
+    except Exception as e:
+        logger.warning(f"Failed to update novelty window: {e}")
+
+@timed_stage('store')
+def store_encoded_insight(insight_data):
+    """Store an insight through the compact storage encoding and log the bytes saved"""
+    compress = [f.strip() for f in (config.get('STORAGE_COMPRESS_FIELDS') or '').split(',') if f.strip()]
+    encoded, report = encode_insight(
+        insight_data,
+        dedupe=config.get('STORAGE_DEDUPE_TEXT', False),
+        compress=compress,
+        budget=config.get('STORAGE_SIZE_BUDGET')
+    )
+    logger.info(
+        f"Storing insight: {report['original_bytes']} -> {report['encoded_bytes']} bytes "
+        f"(saved per rule: {report['rules']})"
+    )
+    doc_id = store_insight(encoded)
+    index_insight(doc_id, insight_data)
+    if insight_data.get('type') == 'daily_insight':
+        record_novelty(insight_data)
+    return doc_id
+
+@timed_stage('index')
+def index_insight(doc_id, insight_data):
+    """Add a stored insight to the local search index; indexing never fails the write"""
+    try:
+        index = get_search_index(config.get('SEARCH_INDEX_DIR', 'data/search_index'))
+        if index.add_insight(doc_id, insight_data):
+            index.save()
+    except Exception as e:
+        logger.warning(f"Failed to index insight {doc_id}: {e}")
+
 def generate_investment_insight():
     """Generate investment insight using ChatGPT API with detailed context"""
-    prompt = get_prompt()
-    if not OPENAI_API_KEY:
-        logger.error("OpenAI API key not configured")
-        raise Exception("OpenAI API key not configured")
-    headers = {
-        'Authorization': f'Bearer {OPENAI_API_KEY}',
-        'Content-Type': 'application/json'
-    }
-    data = {
-        'model': 'gpt-4o',
-        'messages': [
-            {
-                'role': 'system',
-                'content': 'You are a professional investment advisor specializing in Israeli and US markets. Provide precise, actionable recommendations with specific amounts and detailed analysis. Focus on market-beating opportunities, not generic advice. ALWAYS return valid JSON only, no additional text.'
-            },
-            {
-                'role': 'user',
-                'content': prompt
-            }
-        ],
-        'temperature': 0.7,
-        'max_tokens': 4000
-    }
-    response = requests.post(
-        'https://api.openai.com/v1/chat/completions',
-        headers=headers,
-        json=data,
-        timeout=30
+    with stage('market_facts'):
+        market_facts = get_market_facts(get_price_history(), config.get('SCREENER_TOP_K', 10))
+    excluded_symbols = get_novelty_window().exclusion_list(day=datetime.utcnow().strftime('%Y-%m-%d'))
+    experiments = get_prompt_experiments()
+    variant = experiments.assign(KIND_DAILY, datetime.utcnow().strftime('%Y-%m-%d'))
+    prompt_version = experiments.version(PROMPT_VERSION, variant)
+    prompt = experiments.apply(get_prompt(market_facts=market_facts, excluded_symbols=excluded_symbols), variant)
+    token_stats = measure_segments(get_prompt_segments(market_facts=market_facts, excluded_symbols=excluded_symbols))
+    logger.info(
+        f"Daily prompt {prompt_version}: {token_stats['static_tokens']} static + "
+        f"{token_stats['dynamic_tokens']} dynamic tokens"
     )
-    if response.status_code == 200:
-        result = response.json()
+    with get_usage_ledger().generation('daily_insight', prompt_version) as generation:
+        result = get_model_router().complete(ROUTE_DAILY, [
+            {'role': 'system', 'content': SYSTEM_PROMPT},
+            {'role': 'user', 'content': prompt}
+        ])
         content = result['choices'][0]['message']['content']
+        usage = result.get('usage', {})
+        cached_tokens = (usage.get('prompt_tokens_details') or {}).get('cached_tokens', 0)
+        logger.info(f"Daily insight usage: {usage.get('prompt_tokens')} prompt ({cached_tokens} cached), {usage.get('completion_tokens')} completion")
         
         # Try to extract JSON from the response with multiple strategies
-        json_str = None
-        
-        # Strategy 1: Look for JSON between curly braces
         try:
-            start_idx = content.find('{')
-            end_idx = content.rfind('}') + 1
-            if start_idx != -1 and end_idx > start_idx:
-                json_str = content[start_idx:end_idx]
-                insight_data = json.loads(json_str)
-                logger.info("Successfully parsed JSON using curly brace extraction")
-                # Add metadata
-                insight_data['source'] = 'investment_assistant'
-                insight_data['generated_at'] = datetime.utcnow().isoformat()
-                insight_data['type'] = 'daily_insight'
-                return insight_data
-        except json.JSONDecodeError as e:
-            logger.warning(f"Strategy 1 failed: {e}")
-        
-        # Strategy 2: Try to clean the content and parse
-        try:
-            # Remove any markdown formatting
-            cleaned_content = content.replace('```json', '').replace('```', '').strip()
-            insight_data = json.loads(cleaned_content)
-            logger.info("Successfully parsed JSON using cleaned content")
-            # Add metadata
-            insight_data['source'] = 'investment_assistant'
-            insight_data['generated_at'] = datetime.utcnow().isoformat()
-            insight_data['type'] = 'daily_insight'
-            return insight_data
-        except json.JSONDecodeError as e:
-            logger.warning(f"Strategy 2 failed: {e}")
-        
-        # Strategy 3: Try to fix common JSON issues
-        try:
-            # Replace problematic characters and fix common issues
-            fixed_content = content
-            # Remove any text before the first {
-            start_idx = fixed_content.find('{')
-            if start_idx != -1:
-                fixed_content = fixed_content[start_idx:]
-            # Remove any text after the last }
-            end_idx = fixed_content.rfind('}')
-            if end_idx != -1:
-                fixed_content = fixed_content[:end_idx + 1]
-            
-            # Fix common Hebrew text issues
-            fixed_content = fixed_content.replace('\n', ' ').replace('\r', ' ')
-            # Remove any trailing commas before closing braces
-            import re
-            fixed_content = re.sub(r',(\s*[}\]])', r'\1', fixed_content)
-            
-            insight_data = json.loads(fixed_content)
-            logger.info("Successfully parsed JSON using fixed content")
-            # Add metadata
-            insight_data['source'] = 'investment_assistant'
-            insight_data['generated_at'] = datetime.utcnow().isoformat()
-            insight_data['type'] = 'daily_insight'
-            return insight_data
+            with stage('parse'):
+                insight_data, strategy = extract_json(content)
         except json.JSONDecodeError as e:
             logger.error(f"All JSON parsing strategies failed. Last error: {e}")
-            logger.error(f"Content received: {content[:500]}...")
+            log_payload(logger, "Content received", content, logging.ERROR)
             raise Exception(f"Failed to parse JSON from ChatGPT response after multiple attempts: {e}")
-    else:
-        logger.error(f"OpenAI API error: {response.status_code} - {response.text}")
-        raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
+        logger.info(f"Successfully parsed JSON using {strategy} strategy")
+        generation.parsed(strategy)
+        insight_data = tag_insight(finalize_daily_insight(insight_data), variant, prompt_version)
+        generation.completeness(schema_completeness(insight_data))
+        return insight_data
 
 @app.route('/api/insights/daily', methods=['GET'])
 def get_daily_insight():
     """Generate and store daily investment insight using ChatGPT"""
     try:
-        # Generate insight using ChatGPT
-        insight_data = generate_investment_insight()
-        # Store to Firestore
-        store_insight(insight_data)
-        logger.info(f"Daily insight generated and stored: {insight_data.get('timestamp', 'N/A')}")
+        insight_data = run_daily_pipeline()
         return jsonify({
             "status": "success",
             "message": "Daily insight generated successfully",
             "data": insight_data
         })
+    except CircuitOpenError as e:
+        return serve_cached_insight('daily_insight', e)
     except Exception as e:
         logger.error(f"Error generating daily insight: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -204,82 +386,189 @@ def get_recent_insights():
         logger.error(f"Error getting recent insights: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def generate_afternoon_insight(time_of_day: str = "1:00 PM"):
-    """Generate afternoon investment insight using specialized prompt"""
-    prompt = get_afternoon_prompt(time_of_day)
-    if not OPENAI_API_KEY:
-        logger.error("OpenAI API key not configured")
-        raise Exception("OpenAI API key not configured")
+def load_morning_insight():
+    """Latest daily insight, or None if it cannot be loaded"""
+    try:
+        return get_latest_insight('daily_insight')
+    except Exception as e:
+        logger.warning(f"Failed to load morning insight: {e}")
+        return None
+
+def generate_afternoon_insight(time_of_day: str = "1:00 PM", morning_insight=None, triggers=None):
+    """
+    Generate afternoon investment insight using specialized prompt.
+    The model sees a digest of the morning insight and returns only change
+    records, which are merged back into a full view here.
+    """
+    experiments = get_prompt_experiments()
+    variant = experiments.assign(KIND_AFTERNOON, f"{datetime.utcnow().strftime('%Y-%m-%d')}:{time_of_day}")
+    prompt_version = experiments.version(AFTERNOON_PROMPT_VERSION, variant)
+    prompt = experiments.apply(get_afternoon_prompt(time_of_day, morning_insight, triggers), variant)
+    messages = [
+        {'role': 'system', 'content': SYSTEM_PROMPT},
+        {'role': 'user', 'content': prompt}
+    ]
+    router = get_model_router()
+    insight_type = f'afternoon_insight_{time_of_day.replace(":", "").replace(" ", "_").lower()}'
     
-    headers = {
-        'Authorization': f'Bearer {OPENAI_API_KEY}',
-        'Content-Type': 'application/json'
-    }
-    data = {
-        'model': 'gpt-4o',
-        'messages': [
-            {
-                'role': 'system',
-                'content': 'You are a professional investment advisor specializing in Israeli and US markets. Provide precise, actionable recommendations with specific amounts and detailed analysis. Focus on market-beating opportunities, not generic advice. ALWAYS return valid JSON only, no additional text.'
-            },
-            {
-                'role': 'user',
-                'content': prompt
-            }
-        ],
-        'temperature': 0.7,
-        'max_tokens': 4000
+    with get_usage_ledger().generation(insight_type, prompt_version) as generation:
+        # Cheap first pass; only a reply that reports changes is redone by the large model.
+        # Replies that report changes are the long ones, so a truncated or unparseable
+        # first pass escalates too instead of failing the run.
+        # Triggered updates already know something happened, so they go straight to the large model.
+        delta = None
+        if router.first_pass_enabled and not triggers:
+            logger.info(f"Sending first-pass request to OpenAI for {time_of_day} update")
+            result = router.complete(ROUTE_AFTERNOON_FIRST_PASS, messages)
+            try:
+                if hit_token_limit(result):
+                    raise ValueError("first pass reply was cut off at the token limit")
+                delta = parse_afternoon_delta(result)
+            except Exception as e:
+                logger.warning(f"First pass for {time_of_day} unusable ({e}) - escalating")
+                generation.failed(e)
+            if delta is None or delta_needs_escalation(delta):
+                if delta is not None:
+                    logger.info(f"First pass for {time_of_day} reported changes - escalating")
+                router.record_escalation()
+                delta = None
+        
+        if delta is None:
+            logger.info(f"Sending request to OpenAI for {time_of_day} update")
+            delta = parse_afternoon_delta(router.complete(ROUTE_AFTERNOON, messages))
+        
+        insight_data = merge_afternoon_delta(morning_insight, delta)
+        # Add metadata
+        insight_data['source'] = 'investment_assistant'
+        insight_data['generated_at'] = datetime.utcnow().isoformat()
+        insight_data['type'] = insight_type
+        insight_data['time_of_day'] = time_of_day
+        tag_insight(insight_data, variant, prompt_version)
+        insight_data = Insight.from_dict(insight_data).to_firestore()
+        generation.completeness(schema_completeness(insight_data))
+        return insight_data
+
+@timed_stage('parse')
+def parse_afternoon_delta(result):
+    """Change records from an afternoon completion (handles markdown-fenced JSON)"""
+    content = result['choices'][0]['message']['content']
+    
+    log_payload(logger, "OpenAI afternoon response", content)
+    
+    # Parse JSON response
+    try:
+        # Handle responses wrapped in markdown code blocks
+        if content.strip().startswith('```'):
+            # Extract JSON from markdown code blocks
+            lines = content.strip().split('\n')
+            json_lines = []
+            in_json = False
+            for line in lines:
+                if line.strip().startswith('```json') or line.strip().startswith('```'):
+                    if in_json:
+                        break
+                    in_json = True
+                    continue
+                if in_json:
+                    json_lines.append(line)
+            content = '\n'.join(json_lines)
+            strategy = 'fenced'
+        else:
+            strategy = 'plain'
+        
+        delta = json.loads(content)
+        mark_parsed(strategy)
+        return delta
+    except json.JSONDecodeError as e:
+        logger.error(f"Failed to parse JSON from afternoon insight: {e}")
+        log_payload(logger, "Raw content", content, logging.ERROR)
+        raise Exception(f"Failed to parse JSON from afternoon insight: {e}")
+
+def run_afternoon_precheck(time_of_day: str, morning_insight=None):
+    """
+    Deterministic pre-check before paying for an afternoon generation.
+    Returns a skipped-update payload when nothing crossed a threshold, otherwise None.
+    """
+    if not config.get('AFTERNOON_PRECHECK', True):
+        return None
+    try:
+        today = datetime.now(ZoneInfo(config.get('TIMEZONE') or 'Asia/Jerusalem')).date()
+        result = precheck_from_history(morning_insight, get_price_history(), today=today)
+    except Exception as e:
+        logger.warning(f"Afternoon pre-check failed for {time_of_day}, falling back to LLM: {e}")
+        return None
+
+    if result.should_call_llm:
+        logger.info(f"Afternoon pre-check for {time_of_day} requires LLM: {result.reasons}")
+        return None
+
+    logger.info(f"Afternoon pre-check for {time_of_day}: no thresholds crossed - skipping LLM call")
+    return {
+        'source': 'investment_assistant',
+        'generated_at': datetime.utcnow().isoformat(),
+        'type': f'afternoon_insight_{time_of_day.replace(":", "").replace(" ", "_").lower()}',
+        'time_of_day': time_of_day,
+        'update_summary': {
+            'has_significant_changes': False,
+            'change_count': 0,
+            'priority_level': 'low'
+        },
+        'precheck': result.to_dict()
     }
+
+AFTERNOON_SLOTS = {
+    '1:00 PM': 'midday',
+    '5:00 PM': 'end-of-day',
+}
+
+def run_afternoon_pipeline(time_of_day: str) -> dict:
+    """
+    Pre-check, generate, store and email one afternoon update.
+    Returns the endpoint payload (without status); used by the HTTP endpoints and the scheduler.
+    """
+    label = AFTERNOON_SLOTS.get(time_of_day, time_of_day)
     
-    logger.info(f"Sending request to OpenAI for {time_of_day} update")
-    response = requests.post(
-        'https://api.openai.com/v1/chat/completions',
-        headers=headers,
-        json=data,
-        timeout=30
-    )
+    # Skip the LLM entirely when no price threshold was crossed
+    morning_insight = load_morning_insight()
+    skipped = run_afternoon_precheck(time_of_day, morning_insight)
+    if skipped:
+        return {
+            "message": f"No price thresholds crossed for {label} - update skipped",
+            "has_significant_changes": False,
+            "email_sent": False,
+            "data": skipped
+        }
     
-    logger.info(f"OpenAI response status: {response.status_code}")
+    # Generate afternoon insight
+    insight_data = generate_afternoon_insight(time_of_day, morning_insight)
     
-    if response.status_code == 200:
-        result = response.json()
-        content = result['choices'][0]['message']['content']
-        
-        logger.info(f"OpenAI response content length: {len(content)}")
-        logger.info(f"OpenAI response content preview: {content[:200]}...")
-        
-        # Parse JSON response
-        try:
-            # Handle responses wrapped in markdown code blocks
-            if content.strip().startswith('```'):
-                # Extract JSON from markdown code blocks
-                lines = content.strip().split('\n')
-                json_lines = []
-                in_json = False
-                for line in lines:
-                    if line.strip().startswith('```json') or line.strip().startswith('```'):
-                        if in_json:
-                            break
-                        in_json = True
-                        continue
-                    if in_json:
-                        json_lines.append(line)
-                content = '\n'.join(json_lines)
-            
-            insight_data = json.loads(content)
-            # Add metadata
-            insight_data['source'] = 'investment_assistant'
-            insight_data['generated_at'] = datetime.utcnow().isoformat()
-            insight_data['type'] = f'afternoon_insight_{time_of_day.replace(":", "").replace(" ", "_").lower()}'
-            insight_data['time_of_day'] = time_of_day
-            return insight_data
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON from afternoon insight: {e}")
-            logger.error(f"Raw content: {content}")
-            raise Exception(f"Failed to parse JSON from afternoon insight: {e}")
-    else:
-        logger.error(f"OpenAI API error for afternoon insight: {response.status_code} - {response.text}")
-        raise Exception(f"OpenAI API error for afternoon insight: {response.status_code} - {response.text}")
+    # Check if there are significant changes
+    update_summary = insight_data.get('update_summary', {})
+    if not update_summary.get('has_significant_changes', False):
+        # Don't store or send email if no significant changes
+        logger.info(f"No significant changes detected for {label} update - skipping storage and email")
+        return {
+            "message": f"No significant changes detected for {label} - update skipped",
+            "has_significant_changes": False,
+            "email_sent": False,
+            "data": insight_data
+        }
+    
+    # Store insight to Firestore
+    store_encoded_insight(insight_data)
+    
+    # Send email notification
+    email_service = EmailService()
+    email_sent = email_service.send_intelligent_update(time_of_day)
+    
+    logger.info(f"{label.capitalize()} insight generated with significant changes. Email sent: {email_sent}")
+    
+    return {
+        "message": f"{label.capitalize()} insight generated and email sent",
+        "has_significant_changes": True,
+        "email_sent": email_sent,
+        "data": insight_data
+    }
 
 @app.route('/api/insights/afternoon/midday', methods=['GET'])
 def get_midday_insight():
@@ -289,42 +578,11 @@ def get_midday_insight():
         if not config.get('AFTERNOON_UPDATE_1PM', True):
             return jsonify({'error': 'Midday updates are disabled'}), 400
         
-        # Generate afternoon insight
-        insight_data = generate_afternoon_insight("1:00 PM")
-        
-        # Check if there are significant changes
-        update_summary = insight_data.get('update_summary', {})
-        has_significant_changes = update_summary.get('has_significant_changes', False)
-        
-        if has_significant_changes:
-            # Store insight to Firestore
-            store_insight(insight_data)
-            
-            # Send email notification
-            email_service = EmailService()
-            email_sent = email_service.send_intelligent_update("1:00 PM")
-            
-            logger.info(f"Midday insight generated with significant changes. Email sent: {email_sent}")
-            
-            return jsonify({
-                "status": "success",
-                "message": "Midday insight generated and email sent",
-                "has_significant_changes": True,
-                "email_sent": email_sent,
-                "data": insight_data
-            })
-        else:
-            # Don't store or send email if no significant changes
-            logger.info("No significant changes detected for midday update - skipping storage and email")
-            
-            return jsonify({
-                "status": "success",
-                "message": "No significant changes detected for midday - update skipped",
-                "has_significant_changes": False,
-                "email_sent": False,
-                "data": insight_data
-            })
+        result = run_afternoon_pipeline("1:00 PM")
+        return jsonify({"status": "success", **result})
             
+    except CircuitOpenError as e:
+        return serve_cached_insight('afternoon_insight_100_pm', e)
     except Exception as e:
         logger.error(f"Error generating midday insight: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -337,46 +595,475 @@ def get_end_of_day_insight():
         if not config.get('AFTERNOON_UPDATE_5PM', True):
             return jsonify({'error': 'End-of-day updates are disabled'}), 400
         
-        # Generate afternoon insight
-        insight_data = generate_afternoon_insight("5:00 PM")
-        
-        # Check if there are significant changes
-        update_summary = insight_data.get('update_summary', {})
-        has_significant_changes = update_summary.get('has_significant_changes', False)
-        
-        if has_significant_changes:
-            # Store insight to Firestore
-            store_insight(insight_data)
-            
-            # Send email notification
-            email_service = EmailService()
-            email_sent = email_service.send_intelligent_update("5:00 PM")
-            
-            logger.info(f"End-of-day insight generated with significant changes. Email sent: {email_sent}")
-            
-            return jsonify({
-                "status": "success",
-                "message": "End-of-day insight generated and email sent",
-                "has_significant_changes": True,
-                "email_sent": email_sent,
-                "data": insight_data
-            })
-        else:
-            # Don't store or send email if no significant changes
-            logger.info("No significant changes detected for end-of-day update - skipping storage and email")
-            
-            return jsonify({
-                "status": "success",
-                "message": "No significant changes detected for end-of-day - update skipped",
-                "has_significant_changes": False,
-                "email_sent": False,
-                "data": insight_data
-            })
+        result = run_afternoon_pipeline("5:00 PM")
+        return jsonify({"status": "success", **result})
             
+    except CircuitOpenError as e:
+        return serve_cached_insight('afternoon_insight_500_pm', e)
     except Exception as e:
         logger.error(f"Error generating end-of-day insight: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+_trigger_engine = None
+_trigger_provider = None
+
+def get_trigger_engine():
+    """Process-wide trigger engine and feed provider, configured from TRIGGER_* settings"""
+    global _trigger_engine, _trigger_provider
+    if _trigger_engine is None:
+        _trigger_provider = get_provider(config, get_price_history)
+        _trigger_engine = TriggerEngine(TriggerRules(
+            stop_proximity_pct=config.get('TRIGGER_STOP_PROXIMITY_PCT', 1.0),
+            volume_spike_ratio=config.get('TRIGGER_VOLUME_SPIKE_RATIO', 3.0),
+            debounce_seconds=config.get('TRIGGER_DEBOUNCE_SECONDS', 1800),
+            max_updates_per_hour=config.get('TRIGGER_MAX_UPDATES_PER_HOUR', 2),
+            hysteresis_pct=config.get('TRIGGER_HYSTERESIS_PCT', 0.5)
+        ))
+    return _trigger_engine, _trigger_provider
+
+def run_triggered_update(events):
+    """
+    Targeted update for the symbols whose thresholds fired. Builds on today's
+    previous triggered update when there is one, so earlier changes are kept.
+    Like the scheduled afternoon updates, it is stored and emailed only when
+    the model reports significant changes.
+    """
+    base = get_latest_insight('afternoon_insight_triggered')
+    if not base or str(base.get('generated_at', ''))[:10] != datetime.utcnow().strftime('%Y-%m-%d'):
+        base = load_morning_insight()
+    insight_data = generate_afternoon_insight("triggered", base, [e['detail'] for e in events])
+    insight_data['triggers'] = events
+    update_summary = insight_data.get('update_summary') or {}
+    
+    if not update_summary.get('has_significant_changes', False):
+        logger.info("No significant changes in triggered update - skipping storage and email")
+        return {
+            'type': insight_data.get('type'),
+            'has_significant_changes': False,
+            'change_count': 0,
+            'email_sent': False
+        }
+    
+    store_encoded_insight(insight_data)
+    email_sent = EmailService().send_intelligent_update("triggered")
+    logger.info(f"Triggered update stored with significant changes. Email sent: {email_sent}")
+    return {
+        'type': insight_data.get('type'),
+        'has_significant_changes': True,
+        'change_count': update_summary.get('change_count', 0),
+        'email_sent': email_sent
+    }
+
+@app.route('/api/triggers/poll', methods=['POST'])
+def poll_triggers():
+    """Poll the price feed once and start a targeted update if a threshold was crossed"""
+    try:
+        engine, provider = get_trigger_engine()
+        morning_insight = load_morning_insight()
+        if hasattr(provider, 'baseline_volumes') and morning_insight:
+            symbols = [r.get('symbol') for r in morning_insight.get('recommendations') or []]
+            engine.set_volume_baselines(provider.baseline_volumes(symbols))
+        
+        result = engine.poll_once(provider, morning_insight, run_triggered_update)
+        
+        return jsonify({
+            'status': 'success',
+            **result,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error polling triggers: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def run_daily_pipeline():
+    """Generate and store the daily insight; used by the HTTP endpoint and the scheduler"""
+    insight_data = generate_investment_insight()
+    store_encoded_insight(insight_data)
+    logger.info(f"Daily insight generated and stored: {insight_data.get('generated_at', 'N/A')}")
+    return insight_data
+
+_scheduler = None
+
+def get_scheduler():
+    """Scheduler wired to the three pipelines, recording runs in Firestore"""
+    global _scheduler
+    if _scheduler is None:
+        pipelines = {
+            'daily': run_daily_pipeline,
+            'midday': lambda: run_afternoon_pipeline("1:00 PM"),
+            'end_of_day': lambda: run_afternoon_pipeline("5:00 PM"),
+        }
+        _scheduler = Scheduler(
+            build_jobs(pipelines, config),
+            timezone=config.get('TIMEZONE') or 'Asia/Jerusalem',
+            save_run=save_scheduler_run,
+            load_last_run=lambda job: get_document(RUNS_COLLECTION, f"{job}_last")
+        )
+    return _scheduler
+
+def save_scheduler_run(record):
+    """Keep every run for history plus a per-job last-run document for misfire detection"""
+    set_document(RUNS_COLLECTION, f"{record['job']}_{record['scheduled_for']}", record)
+    set_document(RUNS_COLLECTION, f"{record['job']}_last", record)
+
+@app.route('/api/scheduler/status', methods=['GET'])
+def get_scheduler_status():
+    """Next run time per job and recent run history of the in-process scheduler"""
+    try:
+        scheduler = get_scheduler()
+        return jsonify({
+            'status': 'success',
+            'mode': config.get('SCHEDULER_MODE', 'external'),
+            'timezone': scheduler.tz.key,
+            'jobs': {
+                job.name: {
+                    'at': job.at,
+                    'enabled': job.enabled,
+                    'next_run': job.next_run(scheduler.now(), scheduler.tz).isoformat()
+                }
+                for job in scheduler.jobs.values()
+            },
+            'history': list(scheduler.history)[-20:]
+        })
+    except Exception as e:
+        logger.error(f"Error getting scheduler status: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/backtest', methods=['GET'])
+def get_backtest():
+    """Backtest all stored daily recommendations against cached price history"""
+    try:
+        history = get_price_history()
+        if history is None:
+            return jsonify({'error': 'No price history configured (MARKET_DATA_CACHE)'}), 400
+        
+        group_by = request.args.get('group_by')
+        group_fields = [f for f in group_by.split(',') if f in GROUP_FIELDS] if group_by else GROUP_FIELDS
+        
+        # Archived insights keep only a tombstone in Firestore, so read their recommendations from the archive
+        insights = itertools.chain(
+            stream_insights('daily_insight'),
+            iter_archived_insights(get_archive_backend(config), insight_type='daily_insight')
+        )
+        recs = load_recommendations(insights)
+        result = run_backtest(recs, history)
+        
+        return jsonify({
+            'status': 'success',
+            'recommendations': len(recs),
+            'price_history_end': str(history.dates[-1]) if len(history.dates) else None,
+            'summary': result.summary(group_fields),
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error running backtest: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tracker/update', methods=['POST'])
+def update_tracker():
+    """Incrementally mark open recommendations to market and write today's snapshot"""
+    try:
+        history = get_price_history()
+        if history is None:
+            return jsonify({'error': 'No price history configured (MARKET_DATA_CACHE)'}), 400
+        
+        snapshot = run_tracker_update(
+            load_state=lambda: get_document(TRACKER_COLLECTION, TRACKER_DOCUMENT),
+            save_state=lambda doc: set_document(TRACKER_COLLECTION, TRACKER_DOCUMENT, doc),
+            fetch_insights_since=lambda watermark: get_insights_since(watermark, 'daily_insight'),
+            save_snapshot=lambda date, doc: set_document(SNAPSHOT_COLLECTION, date, doc),
+            history=history
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'snapshot': snapshot
+        })
+        
+    except Exception as e:
+        logger.error(f"Error updating position tracker: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tracker/snapshot', methods=['GET'])
+def get_tracker_snapshot():
+    """Get the performance snapshot for a date (defaults to the open-positions state)"""
+    try:
+        date = request.args.get('date')
+        if date:
+            snapshot = get_document(SNAPSHOT_COLLECTION, date)
+            if not snapshot:
+                return jsonify({'error': f'No snapshot for {date}'}), 404
+            return jsonify({'status': 'success', 'snapshot': snapshot})
+        
+        state = get_document(TRACKER_COLLECTION, TRACKER_DOCUMENT) or {}
+        return jsonify({
+            'status': 'success',
+            'open_positions': state.get('count', 0),
+            'watermark': state.get('watermark'),
+            'updated_at': state.get('updated_at')
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting tracker snapshot: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/simulation/portfolio', methods=['GET'])
+def get_portfolio_simulation():
+    """Monte Carlo simulation of the contribution schedule and strategy allocation"""
+    try:
+        initial = request.args.get('initial', config.get('INITIAL_INVESTMENT', 30000), type=float)
+        monthly = request.args.get('monthly', config.get('MONTHLY_INVESTMENT', 2000), type=float)
+        years = min(request.args.get('years', DEFAULT_YEARS, type=int), MAX_YEARS)
+        paths = min(request.args.get('paths', DEFAULT_PATHS, type=int), MAX_PATHS)
+        risk_level = request.args.get('risk_level', config.get('RISK_LEVEL', 'HIGH')).upper()
+        method = request.args.get('method', 'parametric')
+        
+        if method not in ('parametric', 'bootstrap'):
+            return jsonify({'error': f'Unknown simulation method: {method}'}), 400
+        if years <= 0 or paths <= 0:
+            return jsonify({'error': 'years and paths must be positive'}), 400
+        
+        history_key = None
+        if method == 'bootstrap':
+            history = get_price_history()
+            history_key = str(history.dates[-1]) if history is not None and len(history.dates) else None
+        
+        result = simulate_cached(initial, monthly, years, paths, risk_level, method, history_key)
+        
+        return jsonify({
+            'status': 'success',
+            'simulation': result,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error running portfolio simulation: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+_shared_context_cache = None
+
+def get_shared_context_cache():
+    """Per-day shared market context for multi-profile generation, backed by Firestore"""
+    global _shared_context_cache
+    if _shared_context_cache is None:
+        _shared_context_cache = SharedContextCache(
+            lambda day: get_document(SHARED_CONTEXT_COLLECTION, day),
+            lambda day, shared: set_document(SHARED_CONTEXT_COLLECTION, day, shared)
+        )
+    return _shared_context_cache
+
+@app.route('/api/profiles/<profile_id>/insight', methods=['GET'])
+def get_profile_insight(profile_id):
+    """A profile's insight for a day (default today), composed from the shared context and its overlay"""
+    try:
+        day = request.args.get('date') or datetime.utcnow().strftime('%Y-%m-%d')
+        insight = load_profile_insight(profile_id, day, get_shared_context_cache(),
+                                       lambda doc_id: get_document(PROFILE_INSIGHTS_COLLECTION, doc_id))
+        if insight is None:
+            return jsonify({'error': f'No insight for profile {profile_id} on {day}'}), 404
+        
+        return jsonify({'status': 'success', 'data': insight})
+    except Exception as e:
+        logger.error(f"Error loading profile insight: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/usage/summary', methods=['GET'])
+def get_usage_summary():
+    """LLM tokens, cost, latency and outcomes per day and insight type (or ?group_by=route,model,...)"""
+    try:
+        days = min(int(request.args.get('days', 7)), 90)
+        group_by = [f.strip() for f in request.args.get('group_by', 'day,insight_type').split(',') if f.strip()]
+        records = get_usage_ledger().records_since(days)
+        return jsonify({
+            'status': 'success',
+            'days': days,
+            'group_by': group_by,
+            'record_count': len(records),
+            'groups': aggregate(records, group_by)
+        })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error building usage summary: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/experiments/report', methods=['GET'])
+def get_experiment_report():
+    """Prompt variants compared on output tokens, latency, parse failures and schema completeness"""
+    try:
+        days = min(int(request.args.get('days', 14)), 90)
+        return jsonify({
+            'status': 'success',
+            'days': days,
+            'experiments': get_prompt_experiments().to_dict(),
+            'report': experiment_report(get_usage_ledger().records_since(days))
+        })
+    except Exception as e:
+        logger.error(f"Error building experiment report: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/profiling/recent', methods=['GET'])
+def get_recent_profiles():
+    """Most recent request profiles with endpoint, duration and stage timings"""
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+        return jsonify({'status': 'success', 'profiles': get_profile_store().recent(limit)})
+    except Exception as e:
+        logger.error(f"Error listing profiles: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/profiling/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """One profile's metadata and top functions; ?format=folded or ?format=pstats downloads the raw data"""
+    try:
+        store = get_profile_store()
+        meta = store.get(profile_id)
+        if meta is None:
+            return jsonify({'error': f'Profile {profile_id} not found'}), 404
+        
+        file_format = request.args.get('format')
+        if file_format in ('folded', 'pstats'):
+            path = store.path(profile_id, '.folded' if file_format == 'folded' else '.prof')
+            if not os.path.exists(path):
+                return jsonify({'error': f'No {file_format} data for profile {profile_id}'}), 404
+            return send_file(os.path.abspath(path), as_attachment=True)
+        return jsonify({'status': 'success', 'profile': meta})
+    except Exception as e:
+        logger.error(f"Error loading profile: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/llm/routes', methods=['GET'])
+def get_llm_routes():
+    """Model routing policy with per-route latency and token stats"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'routing': get_model_router().stats(),
+            'client': get_llm_client().stats()
+        })
+    except Exception as e:
+        logger.error(f"Error getting LLM route stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/prompts/daily/segments', methods=['GET'])
+def get_daily_prompt_segments():
+    """Token counts per daily prompt segment (static prefix vs dynamic tail)"""
+    try:
+        market_facts = get_market_facts(get_price_history(), config.get('SCREENER_TOP_K', 10))
+        excluded_symbols = get_novelty_window().exclusion_list(day=datetime.utcnow().strftime('%Y-%m-%d'))
+        token_stats = measure_segments(get_prompt_segments(market_facts=market_facts, excluded_symbols=excluded_symbols))
+        return jsonify({
+            'status': 'success',
+            'prompt_version': PROMPT_VERSION,
+            'tokens': token_stats,
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error measuring prompt segments: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/insights/search', methods=['GET'])
+def search_insights():
+    """Ranked full-text search over stored insights (Hebrew-aware)"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Missing query parameter q'}), 400
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        
+        index = get_search_index(config.get('SEARCH_INDEX_DIR', 'data/search_index'))
+        started = datetime.now()
+        results = index.search(query, limit=limit, insight_type=request.args.get('type'))
+        
+        return jsonify({
+            'status': 'success',
+            'query': query,
+            'results': results,
+            'indexed_insights': len(index),
+            'took_ms': round((datetime.now() - started).total_seconds() * 1000, 2)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error searching insights: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/insights/search/rebuild', methods=['POST'])
+def rebuild_search_index():
+    """Backfill the search index from every insight in Firestore (already indexed ids are skipped)"""
+    try:
+        index = get_search_index(config.get('SEARCH_INDEX_DIR', 'data/search_index'))
+        added = 0
+        for insight_type in ('daily_insight', 'afternoon_insight_100_pm', 'afternoon_insight_500_pm', 'afternoon_insight_triggered'):
+            added += index.add_insights(get_insights_since(None, insight_type))
+        index.save()
+        
+        return jsonify({
+            'status': 'success',
+            'added': added,
+            'indexed_insights': len(index)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error rebuilding search index: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/archive/run', methods=['POST'])
+def run_archive():
+    """Move insights older than ARCHIVE_AFTER_DAYS to cold storage, leaving tombstones"""
+    try:
+        days = request.args.get('days', config.get('ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS), type=int)
+        dry_run = request.args.get('dry_run', 'false').lower() == 'true'
+        if days <= 0:
+            return jsonify({'error': 'days must be positive'}), 400
+        
+        result = archive_insights(
+            fetch_insights_before=stream_insights_before,
+            replace_with_tombstones=replace_insights,
+            backend=get_archive_backend(config),
+            archive_after_days=days,
+            dry_run=dry_run
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'archive': result,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error archiving insights: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/archive/insights', methods=['GET'])
+def get_archived_insights():
+    """Read archived insights for a date range (YYYY-MM-DD)"""
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        
+        insights = iter_archived_insights(
+            get_archive_backend(config),
+            start=date.fromisoformat(start) if start else None,
+            end=date.fromisoformat(end) if end else None,
+            insight_type=request.args.get('type')
+        )
+        
+        return jsonify({
+            'status': 'success',
+            'insights': list(itertools.islice(insights, limit))
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reading archived insights: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/email/test', methods=['POST'])
 def test_email():
     """Test email functionality"""
@@ -424,6 +1111,15 @@ def get_config_status():
 
 
 
+def start_in_process_scheduler():
+    """
+    Start the background scheduler when SCHEDULER_MODE=in_process. Called from
+    the server entry points only (gunicorn.conf.py and __main__), never on
+    import, so CLIs that import this module do not start a second scheduler.
+    """
+    if config.get('SCHEDULER_MODE', 'external') == 'in_process':
+        get_scheduler().start_background()
+
 @app.errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
@@ -438,10 +1134,15 @@ def internal_error(error):
 if __name__ == '__main__':
     # Get port from environment or default to 8080
     port = int(os.environ.get('PORT', 8080))
+    debug = os.environ.get('FLASK_ENV') == 'development'
+    
+    # The debug reloader imports the app twice; only the serving child runs the scheduler
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_in_process_scheduler()
     
     # Run the app
     app.run(
         host='0.0.0.0',
         port=port,
-        debug=os.environ.get('FLASK_ENV') == 'development'
+        debug=debug
     ) 
\ No newline at end of file
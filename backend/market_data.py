@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Market Data Cache for Investment Assistant
+Loads cached daily price/volume history as dense NumPy arrays (symbols x days)
+"""
+
+import os
+import re
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+class PriceHistory:
+    """
+    Daily OHLCV history for a universe of symbols.
+
+    Every field is a float array of shape (n_symbols, n_days) aligned on
+    `dates`; missing bars are NaN.
+    """
+
+    __slots__ = ('symbols', 'dates', 'open', 'high', 'low', 'close', 'volume', '_index')
+
+    def __init__(self, symbols, dates, open, high, low, close, volume):
+        self.symbols = np.asarray(symbols, dtype=str)
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.open = np.asarray(open, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        self.volume = np.asarray(volume, dtype=np.float64)
+        self._index = {symbol: i for i, symbol in enumerate(self.symbols.tolist())}
+
+        shape = (len(self.symbols), len(self.dates))
+        for field in PRICE_FIELDS:
+            if getattr(self, field).shape != shape:
+                raise ValueError(f"Price field '{field}' has shape {getattr(self, field).shape}, expected {shape}")
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def index_of(self, symbol: str) -> Optional[int]:
+        """Row index of a symbol, or None if it is not in the universe"""
+        return self._index.get(normalize_symbol(symbol))
+
+    def rows_for(self, symbols: List[str]) -> np.ndarray:
+        """Row indices for a list of symbols, -1 where the symbol is unknown"""
+        return np.array([self._index.get(normalize_symbol(s), -1) for s in symbols], dtype=np.int64)
+
+    def latest_close(self) -> np.ndarray:
+        """Last non-NaN close per symbol"""
+        return _last_valid(self.close)
+
+    def latest_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """Map of symbol -> last close for the requested symbols that have data"""
+        rows = self.rows_for(symbols)
+        last = self.latest_close()
+        prices = {}
+        for symbol, row in zip(symbols, rows):
+            if row >= 0 and not np.isnan(last[row]):
+                prices[normalize_symbol(symbol)] = float(last[row])
+        return prices
+
+
+def _last_valid(values: np.ndarray) -> np.ndarray:
+    """Last non-NaN value along the time axis for each row"""
+    valid = ~np.isnan(values)
+    last_idx = values.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    result = values[np.arange(values.shape[0]), last_idx]
+    result[~valid.any(axis=1)] = np.nan
+    return result
+
+
+def normalize_symbol(symbol) -> str:
+    """Upper-case a ticker and strip exchange decorations like '$' or whitespace"""
+    return str(symbol or '').strip().lstrip('$').upper()
+
+
+def parse_number(value) -> Optional[float]:
+    """
+    Parse a number out of an LLM-formatted value.
+    Handles "750", "$750", "1,250.5 ₪", "15%" and plain numbers; returns None otherwise.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if np.isfinite(value) else None
+    match = _NUMBER_RE.search(str(value).replace(',', ''))
+    return float(match.group()) if match else None
+
+
+def load_price_history(path: str) -> PriceHistory:
+    """
+    Load a price cache written with `save_price_history`.
+    The file is an .npz archive with `symbols`, `dates` and one array per OHLCV field.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        return PriceHistory(
+            symbols=data['symbols'],
+            dates=data['dates'],
+            **{field: data[field] for field in PRICE_FIELDS}
+        )
+
+
+def save_price_history(history: PriceHistory, path: str) -> None:
+    """Write a price cache as a compressed .npz archive"""
+    np.savez_compressed(
+        path,
+        symbols=history.symbols,
+        dates=history.dates,
+        **{field: getattr(history, field) for field in PRICE_FIELDS}
+    )
+
+
+_history_cache = {}
+
+
+def get_price_history(path: Optional[str] = None) -> Optional[PriceHistory]:
+    """
+    Get the cached price history, reloading only when the file changes.
+    Returns None when no cache is configured or the file is missing.
+    """
+    if path is None:
+        from config_service import config_service
+        path = config_service.get('MARKET_DATA_CACHE')
+    if not path or not os.path.exists(path):
+        return None
+
+    try:
+        mtime = os.path.getmtime(path)
+        cached = _history_cache.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        history = load_price_history(path)
+        _history_cache[path] = (mtime, history)
+        logger.info(f"Loaded price history: {len(history)} symbols x {len(history.dates)} days")
+        return history
+    except Exception as e:
+        logger.warning(f"Failed to load price history from {path}: {e}")
+        return None
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Model Router for Investment Assistant
+Picks model, token limit and timeout per insight type from a config policy,
+with a cheap first pass that escalates only when needed, and per-route stats
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from profiling import stage
+from usage_ledger import build_record
+
+logger = logging.getLogger(__name__)
+
+ROUTE_DAILY = 'daily_insight'
+ROUTE_AFTERNOON_FIRST_PASS = 'afternoon_first_pass'
+ROUTE_AFTERNOON = 'afternoon'
+ROUTE_SHARED_CONTEXT = 'shared_context'
+ROUTE_PROFILE_OVERLAY = 'profile_overlay'
+
+DEFAULT_POLICY = {
+    ROUTE_DAILY: {'model': 'gpt-4o', 'max_tokens': 4000, 'timeout': 30, 'temperature': 0.7},
+    # Most afternoon checks end in "no significant changes"; a small model can tell
+    ROUTE_AFTERNOON_FIRST_PASS: {'model': 'gpt-4o-mini', 'max_tokens': 800, 'timeout': 15, 'temperature': 0.3},
+    # Afternoon replies are change records only, so they need far fewer tokens than the daily insight
+    ROUTE_AFTERNOON: {'model': 'gpt-4o', 'max_tokens': 1500, 'timeout': 30, 'temperature': 0.7},
+    # Multi-profile generation: the market analysis once per day, then a small sizing call per profile
+    ROUTE_SHARED_CONTEXT: {'model': 'gpt-4o', 'max_tokens': 3500, 'timeout': 45, 'temperature': 0.7},
+    ROUTE_PROFILE_OVERLAY: {'model': 'gpt-4o-mini', 'max_tokens': 700, 'timeout': 20, 'temperature': 0.3},
+}
+
+LATENCY_SAMPLES = 200
+
+
+def load_policy(overrides=None) -> Dict[str, Dict]:
+    """Default policy with per-route overrides from config (a dict or a JSON string)"""
+    if isinstance(overrides, str):
+        overrides = json.loads(overrides) if overrides.strip() else {}
+    policy = {route: dict(settings) for route, settings in DEFAULT_POLICY.items()}
+    for route, settings in (overrides or {}).items():
+        policy.setdefault(route, {}).update(settings)
+    return policy
+
+
+def delta_needs_escalation(delta: Dict) -> bool:
+    """A first-pass afternoon reply that reports any change is redone by the large model"""
+    summary = delta.get('update_summary') or {}
+    return bool(summary.get('has_significant_changes') or delta.get('changes') or delta.get('alerts'))
+
+
+def hit_token_limit(result: Dict) -> bool:
+    """The reply was cut off at max_tokens, so its JSON is incomplete"""
+    return ((result.get('choices') or [{}])[0].get('finish_reason')) == 'length'
+
+
+class RouteStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def to_dict(self) -> Dict:
+        latencies = sorted(self.latencies)
+
+        def pct(p):
+            return round(latencies[min(len(latencies) - 1, int(p / 100.0 * len(latencies)))], 3) if latencies else None
+
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'avg_completion_tokens': round(self.completion_tokens / max(self.calls - self.errors, 1), 1),
+            'latency_p50_seconds': pct(50),
+            'latency_p95_seconds': pct(95),
+        }
+
+
+class ModelRouter:
+    def __init__(self, client, policy: Optional[Dict[str, Dict]] = None, first_pass_enabled: bool = True,
+                 ledger=None):
+        self.client = client
+        self.ledger = ledger
+        self.policy = policy or load_policy()
+        self.first_pass_enabled = first_pass_enabled
+        self.escalations = 0
+        self._stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def route(self, name: str) -> Dict:
+        if name not in self.policy:
+            raise ValueError(f"No model routing policy for route: {name}")
+        return self.policy[name]
+
+    def complete(self, name: str, messages: List[Dict]) -> Dict:
+        """Chat completion with the route's model, token limit and timeout; records latency and tokens"""
+        settings = self.route(name)
+        started = time.monotonic()
+        try:
+            with stage(f"llm:{name}"):
+                result = self.client.chat(
+                    messages,
+                    model=settings['model'],
+                    temperature=settings.get('temperature', 0.7),
+                    max_tokens=settings['max_tokens'],
+                    timeout=settings.get('timeout', 30),
+                    latency_key=name
+                )
+        except Exception as e:
+            self._record(name, time.monotonic() - started, None, e)
+            raise
+        self._record(name, time.monotonic() - started, result.get('usage') or {})
+        return result
+
+    def _record(self, name: str, seconds: float, usage: Optional[Dict], error: Optional[Exception] = None) -> None:
+        if self.ledger is not None:
+            attempts = getattr(self.client, 'last_attempts', lambda: 1)()
+            loser_usage = getattr(self.client, 'last_loser_usage', lambda: None)()
+            self.ledger.record_call(build_record(
+                name, self.policy[name]['model'], usage, seconds, max(attempts - 1, 0),
+                f"{type(error).__name__}: {error}" if error is not None else None, loser_usage
+            ))
+        with self._lock:
+            stats = self._stats.setdefault(name, RouteStats())
+            stats.calls += 1
+            if usage is None:
+                stats.errors += 1
+                return
+            stats.latencies.append(seconds)
+            stats.prompt_tokens += usage.get('prompt_tokens', 0) or 0
+            stats.completion_tokens += usage.get('completion_tokens', 0) or 0
+        logger.info(
+            f"LLM route {name} ({self.policy[name]['model']}): {seconds:.2f}s, "
+            f"{usage.get('prompt_tokens')} prompt / {usage.get('completion_tokens')} completion tokens"
+        )
+
+    def record_escalation(self) -> None:
+        with self._lock:
+            self.escalations += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'policy': self.policy,
+                'first_pass_enabled': self.first_pass_enabled,
+                'escalations': self.escalations,
+                'routes': {name: stats.to_dict() for name, stats in self._stats.items()},
+            }
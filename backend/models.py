@@ -0,0 +1,407 @@
+# -*- coding: utf-8 -*-
+"""
+Insight Models for Investment Assistant
+Typed, slotted mirrors of app/src/types/insights.ts with one-pass validation
+and numeric coercion of LLM output
+"""
+
+import logging
+from dataclasses import dataclass, field, fields
+from typing import Any, Callable, Dict, List, Optional
+
+from market_data import normalize_symbol, parse_number
+
+logger = logging.getLogger(__name__)
+
+# Allowed enum values: the Hebrew literals from insights.ts plus the English
+# values the afternoon schema uses
+SENTIMENTS = {'חיובי', 'שלילי', 'ניטרלי', 'bullish', 'bearish', 'neutral'}
+ACTIONS = {'לקנות', 'למכור', 'להחזיק', 'buy', 'sell', 'hold'}
+LEVELS = {'גבוה', 'בינוני', 'נמוך', 'high', 'medium', 'low'}
+TERMS = {'קצר טווח', 'ארוך טווח'}
+SECTOR_ACTIONS = {'לקנות', 'להחזיק', 'להימנע'}
+ALERT_TYPES = {'רווחים', 'חדשות', 'טכני'}
+URGENCIES = {'דחוף', 'בינוני', 'לא דחוף'}
+
+
+class InsightValidationError(ValueError):
+    """Raised when LLM output drifts from the insight schema"""
+
+    def __init__(self, path: str, message: str):
+        self.path = path
+        super().__init__(f"{path}: {message}")
+
+
+class _Parser:
+    """
+    Carries strictness through one validation pass. In strict mode an
+    off-schema scalar (unknown enum value, unparseable number) is dropped and
+    a broken list item is skipped, each noted in `issues`, rather than failing
+    the whole insight.
+    """
+
+    __slots__ = ('strict', 'issues')
+
+    def __init__(self, strict: bool):
+        self.strict = strict
+        self.issues: List[str] = []
+
+    def each(self, parse: Callable, values, path: str) -> List:
+        """Parse every list item, skipping (and noting) items that fail validation"""
+        parsed = []
+        for i, value in enumerate(self.items(values, path)):
+            try:
+                parsed.append(parse(value, f"{path}[{i}]", self))
+            except InsightValidationError as e:
+                self.issues.append(f"dropped {path}[{i}] ({e})")
+        return parsed
+
+    def obj(self, value, path: str) -> Dict:
+        if value is None:
+            return {}
+        if not isinstance(value, dict):
+            raise InsightValidationError(path, f"expected object, got {type(value).__name__}")
+        return value
+
+    def items(self, value, path: str) -> List:
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            raise InsightValidationError(path, f"expected list, got {type(value).__name__}")
+        return value
+
+    def text(self, value, path: str, required: bool = False) -> Optional[str]:
+        if value is None or value == '':
+            if required and self.strict:
+                raise InsightValidationError(path, "required field is missing")
+            return None
+        if isinstance(value, (dict, list)):
+            raise InsightValidationError(path, f"expected text, got {type(value).__name__}")
+        return str(value).strip()
+
+    def texts(self, value, path: str) -> List[str]:
+        if isinstance(value, str):
+            return [value]
+        return [str(v) for v in self.items(value, path) if v not in (None, '')]
+
+    def number(self, value, path: str) -> Optional[float]:
+        if value is None or value == '':
+            return None
+        number = parse_number(value)
+        if number is None and self.strict:
+            self.issues.append(f"dropped {path}: expected a number, got {value!r}")
+        return number
+
+    def enum(self, value, allowed: set, path: str) -> Optional[str]:
+        text = self.text(value, path)
+        if text is None:
+            return None
+        if text in allowed:
+            return text
+        lowered = text.lower()
+        if lowered in allowed:
+            return lowered
+        if self.strict:
+            self.issues.append(f"dropped {path}: unexpected value {text!r}")
+            return None
+        return text
+
+
+def _clean(value):
+    """Recursively turn models into Firestore-ready dicts, dropping empty optionals"""
+    if hasattr(value, '__dataclass_fields__'):
+        result = {}
+        for f in fields(value):
+            item = getattr(value, f.name)
+            if f.name == 'extras':
+                result.update(item)
+                continue
+            if item is None:
+                continue
+            result[f.name] = _clean(item)
+        return result
+    if isinstance(value, list):
+        return [_clean(v) for v in value]
+    return value
+
+
+class _Model:
+    __slots__ = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return _clean(self)
+
+
+@dataclass(slots=True)
+class KeyEvent(_Model):
+    event: str
+    importance: Optional[str] = None
+    impact: Optional[str] = None
+
+    @classmethod
+    def parse(cls, data, path: str, p: _Parser) -> 'KeyEvent':
+        if isinstance(data, str):
+            return cls(event=data)
+        data = p.obj(data, path)
+        return cls(
+            event=p.text(data.get('event'), f"{path}.event", required=True) or '',
+            importance=p.text(data.get('importance'), f"{path}.importance"),
+            impact=p.text(data.get('impact'), f"{path}.impact"),
+        )
+
+
+@dataclass(slots=True)
+class MarketOverview(_Model):
+    summary: Optional[str] = None
+    sentiment: Optional[str] = None
+    key_events: List[KeyEvent] = field(default_factory=list)
+    trending_sectors: List[str] = field(default_factory=list)
+    action_items: List[str] = field(default_factory=list)
+    changes_since_morning: Optional[str] = None
+
+    @classmethod
+    def parse(cls, data, path: str, p: _Parser) -> 'MarketOverview':
+        data = p.obj(data, path)
+        events = data.get('key_events')
+        if isinstance(events, str):
+            # Afternoon schema sends a single free-text string
+            events = [events] if events else []
+        return cls(
+            summary=p.text(data.get('summary'), f"{path}.summary"),
+            sentiment=p.enum(data.get('sentiment'), SENTIMENTS, f"{path}.sentiment"),
+            key_events=p.each(KeyEvent.parse, events, f"{path}.key_events"),
+            trending_sectors=p.texts(data.get('trending_sectors'), f"{path}.trending_sectors"),
+            action_items=p.texts(data.get('action_items'), f"{path}.action_items"),
+            changes_since_morning=p.text(data.get('changes_since_morning'), f"{path}.changes_since_morning"),
+        )
+
+
+@dataclass(slots=True)
+class Recommendation(_Model):
+    symbol: str
+    action: Optional[str] = None
+    action_hebrew: Optional[str] = None
+    amount_ils: Optional[float] = None
+    percentage_of_portfolio: Optional[float] = None
+    current_price: Optional[float] = None
+    target_price: Optional[float] = None
+    stop_loss: Optional[float] = None
+    confidence: Optional[str] = None
+    reason: Optional[str] = None
+    timeframe: Optional[str] = None
+    risks: Optional[str] = None
+    why_despite_risks: Optional[str] = None
+    type: Optional[str] = None
+    catalyst: Optional[str] = None
+    change: Optional[str] = None
+
+    @classmethod
+    def parse(cls, data, path: str, p: _Parser) -> 'Recommendation':
+        data = p.obj(data, path)
+        symbol = p.text(data.get('symbol'), f"{path}.symbol", required=True)
+        return cls(
+            symbol=normalize_symbol(symbol),
+            action=p.enum(data.get('action'), ACTIONS, f"{path}.action"),
+            action_hebrew=p.text(data.get('action_hebrew'), f"{path}.action_hebrew"),
+            amount_ils=p.number(data.get('amount_ils'), f"{path}.amount_ils"),
+            percentage_of_portfolio=p.number(data.get('percentage_of_portfolio'), f"{path}.percentage_of_portfolio"),
+            current_price=p.number(data.get('current_price'), f"{path}.current_price"),
+            target_price=p.number(data.get('target_price'), f"{path}.target_price"),
+            stop_loss=p.number(data.get('stop_loss'), f"{path}.stop_loss"),
+            confidence=p.enum(data.get('confidence'), LEVELS, f"{path}.confidence"),
+            reason=p.text(data.get('reason'), f"{path}.reason"),
+            timeframe=p.text(data.get('timeframe'), f"{path}.timeframe"),
+            risks=p.text(data.get('risks'), f"{path}.risks"),
+            why_despite_risks=p.text(data.get('why_despite_risks'), f"{path}.why_despite_risks"),
+            type=p.enum(data.get('type'), TERMS, f"{path}.type"),
+            catalyst=p.text(data.get('catalyst'), f"{path}.catalyst"),
+            change=p.text(data.get('change'), f"{path}.change"),
+        )
+
+
+@dataclass(slots=True)
+class SectorAnalysis(_Model):
+    sector: str
+    status: Optional[str] = None
+    recommendation: Optional[str] = None
+    action_required: Optional[str] = None
+    top_picks: List[str] = field(default_factory=list)
+    reason: Optional[str] = None
+    risks: Optional[str] = None
+    why_despite_risks: Optional[str] = None
+    portfolio_impact: Optional[str] = None
+
+    @classmethod
+    def parse(cls, data, path: str, p: _Parser) -> 'SectorAnalysis':
+        data = p.obj(data, path)
+        return cls(
+            sector=p.text(data.get('sector'), f"{path}.sector", required=True) or '',
+            status=p.enum(data.get('status'), SENTIMENTS, f"{path}.status"),
+            recommendation=p.enum(data.get('recommendation'), SECTOR_ACTIONS, f"{path}.recommendation"),
+            action_required=p.text(data.get('action_required'), f"{path}.action_required"),
+            top_picks=p.texts(data.get('top_picks'), f"{path}.top_picks"),
+            reason=p.text(data.get('reason'), f"{path}.reason"),
+            risks=p.text(data.get('risks'), f"{path}.risks"),
+            why_despite_risks=p.text(data.get('why_despite_risks'), f"{path}.why_despite_risks"),
+            portfolio_impact=p.text(data.get('portfolio_impact'), f"{path}.portfolio_impact"),
+        )
+
+
+@dataclass(slots=True)
+class Alert(_Model):
+    """
+    Daily alerts carry `message`; afternoon alerts carry `title`/`description`.
+    Both are accepted; `description` is stored as `message`.
+    """
+    message: str
+    title: Optional[str] = None
+    type: Optional[str] = None
+    symbol: Optional[str] = None
+    priority: Optional[str] = None
+    action_required: Optional[str] = None
+    urgency: Optional[str] = None
+    immediate_action: Optional[str] = None
+
+    @property
+    def headline(self) -> str:
+        return self.title or self.message
+
+    @classmethod
+    def parse(cls, data, path: str, p: _Parser) -> 'Alert':
+        data = p.obj(data, path)
+        message = data.get('message') or data.get('description') or data.get('title')
+        symbol = p.text(data.get('symbol'), f"{path}.symbol")
+        return cls(
+            message=p.text(message, f"{path}.message", required=True) or '',
+            title=p.text(data.get('title'), f"{path}.title"),
+            type=p.enum(data.get('type'), ALERT_TYPES, f"{path}.type"),
+            symbol=normalize_symbol(symbol) if symbol else None,
+            priority=p.enum(data.get('priority'), LEVELS, f"{path}.priority"),
+            action_required=p.text(data.get('action_required'), f"{path}.action_required"),
+            urgency=p.enum(data.get('urgency'), URGENCIES, f"{path}.urgency"),
+            immediate_action=p.text(data.get('immediate_action'), f"{path}.immediate_action"),
+        )
+
+
+@dataclass(slots=True)
+class RiskManagement(_Model):
+    current_risk: Optional[str] = None
+    risk_type: Optional[str] = None
+    explanation: Optional[str] = None
+    immediate_actions: List[str] = field(default_factory=list)
+    stop_loss_levels: List[str] = field(default_factory=list)
+    hedging_strategies: List[str] = field(default_factory=list)
+
+    @classmethod
+    def parse(cls, data, path: str, p: _Parser) -> 'RiskManagement':
+        data = p.obj(data, path)
+        return cls(
+            current_risk=p.enum(data.get('current_risk'), LEVELS, f"{path}.current_risk"),
+            risk_type=p.text(data.get('risk_type'), f"{path}.risk_type"),
+            explanation=p.text(data.get('explanation'), f"{path}.explanation"),
+            immediate_actions=p.texts(data.get('immediate_actions'), f"{path}.immediate_actions"),
+            stop_loss_levels=p.texts(data.get('stop_loss_levels'), f"{path}.stop_loss_levels"),
+            hedging_strategies=p.texts(data.get('hedging_strategies'), f"{path}.hedging_strategies"),
+        )
+
+
+@dataclass(slots=True)
+class UpdateSummary(_Model):
+    has_significant_changes: bool = False
+    change_count: int = 0
+    priority_level: Optional[str] = None
+
+    @classmethod
+    def parse(cls, data, path: str, p: _Parser) -> Optional['UpdateSummary']:
+        if data is None:
+            return None
+        data = p.obj(data, path)
+        flag = data.get('has_significant_changes', False)
+        if isinstance(flag, str):
+            flag = flag.strip().lower() == 'true'
+        count = p.number(data.get('change_count'), f"{path}.change_count")
+        return cls(
+            has_significant_changes=bool(flag),
+            change_count=int(count or 0),
+            priority_level=p.enum(data.get('priority_level'), LEVELS, f"{path}.priority_level"),
+        )
+
+
+# Top-level keys owned by the model; anything else (metadata such as
+# prompt_version, changes, precheck) is preserved in `extras`
+_INSIGHT_FIELDS = {
+    'timestamp', 'title', 'date', 'currency', 'source', 'generated_at', 'type',
+    'market_overview', 'recommendations', 'sector_analysis', 'alerts',
+    'risk_management', 'update_summary',
+}
+
+
+@dataclass(slots=True)
+class Insight(_Model):
+    type: str
+    generated_at: Optional[str] = None
+    timestamp: Optional[str] = None
+    title: Optional[str] = None
+    date: Optional[str] = None
+    currency: Optional[str] = None
+    source: Optional[str] = None
+    market_overview: MarketOverview = field(default_factory=MarketOverview)
+    recommendations: List[Recommendation] = field(default_factory=list)
+    sector_analysis: List[SectorAnalysis] = field(default_factory=list)
+    alerts: List[Alert] = field(default_factory=list)
+    risk_management: Optional[RiskManagement] = None
+    update_summary: Optional[UpdateSummary] = None
+    extras: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def is_daily(self) -> bool:
+        return self.type == 'daily_insight'
+
+    @classmethod
+    def from_dict(cls, data: Dict, strict: Optional[bool] = None) -> 'Insight':
+        """
+        Validate and coerce a raw insight dict in a single pass.
+        Daily insights are validated strictly by default: off-schema values
+        and broken list items are dropped with a warning, and
+        InsightValidationError is raised only when a required section ends up
+        empty. Everything else is coerced leniently.
+        """
+        p = _Parser(True)
+        data = p.obj(data, 'insight')
+        insight_type = p.text(data.get('type'), 'insight.type') or 'daily_insight'
+        if strict is None:
+            strict = insight_type == 'daily_insight'
+        p.strict = strict
+
+        if strict and insight_type == 'daily_insight':
+            for key in ('market_overview', 'recommendations'):
+                if not data.get(key):
+                    raise InsightValidationError(f"insight.{key}", "required section is missing")
+
+        risk = data.get('risk_management')
+        insight = cls(
+            type=insight_type,
+            generated_at=p.text(data.get('generated_at'), 'insight.generated_at'),
+            timestamp=p.text(data.get('timestamp'), 'insight.timestamp'),
+            title=p.text(data.get('title'), 'insight.title'),
+            date=p.text(data.get('date'), 'insight.date'),
+            currency=p.text(data.get('currency'), 'insight.currency'),
+            source=p.text(data.get('source'), 'insight.source'),
+            market_overview=MarketOverview.parse(data.get('market_overview'), 'insight.market_overview', p),
+            recommendations=p.each(Recommendation.parse, data.get('recommendations'), 'insight.recommendations'),
+            sector_analysis=p.each(SectorAnalysis.parse, data.get('sector_analysis'), 'insight.sector_analysis'),
+            alerts=p.each(Alert.parse, data.get('alerts'), 'insight.alerts'),
+            risk_management=RiskManagement.parse(risk, 'insight.risk_management', p) if risk is not None else None,
+            update_summary=UpdateSummary.parse(data.get('update_summary'), 'insight.update_summary', p),
+            extras={k: v for k, v in data.items() if k not in _INSIGHT_FIELDS},
+        )
+
+        if p.issues:
+            logger.warning(f"Insight validation for {insight_type} dropped {len(p.issues)} values: {'; '.join(p.issues)[:1000]}")
+        if strict and insight_type == 'daily_insight' and not insight.recommendations:
+            raise InsightValidationError('insight.recommendations', "no valid recommendations left after validation")
+        return insight
+
+    def to_firestore(self) -> Dict[str, Any]:
+        """Plain dict ready for Firestore: numbers stay numbers, empty optionals are dropped"""
+        return self.to_dict()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo Portfolio Simulator for Investment Assistant
+Simulates the monthly contribution schedule and the strategy allocation over many paths
+"""
+
+import logging
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from context import PORTFOLIO_ALLOCATION
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATHS = 100_000
+DEFAULT_YEARS = 10
+MAX_PATHS = 200_000
+MAX_YEARS = 40
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Parametric assumptions per sleeve: (annual expected return, annual volatility)
+SLEEVE_ASSUMPTIONS = {
+    'sp500': (0.08, 0.16),
+    'qqq': (0.10, 0.22),
+    'growth_stocks': (0.11, 0.30),
+    'momentum_stocks': (0.12, 0.40),
+    'leveraged_etfs': (0.15, 0.60),
+    'crypto': (0.15, 0.75),
+}
+
+# Pairwise correlation between sleeves, in SLEEVE_ASSUMPTIONS order
+SLEEVE_CORRELATION = np.array([
+    [1.00, 0.92, 0.85, 0.75, 0.88, 0.35],
+    [0.92, 1.00, 0.90, 0.78, 0.95, 0.38],
+    [0.85, 0.90, 1.00, 0.80, 0.88, 0.40],
+    [0.75, 0.78, 0.80, 1.00, 0.78, 0.40],
+    [0.88, 0.95, 0.88, 0.78, 1.00, 0.38],
+    [0.35, 0.38, 0.40, 0.40, 0.38, 1.00],
+])
+
+# Cached-price proxies used for bootstrapped returns
+SLEEVE_PROXIES = {
+    'sp500': 'SPY',
+    'qqq': 'QQQ',
+    'leveraged_etfs': 'TQQQ',
+    'crypto': 'BTC-USD',
+}
+
+SESSIONS_PER_MONTH = 21
+
+# RISK_LEVEL scales the short-term sleeve of the strategy allocation
+RISK_LEVEL_SHORT_TERM_SCALE = {
+    'HIGH': 1.0,
+    'MEDIUM': 0.5,
+    'LOW': 0.0,
+}
+
+
+def allocation_weights(risk_level: str = 'HIGH') -> np.ndarray:
+    """
+    Portfolio weights in SLEEVE_ASSUMPTIONS order.
+    Lower risk levels move part of the short-term sleeve into the long-term sleeve pro rata.
+    """
+    scale = RISK_LEVEL_SHORT_TERM_SCALE.get(str(risk_level).upper(), 1.0)
+    long_term = {k: v for k, v in PORTFOLIO_ALLOCATION['long_term'].items()}
+    short_term = {k: v * scale for k, v in PORTFOLIO_ALLOCATION['short_term'].items()}
+    freed = sum(PORTFOLIO_ALLOCATION['short_term'].values()) - sum(short_term.values())
+    long_total = sum(long_term.values())
+    long_term = {k: v + freed * v / long_total for k, v in long_term.items()}
+    weights = {**long_term, **short_term}
+    return np.array([weights.get(sleeve, 0.0) for sleeve in SLEEVE_ASSUMPTIONS]) / 100.0
+
+
+def portfolio_monthly_params(weights: np.ndarray) -> Tuple[float, float]:
+    """Monthly mean and volatility of a monthly-rebalanced portfolio under the parametric model"""
+    mu = np.array([m for m, _ in SLEEVE_ASSUMPTIONS.values()])
+    sigma = np.array([s for _, s in SLEEVE_ASSUMPTIONS.values()])
+    cov = SLEEVE_CORRELATION * np.outer(sigma, sigma)
+    annual_mu = float(weights @ mu)
+    annual_var = float(weights @ cov @ weights)
+    return annual_mu / 12.0, np.sqrt(annual_var / 12.0)
+
+
+def historical_monthly_returns(history, weights: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Monthly returns of the allocation rebuilt from cached proxy prices.
+    Sleeves without a proxy in the cache are dropped and the rest re-weighted.
+    """
+    series, used = [], []
+    for i, sleeve in enumerate(SLEEVE_ASSUMPTIONS):
+        row = history.index_of(SLEEVE_PROXIES.get(sleeve, ''))
+        if row is None or weights[i] == 0:
+            continue
+        closes = history.close[row, ::-1][::SESSIONS_PER_MONTH][::-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            series.append(closes[1:] / closes[:-1] - 1.0)
+        used.append(i)
+    if not series:
+        return None
+    returns = np.vstack(series)
+    w = weights[used] / weights[used].sum()
+    valid = ~np.isnan(returns).any(axis=0)
+    monthly = w @ returns[:, valid]
+    return monthly if len(monthly) >= 12 else None
+
+
+def simulate(initial: float, monthly: float, years: int = DEFAULT_YEARS,
+             paths: int = DEFAULT_PATHS, risk_level: str = 'HIGH',
+             returns_history: Optional[np.ndarray] = None, seed: int = 0) -> Dict:
+    """
+    Simulate portfolio value over `years` with a contribution at the start of every month.
+
+    Portfolio returns are drawn per month for all paths at once, either
+    log-normally from the sleeve assumptions or bootstrapped from
+    `returns_history` (a 1-D array of historical monthly portfolio returns).
+    Drawdown is measured on the time-weighted unit value so contributions
+    do not mask losses.
+    """
+    months = int(years) * 12
+    rng = np.random.default_rng(seed)
+    weights = allocation_weights(risk_level)
+
+    if returns_history is not None and len(returns_history) > 0:
+        method = 'bootstrap'
+        mu_m = sigma_m = None
+    else:
+        method = 'parametric'
+        mu_m, sigma_m = portfolio_monthly_params(weights)
+        log_mu = np.log1p(mu_m) - 0.5 * sigma_m ** 2
+
+    value = np.full(paths, float(initial))
+    unit = np.ones(paths)
+    peak = np.ones(paths)
+    max_drawdown = np.zeros(paths)
+    contributed = float(initial)
+    checkpoints = {}
+
+    for month in range(1, months + 1):
+        if method == 'bootstrap':
+            r = rng.choice(returns_history, size=paths)
+        else:
+            r = np.expm1(log_mu + sigma_m * rng.standard_normal(paths))
+        value *= 1.0 + r
+        unit *= 1.0 + r
+        np.maximum(peak, unit, out=peak)
+        np.maximum(max_drawdown, 1.0 - unit / peak, out=max_drawdown)
+        if month < months:
+            value += monthly
+            contributed += monthly
+        if month % 12 == 0:
+            checkpoints[month // 12] = np.percentile(value, PERCENTILES)
+
+    final_pct = np.percentile(value, PERCENTILES)
+    dd_pct = np.percentile(max_drawdown, PERCENTILES)
+    result = {
+        'parameters': {
+            'initial_investment': initial,
+            'monthly_investment': monthly,
+            'years': years,
+            'paths': paths,
+            'risk_level': str(risk_level).upper(),
+            'method': method,
+            'allocation': {sleeve: round(float(w), 4) for sleeve, w in zip(SLEEVE_ASSUMPTIONS, weights)},
+        },
+        'total_contributed': round(contributed, 2),
+        'final_value_percentiles': {f'p{p}': round(float(v), 2) for p, v in zip(PERCENTILES, final_pct)},
+        'max_drawdown_percentiles': {f'p{p}': round(float(v), 4) for p, v in zip(PERCENTILES, dd_pct)},
+        'probability_below_contributed': round(float((value < contributed).mean()), 4),
+        'yearly_percentiles': {
+            str(year): {f'p{p}': round(float(v), 2) for p, v in zip(PERCENTILES, pct)}
+            for year, pct in checkpoints.items()
+        },
+    }
+    if method == 'parametric':
+        result['parameters']['monthly_mean'] = round(mu_m, 5)
+        result['parameters']['monthly_volatility'] = round(sigma_m, 5)
+    return result
+
+
+@lru_cache(maxsize=32)
+def simulate_cached(initial: float, monthly: float, years: int, paths: int,
+                    risk_level: str, method: str = 'parametric', history_key: Optional[str] = None,
+                    seed: int = 0) -> Dict:
+    """
+    Simulation memoized per parameter set.
+    `history_key` identifies the price cache version so bootstrapped results refresh with new data.
+    """
+    returns_history = None
+    if method == 'bootstrap':
+        from market_data import get_price_history
+        history = get_price_history()
+        if history is None:
+            raise ValueError("Bootstrap simulation requires a price history cache (MARKET_DATA_CACHE)")
+        returns_history = historical_monthly_returns(history, allocation_weights(risk_level))
+        if returns_history is None:
+            raise ValueError("Not enough proxy price history for a bootstrap simulation")
+    logger.info(f"Running Monte Carlo ({method}): {paths} paths x {years} years, risk {risk_level}")
+    return simulate(initial, monthly, years, paths, risk_level, returns_history, seed)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Novelty Filter for Investment Assistant
+Rolling window of recently recommended symbols and catalysts, used to steer
+the prompt away from repeats and to flag near-duplicates after generation
+"""
+
+import logging
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from market_data import normalize_symbol
+from search_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+NOVELTY_COLLECTION = 'novelty'
+NOVELTY_DOCUMENT = 'recent_recommendations'
+
+DEFAULT_WINDOW_DAYS = 14
+MAX_EXCLUDED_SYMBOLS = 25
+CATALYST_SIMILARITY = 0.6
+MAX_CATALYST_CHARS = 300
+
+# Holding an existing position is not a new idea, so it does not count as a repeat
+HOLD_ACTIONS = ('HOLD', 'להחזיק')
+
+
+def catalyst_terms(text: str) -> FrozenSet[str]:
+    return frozenset(tokenize(text))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _catalyst_text(rec: Dict) -> str:
+    parts = [rec.get('catalyst'), rec.get('reason')]
+    return ' '.join(p for p in parts if isinstance(p, str))[:MAX_CATALYST_CHARS]
+
+
+def _new_ideas(insight: Dict):
+    for rec in insight.get('recommendations') or []:
+        if not isinstance(rec, dict) or str(rec.get('action', '')).strip().upper() in HOLD_ACTIONS:
+            continue
+        symbol = normalize_symbol(rec.get('symbol'))
+        if symbol:
+            yield symbol, _catalyst_text(rec)
+
+
+def _insight_day(insight: Dict) -> str:
+    return str(insight.get('generated_at') or datetime.utcnow().isoformat())[:10]
+
+
+class NoveltyWindow:
+    """
+    Recently recommended (date, symbol, catalyst) entries with a per-symbol
+    counter. Entries are keyed by day: recording a day again (a retried or
+    re-run generation) replaces that day's entries, and the checks for a day
+    ignore its own entries.
+    """
+
+    def __init__(self, window_days: int = DEFAULT_WINDOW_DAYS):
+        self.window_days = window_days
+        self.entries: List[Tuple[str, str, str, FrozenSet[str]]] = []
+        self.symbol_counts: Counter = Counter()
+        self._lock = threading.RLock()
+
+    def _append(self, day: str, symbol: str, catalyst: str) -> None:
+        self.entries.append((day, symbol, catalyst, catalyst_terms(catalyst)))
+        self.symbol_counts[symbol] += 1
+
+    def prune(self, today: Optional[date] = None) -> None:
+        cutoff = ((today or datetime.utcnow().date()) - timedelta(days=self.window_days)).isoformat()
+        with self._lock:
+            self._keep(lambda entry: entry[0] > cutoff)
+
+    def _keep(self, predicate) -> int:
+        """Drop the entries failing `predicate`; returns how many were dropped"""
+        kept = [entry for entry in self.entries if predicate(entry)]
+        dropped = len(self.entries) - len(kept)
+        if dropped:
+            self.entries = kept
+            self.symbol_counts = Counter(entry[1] for entry in kept)
+        return dropped
+
+    def add_insight(self, insight: Dict, day: Optional[str] = None) -> int:
+        """Record an insight's new ideas, replacing its day's entries; returns how many entries changed"""
+        day = day or _insight_day(insight)
+        with self._lock:
+            changed = self._keep(lambda entry: entry[0] != day)
+            for symbol, catalyst in _new_ideas(insight):
+                self._append(day, symbol, catalyst)
+                changed += 1
+            self.prune()
+        return changed
+
+    def _before(self, day: Optional[str]) -> Tuple[List, Counter]:
+        """Entries and symbol counts excluding `day` (the day being generated)"""
+        if day is None:
+            return self.entries, self.symbol_counts
+        entries = [entry for entry in self.entries if entry[0] != day]
+        return entries, Counter(entry[1] for entry in entries)
+
+    def exclusion_list(self, limit: int = MAX_EXCLUDED_SYMBOLS, day: Optional[str] = None) -> List[str]:
+        """Most frequently repeated symbols first, ignoring `day`'s own entries"""
+        with self._lock:
+            _, counts = self._before(day)
+        return [symbol for symbol, _ in counts.most_common(limit)]
+
+    def flag_repeats(self, insight: Dict, threshold: float = CATALYST_SIMILARITY) -> List[Dict]:
+        """Flag recommendations whose symbol or catalyst appeared in the window before the insight's day"""
+        with self._lock:
+            entries, counts = self._before(_insight_day(insight))
+        flags = []
+        for symbol, catalyst in _new_ideas(insight):
+            if symbol in counts:
+                last_seen = max(entry[0] for entry in entries if entry[1] == symbol)
+                flags.append({
+                    'symbol': symbol,
+                    'kind': 'repeat_symbol',
+                    'last_seen': last_seen,
+                    'count': counts[symbol],
+                })
+            terms = catalyst_terms(catalyst)
+            best = max(((jaccard(terms, entry[3]), entry) for entry in entries), default=(0.0, None), key=lambda item: item[0])
+            if best[1] is not None and best[0] >= threshold:
+                flags.append({
+                    'symbol': symbol,
+                    'kind': 'repeat_catalyst',
+                    'last_seen': best[1][0],
+                    'matched_symbol': best[1][1],
+                    'similarity': round(best[0], 3),
+                })
+        return flags
+
+    def to_document(self) -> Dict:
+        with self._lock:
+            entries = list(self.entries)
+        return {
+            'window_days': self.window_days,
+            'updated_at': datetime.utcnow().isoformat(),
+            'entries': [{'d': day, 's': symbol, 'c': catalyst} for day, symbol, catalyst, _ in entries],
+        }
+
+    @classmethod
+    def from_document(cls, doc: Optional[Dict], window_days: int = DEFAULT_WINDOW_DAYS) -> 'NoveltyWindow':
+        window = cls(window_days)
+        for entry in (doc or {}).get('entries', []):
+            window._append(entry.get('d', ''), entry.get('s', ''), entry.get('c', ''))
+        window.prune()
+        return window
+
+    @classmethod
+    def from_insights(cls, insights, window_days: int = DEFAULT_WINDOW_DAYS) -> 'NoveltyWindow':
+        """Rebuild the window from stored insights (used when the Firestore document is missing)"""
+        window = cls(window_days)
+        for insight in sorted(insights, key=lambda i: str(i.get('generated_at') or '')):
+            window.add_insight(insight)
+        return window
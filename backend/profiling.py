@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Request Profiling for Investment Assistant
+Opt-in WSGI middleware that profiles selected requests (HMAC-signed header or
+a sampling rate) with cProfile or a stack sampler, tags each profile with the
+endpoint and stage timings, and writes pstats and flamegraph-ready folded
+stacks to a local directory
+"""
+
+import argparse
+import contextvars
+import glob
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLE = 'sample'
+
+SIGNATURE_HEADER = 'HTTP_X_PROFILE_SIGNATURE'
+TIMESTAMP_HEADER = 'HTTP_X_PROFILE_TIMESTAMP'
+SIGNATURE_MAX_AGE_SECONDS = 300
+
+SAMPLE_INTERVAL_SECONDS = 0.005
+TOP_FUNCTIONS = 25
+
+_current_stages = contextvars.ContextVar('profile_stages', default=None)
+
+
+def sign_request(secret: str, path: str, timestamp: Optional[int] = None) -> Dict[str, str]:
+    """Headers that make the middleware profile one request to `path`"""
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    signature = hmac.new(secret.encode('utf-8'), f"{timestamp}:{path}".encode('utf-8'), hashlib.sha256).hexdigest()
+    return {'X-Profile-Timestamp': str(timestamp), 'X-Profile-Signature': signature}
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage; recorded only while the current request is being profiled"""
+    stages = _current_stages.get()
+    if stages is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages.append({'stage': name, 'seconds': round(time.perf_counter() - started, 4)})
+
+
+def timed_stage(name: str):
+    """Decorator form of stage()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into folded-stack counts"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def folded_from_pstats(stats: pstats.Stats) -> List[str]:
+    """
+    Approximate folded stacks from cProfile data: one caller;callee line per
+    call edge weighted by the callee's own time in microseconds.
+    """
+    lines = []
+    for func, (_, _, tottime, _, callers) in stats.stats.items():
+        name = f"{os.path.basename(func[0])}:{func[2]}"
+        weight = int(tottime * 1e6)
+        if weight <= 0:
+            continue
+        if not callers:
+            lines.append(f"{name} {weight}")
+            continue
+        total_calls = sum(edge[0] for edge in callers.values()) or 1
+        for caller, edge in callers.items():
+            caller_name = f"{os.path.basename(caller[0])}:{caller[2]}"
+            lines.append(f"{caller_name};{name} {max(int(weight * edge[0] / total_calls), 1)}")
+    return lines
+
+
+class ProfileStore:
+    """Profiles in a local directory: <id>.json metadata, <id>.prof and/or <id>.folded"""
+
+    def __init__(self, directory: str, max_profiles: int = 50):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def path(self, profile_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{profile_id}{suffix}")
+
+    def save(self, meta: Dict, profiler=None, folded: Optional[List[str]] = None) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = meta['id']
+        if profiler is not None:
+            profiler.dump_stats(self.path(profile_id, '.prof'))
+            stats = pstats.Stats(self.path(profile_id, '.prof'))
+            meta['top_functions'] = [
+                {'function': f"{os.path.basename(func[0])}:{func[1]}:{func[2]}", 'calls': nc,
+                 'own_seconds': round(tt, 4), 'cumulative_seconds': round(ct, 4)}
+                for func, (_, nc, tt, ct, _) in sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+            ]
+            folded = folded_from_pstats(stats)
+        if folded:
+            with open(self.path(profile_id, '.folded'), 'w', encoding='utf-8') as f:
+                f.write('\n'.join(folded) + '\n')
+        with open(self.path(profile_id, '.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        self._prune()
+
+    def _prune(self) -> None:
+        metas = sorted(glob.glob(os.path.join(self.directory, '*.json')))
+        for path in metas[:max(len(metas) - self.max_profiles, 0)]:
+            profile_id = os.path.basename(path)[:-len('.json')]
+            for suffix in ('.json', '.prof', '.folded'):
+                try:
+                    os.remove(self.path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        metas = sorted(glob.glob(os.path.join(self.directory, '*.json')), reverse=True)[:limit]
+        profiles = []
+        for path in metas:
+            with open(path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            meta.pop('top_functions', None)
+            profiles.append(meta)
+        return profiles
+
+    def get(self, profile_id: str) -> Optional[Dict]:
+        if os.path.basename(profile_id) != profile_id:
+            return None
+        try:
+            with open(self.path(profile_id, '.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+
+class ProfilingMiddleware:
+    """
+    Wraps the WSGI app. A request is profiled when it carries a valid
+    signature for its path (X-Profile-Timestamp / X-Profile-Signature) or
+    falls within `sample_rate`; everything else passes straight through.
+    """
+
+    def __init__(self, wsgi_app, store: ProfileStore, secret: Optional[str] = None,
+                 sample_rate: float = 0.0, mode: str = MODE_CPROFILE):
+        if mode not in (MODE_CPROFILE, MODE_SAMPLE):
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.mode = mode
+        # One profiled request at a time keeps the overhead bounded (and cProfile allows one active profiler)
+        self._busy = threading.Lock()
+
+    def _signed(self, environ) -> bool:
+        signature = environ.get(SIGNATURE_HEADER)
+        if not self.secret or not signature:
+            return False
+        try:
+            timestamp = int(environ.get(TIMESTAMP_HEADER, ''))
+        except ValueError:
+            return False
+        if abs(time.time() - timestamp) > SIGNATURE_MAX_AGE_SECONDS:
+            return False
+        expected = sign_request(self.secret, environ.get('PATH_INFO', ''), timestamp)['X-Profile-Signature']
+        return hmac.compare_digest(expected, signature)
+
+    def should_profile(self, environ) -> Optional[str]:
+        """The reason a request is profiled ('signed' or 'sampled'), or None"""
+        if self._signed(environ):
+            return 'signed'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def __call__(self, environ, start_response):
+        reason = self.should_profile(environ)
+        if reason is None or not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            return self._profile(environ, start_response, reason)
+        finally:
+            self._busy.release()
+
+    def _profile(self, environ, start_response, reason):
+
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = int(status.split(' ', 1)[0])
+            captured['request_id'] = next((v for k, v in headers if k.lower() == 'x-request-id'), None)
+            return start_response(status, headers, exc_info)
+
+        stages: List[Dict] = []
+        token = _current_stages.set(stages)
+        profiler = sampler = None
+        if self.mode == MODE_CPROFILE:
+            import cProfile
+            profiler = cProfile.Profile()
+        else:
+            sampler = StackSampler(threading.get_ident())
+        started = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            else:
+                sampler.start()
+            # Consume the body while profiling so lazily generated responses are included
+            body = list(self.wsgi_app(environ, capture_start_response))
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            else:
+                sampler.stop()
+            _current_stages.reset(token)
+            self._save(environ, reason, captured, stages, time.perf_counter() - started, profiler, sampler)
+        return body
+
+    def _save(self, environ, reason, captured, stages, seconds, profiler, sampler) -> None:
+        path = environ.get('PATH_INFO', '')
+        endpoint = path.strip('/').replace('/', '_') or 'root'
+        meta = {
+            'id': f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{endpoint}"[:120],
+            'created_at': datetime.utcnow().isoformat(),
+            'method': environ.get('REQUEST_METHOD'),
+            'path': path,
+            'status': captured.get('status'),
+            'request_id': captured.get('request_id'),
+            'reason': reason,
+            'mode': self.mode,
+            'duration_seconds': round(seconds, 4),
+            'stages': stages,
+        }
+        try:
+            folded = [f"{stack} {count}" for stack, count in sampler.stacks.most_common()] if sampler else None
+            self.store.save(meta, profiler, folded)
+            logger.info(f"Profiled {meta['method']} {path} ({reason}): {meta['duration_seconds']}s -> {meta['id']}")
+        except Exception as e:
+            logger.warning(f"Failed to save profile for {path}: {e}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Headers that make the service profile one request')
+    parser.add_argument('path', help='Request path, e.g. /api/insights/daily')
+    parser.add_argument('--secret', default=os.getenv('PROFILING_SECRET'))
+    args = parser.parse_args(argv)
+    if not args.secret:
+        parser.error('--secret or PROFILING_SECRET is required')
+    for name, value in sign_request(args.secret, args.path).items():
+        print(f"{name}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt Experiments for Investment Assistant
+Versioned prompt variants with a deterministic weighted split per generation,
+variant tagging on stored insights, and a report comparing variants on
+output tokens, latency, parse failures and schema completeness
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from usage_ledger import aggregate
+
+logger = logging.getLogger(__name__)
+
+KIND_DAILY = 'daily'
+KIND_AFTERNOON = 'afternoon'
+CONTROL = 'control'
+
+
+@dataclass(frozen=True)
+class PromptVariant:
+    name: str
+    # Appended after the dynamic segment, so the cached static prefix stays byte-identical
+    tail: str = ''
+    description: str = ''
+
+
+VARIANTS = {
+    KIND_DAILY: {
+        CONTROL: PromptVariant(CONTROL, description='Current prompt'),
+        'terse': PromptVariant(
+            'terse',
+            "\nBREVITY: keep every free-text value under 25 words; reasons and risks one sentence each.\n",
+            'Caps free-text length to cut output tokens'
+        ),
+        'four_recs': PromptVariant(
+            'four_recs',
+            "\nOVERRIDE: this replaces the earlier instruction to provide exactly 5 recommendations. "
+            "Return exactly 4 recommendations (drop the weakest) and at most 3 sector_analysis entries.\n",
+            'Fewer recommendations and sectors'
+        ),
+    },
+    KIND_AFTERNOON: {
+        CONTROL: PromptVariant(CONTROL, description='Current prompt'),
+        'terse': PromptVariant(
+            'terse',
+            "\nBREVITY: each change reason at most one short sentence; omit unchanged fields.\n",
+            'Shorter change records'
+        ),
+    },
+}
+
+# Fields a complete insight is expected to fill, for schema completeness
+EXPECTED_FIELDS = {
+    'market_overview': ('summary', 'sentiment', 'key_events', 'trending_sectors'),
+    'recommendations': ('symbol', 'action', 'current_price', 'target_price', 'stop_loss',
+                        'confidence', 'reason', 'risks', 'catalyst', 'type'),
+    'sector_analysis': ('sector', 'status', 'recommendation', 'reason'),
+    'alerts': ('type', 'message', 'priority'),
+    'risk_management': ('current_risk', 'explanation', 'stop_loss_levels'),
+}
+
+
+def _filled(value) -> bool:
+    return value not in (None, '', [], {})
+
+
+def schema_completeness(insight: Dict) -> float:
+    """Share of expected fields that are filled, over every section and list item (0-1)"""
+    expected = filled = 0
+    for section, fields in EXPECTED_FIELDS.items():
+        value = insight.get(section)
+        items = value if isinstance(value, list) else [value]
+        items = [item for item in items if isinstance(item, dict)] or [{}]
+        for item in items:
+            expected += len(fields)
+            filled += sum(1 for field in fields if _filled(item.get(field)))
+    return round(filled / expected, 4) if expected else 0.0
+
+
+def load_weights(config_value=None) -> Dict[str, Dict[str, float]]:
+    """Variant weights per prompt kind from config (dict or JSON); unlisted kinds run control only"""
+    if isinstance(config_value, str):
+        config_value = json.loads(config_value) if config_value.strip() else {}
+    weights = {}
+    for kind, variants in (config_value or {}).items():
+        if kind not in VARIANTS:
+            raise ValueError(f"Unknown prompt kind: {kind}")
+        unknown = set(variants) - set(VARIANTS[kind])
+        if unknown:
+            raise ValueError(f"Unknown {kind} prompt variants: {', '.join(sorted(unknown))}")
+        weights[kind] = {name: float(weight) for name, weight in variants.items() if float(weight) > 0}
+    return weights
+
+
+class PromptExperiments:
+    def __init__(self, weights: Optional[Dict[str, Dict[str, float]]] = None, salt: str = ''):
+        self.weights = weights or {}
+        self.salt = salt
+
+    def assign(self, kind: str, unit: str) -> PromptVariant:
+        """
+        Deterministic weighted choice: the same unit (e.g. a date, or date and
+        slot) always gets the same variant, so retries and replays agree.
+        """
+        weights = self.weights.get(kind)
+        if not weights:
+            return VARIANTS[kind][CONTROL]
+        total = sum(weights.values())
+        digest = hashlib.sha256(f"{self.salt}:{kind}:{unit}".encode('utf-8')).hexdigest()
+        point = int(digest[:15], 16) / float(16 ** 15) * total
+        for name in sorted(weights):
+            point -= weights[name]
+            if point < 0:
+                return VARIANTS[kind][name]
+        return VARIANTS[kind][sorted(weights)[-1]]
+
+    @staticmethod
+    def apply(prompt: str, variant: PromptVariant) -> str:
+        return prompt + variant.tail
+
+    @staticmethod
+    def version(base_version: str, variant: PromptVariant) -> str:
+        return base_version if variant.name == CONTROL else f"{base_version}+{variant.name}"
+
+    def to_dict(self) -> Dict:
+        return {
+            'weights': self.weights,
+            'variants': {kind: {name: v.description for name, v in variants.items()} for kind, variants in VARIANTS.items()},
+        }
+
+
+def tag_insight(insight: Dict, variant: PromptVariant, version: str) -> Dict:
+    insight['prompt_variant'] = variant.name
+    insight['prompt_version'] = version
+    return insight
+
+
+def _variant_name(prompt_version: Optional[str]) -> str:
+    return (prompt_version or '').partition('+')[2] or CONTROL
+
+
+def experiment_report(records: Iterable[Dict]) -> List[Dict]:
+    """
+    Per insight type and route, one row per prompt version with its ledger
+    aggregates and the change against control in completion tokens and median
+    latency. Routes are kept apart because one generation can span several
+    (the afternoon first pass and its escalation run on different models).
+    """
+    groups = aggregate(records, ('insight_type', 'route', 'prompt_version'))
+    by_route: Dict[tuple, List[Dict]] = {}
+    for group in groups:
+        if group.get('prompt_version'):
+            group['variant'] = _variant_name(group['prompt_version'])
+            by_route.setdefault((group['insight_type'], group['route']), []).append(group)
+
+    report = []
+    for (insight_type, route), rows in sorted(by_route.items(), key=lambda item: tuple(str(k) for k in item[0])):
+        control = next((r for r in rows if r['variant'] == CONTROL), None)
+        for row in rows:
+            if control is not None and row is not control:
+                row['vs_control'] = {
+                    'avg_completion_tokens_pct': _pct_change(row['avg_completion_tokens'], control['avg_completion_tokens']),
+                    'latency_p50_pct': _pct_change(row['latency_p50_seconds'], control['latency_p50_seconds']),
+                    'parse_failure_rate_diff': round(row['parse_failure_rate'] - control['parse_failure_rate'], 4),
+                }
+        report.append({'insight_type': insight_type, 'route': route, 'variants': rows})
+    return report
+
+
+def _pct_change(value, baseline) -> Optional[float]:
+    if value is None or not baseline:
+        return None
+    return round((value / baseline - 1.0) * 100.0, 1)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+Job Scheduler for Investment Assistant
+Timezone-aware scheduling of the daily, midday and end-of-day pipelines,
+in-process or as a one-shot CLI job, with deadlines, jittered retries,
+run history and misfire handling
+"""
+
+import argparse
+import logging
+import random
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+RUNS_COLLECTION = 'scheduler_runs'
+DEFAULT_DEADLINE_SECONDS = 240
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BASE_SECONDS = 20
+DEFAULT_MISFIRE_GRACE_SECONDS = 900
+HISTORY_SIZE = 200
+
+STATUS_SUCCESS = 'success'
+STATUS_FAILED = 'failed'
+STATUS_TIMEOUT = 'timeout'
+STATUS_MISFIRED = 'misfired'
+STATUS_SKIPPED = 'skipped'
+
+
+class JobTimeout(Exception):
+    """
+    Raised when a job attempt runs past its deadline; `worker` is the thread
+    still running it and `outcome` receives its result or error when it ends
+    """
+
+    def __init__(self, message: str, worker: Optional[threading.Thread] = None, outcome: Optional[Dict] = None):
+        super().__init__(message)
+        self.worker = worker
+        self.outcome = outcome if outcome is not None else {}
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable[[], object]
+    at: str                                   # "HH:MM" in the scheduler timezone
+    weekdays: tuple = (0, 1, 2, 3, 4, 5, 6)   # Monday == 0
+    deadline_seconds: int = DEFAULT_DEADLINE_SECONDS
+    max_retries: int = DEFAULT_MAX_RETRIES
+    retry_base_seconds: float = DEFAULT_RETRY_BASE_SECONDS
+    misfire_grace_seconds: int = DEFAULT_MISFIRE_GRACE_SECONDS
+    enabled: bool = True
+
+    def scheduled_times(self, after: datetime, tz: ZoneInfo):
+        """Yield run times strictly after `after`, in the scheduler timezone"""
+        hour, minute = (int(part) for part in self.at.split(':'))
+        day = after.astimezone(tz).date()
+        while True:
+            candidate = datetime(day.year, day.month, day.day, hour, minute, tzinfo=tz)
+            if candidate > after and candidate.weekday() in self.weekdays:
+                yield candidate
+            day += timedelta(days=1)
+
+    def next_run(self, after: datetime, tz: ZoneInfo) -> datetime:
+        return next(self.scheduled_times(after, tz))
+
+    def previous_run(self, before: datetime, tz: ZoneInfo) -> Optional[datetime]:
+        """Most recent scheduled time at or before `before` (within the last week)"""
+        previous = None
+        for candidate in self.scheduled_times(before - timedelta(days=8), tz):
+            if candidate > before:
+                return previous
+            previous = candidate
+
+
+def run_with_deadline(func: Callable[[], object], deadline_seconds: float):
+    """
+    Run `func` in a worker thread and wait at most `deadline_seconds`.
+    Python threads cannot be killed, so a timed-out attempt keeps running in
+    the background. Its side effects (emails, ledger and novelty records) are
+    not idempotent, so callers must not start another attempt while
+    `JobTimeout.worker` is still alive.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome['result'] = func()
+        except Exception as e:
+            outcome['error'] = e
+
+    worker = threading.Thread(target=target, daemon=True)
+    worker.start()
+    worker.join(deadline_seconds)
+    if worker.is_alive():
+        raise JobTimeout(f"Job exceeded its {deadline_seconds}s deadline", worker, outcome)
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome.get('result')
+
+
+class Scheduler:
+    def __init__(self, jobs: List[Job], timezone: str = 'Asia/Jerusalem',
+                 save_run: Optional[Callable[[Dict], None]] = None,
+                 load_last_run: Optional[Callable[[str], Optional[Dict]]] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.jobs = {job.name: job for job in jobs}
+        self.tz = ZoneInfo(timezone)
+        self.save_run = save_run
+        self.load_last_run = load_last_run
+        self.sleep = sleep
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self._stop = threading.Event()
+        self._thread = None
+        # The last timed-out attempt per job, as (worker thread, outcome)
+        self._timed_out: Dict[str, tuple] = {}
+
+    def now(self) -> datetime:
+        return datetime.now(self.tz)
+
+    def _record(self, record: Dict) -> Dict:
+        self.history.append(record)
+        if self.save_run:
+            try:
+                self.save_run(record)
+            except Exception as e:
+                logger.warning(f"Failed to save run record for {record['job']}: {e}")
+        return record
+
+    def _still_running(self, name: str) -> bool:
+        worker, _ = self._timed_out.get(name, (None, None))
+        return worker is not None and worker.is_alive()
+
+    def _finished_late(self, name: str) -> bool:
+        """True once the last timed-out attempt has since completed without an error"""
+        worker, outcome = self._timed_out.get(name, (None, None))
+        return worker is not None and not worker.is_alive() and 'error' not in outcome
+
+    def run_job(self, name: str, scheduled_for: Optional[datetime] = None) -> Dict:
+        """
+        Run one job now with its deadline and jittered exponential-backoff
+        retries. No attempt starts while a timed-out attempt of the same job
+        is still running, so its side effects are never duplicated.
+        """
+        job = self.jobs[name]
+        scheduled_for = scheduled_for or self.now()
+        started = self.now()
+        attempts = 0
+        error = None
+        status = STATUS_FAILED
+
+        if not self._still_running(name):
+            # A finished attempt from an earlier run says nothing about this one
+            self._timed_out.pop(name, None)
+        while attempts <= job.max_retries:
+            if self._finished_late(name):
+                status, error = STATUS_SUCCESS, None
+                logger.info(f"Job {name}: the timed-out attempt completed late; not retrying")
+                break
+            if self._still_running(name):
+                status = STATUS_SKIPPED if attempts == 0 else STATUS_TIMEOUT
+                error = "A timed-out attempt is still running; not starting another"
+                logger.warning(f"Job {name}: {error}")
+                break
+            attempts += 1
+            try:
+                run_with_deadline(job.func, job.deadline_seconds)
+                status, error = STATUS_SUCCESS, None
+                break
+            except JobTimeout as e:
+                status, error = STATUS_TIMEOUT, str(e)
+                self._timed_out[name] = (e.worker, e.outcome)
+            except Exception as e:
+                status, error = STATUS_FAILED, str(e)
+            logger.warning(f"Job {name} attempt {attempts} failed: {error}")
+            if attempts <= job.max_retries:
+                delay = job.retry_base_seconds * (2 ** (attempts - 1))
+                self.sleep(delay * random.uniform(0.5, 1.5))
+
+        finished = self.now()
+        log = logger.info if status == STATUS_SUCCESS else logger.error
+        log(f"Job {name} finished with {status} after {attempts} attempt(s)")
+        return self._record({
+            'job': name,
+            'status': status,
+            'scheduled_for': scheduled_for.isoformat(),
+            'started_at': started.isoformat(),
+            'finished_at': finished.isoformat(),
+            'duration_seconds': round((finished - started).total_seconds(), 3),
+            'attempts': attempts,
+            'error': error,
+        })
+
+    def _due_or_misfired(self, job: Job, scheduled_for: datetime) -> Optional[Dict]:
+        """Run a job whose slot has passed, or record a misfire if it is past the grace period"""
+        lateness = (self.now() - scheduled_for).total_seconds()
+        if lateness <= job.misfire_grace_seconds:
+            return self.run_job(job.name, scheduled_for)
+        logger.warning(f"Job {job.name} misfired: slot {scheduled_for.isoformat()} is {int(lateness)}s late")
+        return self._record({
+            'job': job.name,
+            'status': STATUS_MISFIRED,
+            'scheduled_for': scheduled_for.isoformat(),
+            'started_at': None,
+            'finished_at': None,
+            'duration_seconds': 0,
+            'attempts': 0,
+            'error': f"Missed by {int(lateness)}s (grace {job.misfire_grace_seconds}s)",
+        })
+
+    def catch_up(self) -> List[Dict]:
+        """On startup, run (or mark misfired) each job's latest slot that has no recorded run"""
+        records = []
+        now = self.now()
+        for job in self.jobs.values():
+            if not job.enabled:
+                continue
+            slot = job.previous_run(now, self.tz)
+            if slot is None:
+                continue
+            last = self.load_last_run(job.name) if self.load_last_run else None
+            if last and last.get('scheduled_for', '') >= slot.isoformat():
+                continue
+            records.append(self._due_or_misfired(job, slot))
+        return records
+
+    def run_forever(self) -> None:
+        self.catch_up()
+        next_runs = {job.name: job.next_run(self.now(), self.tz) for job in self.jobs.values() if job.enabled}
+        logger.info(f"Scheduler started ({self.tz.key}): " + ', '.join(f"{n} at {t.isoformat()}" for n, t in next_runs.items()))
+
+        while not self._stop.is_set() and next_runs:
+            name, slot = min(next_runs.items(), key=lambda item: item[1])
+            wait = (slot - self.now()).total_seconds()
+            if wait > 0:
+                # Sleep in short steps so clock jumps and suspends are noticed as misfires
+                self._stop.wait(min(wait, 60))
+                continue
+            self._due_or_misfired(self.jobs[name], slot)
+            next_runs[name] = self.jobs[name].next_run(max(slot, self.now()), self.tz)
+
+    def start_background(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self.run_forever, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def build_jobs(pipelines: Dict[str, Callable[[], object]], config: Dict) -> List[Job]:
+    """The three daily slots, with times from config"""
+    grace = config.get('SCHEDULER_MISFIRE_GRACE_SECONDS') or DEFAULT_MISFIRE_GRACE_SECONDS
+    return [
+        Job('daily', pipelines['daily'], config.get('SCHEDULE_TIME') or '08:30', misfire_grace_seconds=grace),
+        Job('midday', pipelines['midday'], config.get('MIDDAY_SCHEDULE_TIME') or '13:00',
+            misfire_grace_seconds=grace, enabled=config.get('AFTERNOON_UPDATE_1PM', True)),
+        Job('end_of_day', pipelines['end_of_day'], config.get('END_OF_DAY_SCHEDULE_TIME') or '17:00',
+            misfire_grace_seconds=grace, enabled=config.get('AFTERNOON_UPDATE_5PM', True)),
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Investment Assistant job scheduler')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help='Run one job now (with deadline and retries) and exit')
+    run_parser.add_argument('job', choices=['daily', 'midday', 'end_of_day'])
+    sub.add_parser('serve', help='Run the scheduler loop in the foreground')
+    sub.add_parser('next', help='Print the next run time of each job')
+    args = parser.parse_args(argv)
+
+    # Imported lazily: main initializes Firestore and config at import time
+    from main import get_scheduler
+    scheduler = get_scheduler()
+
+    if args.command == 'next':
+        for job in scheduler.jobs.values():
+            print(f"{job.name}: {job.next_run(scheduler.now(), scheduler.tz).isoformat()}{'' if job.enabled else ' (disabled)'}")
+        return 0
+    if args.command == 'serve':
+        scheduler.run_forever()
+        return 0
+    record = scheduler.run_job(args.job)
+    return 0 if record['status'] == STATUS_SUCCESS else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Market Screener for Investment Assistant
+Vectorized volume-spike, gap, breakout and RSI signals over a whole universe in one pass
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from market_data import PriceHistory
+
+logger = logging.getLogger(__name__)
+
+# Screening defaults
+VOLUME_WINDOW = 20
+BREAKOUT_WINDOW = 20
+RSI_PERIOD = 14
+MIN_PRICE = 1.0
+MIN_AVG_VOLUME = 50_000
+
+# Composite score weights
+SCORE_WEIGHTS = {
+    'volume_z': 1.0,
+    'gap_pct': 0.5,
+    'breakout': 1.5,
+    'rsi': 0.5,
+}
+
+
+def volume_zscore(volume: np.ndarray, window: int = VOLUME_WINDOW) -> np.ndarray:
+    """Z-score of the latest volume against the preceding `window` sessions"""
+    history = volume[:, -window - 1:-1]
+    mean = np.nanmean(history, axis=1)
+    std = np.nanstd(history, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (volume[:, -1] - mean) / std
+    z[~np.isfinite(z)] = 0.0
+    return z
+
+
+def gap_percent(open_: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """Opening gap of the latest session versus the previous close, in percent"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gap = (open_[:, -1] / close[:, -2] - 1.0) * 100.0
+    gap[~np.isfinite(gap)] = 0.0
+    return gap
+
+
+def breakout_ratio(high: np.ndarray, close: np.ndarray, window: int = BREAKOUT_WINDOW) -> np.ndarray:
+    """Latest close divided by the prior `window`-day high (>= 1.0 means a new high)"""
+    prior_high = np.nanmax(high[:, -window - 1:-1], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = close[:, -1] / prior_high
+    ratio[~np.isfinite(ratio)] = 0.0
+    return ratio
+
+
+def rsi(close: np.ndarray, period: int = RSI_PERIOD) -> np.ndarray:
+    """
+    Wilder RSI of the latest session for every row.
+    Iterates over time only; each step is vectorized across the whole universe.
+    """
+    lookback = min(close.shape[1], period * 5 + 1)
+    window = close[:, -lookback:]
+    delta = np.diff(window, axis=1)
+    delta = np.nan_to_num(delta, nan=0.0)
+    gains = np.clip(delta, 0, None)
+    losses = np.clip(-delta, 0, None)
+
+    if delta.shape[1] < period:
+        return np.full(close.shape[0], 50.0)
+
+    avg_gain = gains[:, :period].mean(axis=1)
+    avg_loss = losses[:, :period].mean(axis=1)
+    for t in range(period, delta.shape[1]):
+        avg_gain = (avg_gain * (period - 1) + gains[:, t]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[:, t]) / period
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        values = 100.0 - 100.0 / (1.0 + rs)
+    values[avg_loss == 0] = 100.0
+    values[(avg_gain == 0) & (avg_loss == 0)] = 50.0
+    return values
+
+
+class ScreenResult:
+    """Per-symbol signal arrays and a composite score, all aligned on `symbols`"""
+
+    __slots__ = ('symbols', 'price', 'volume_z', 'gap_pct', 'breakout', 'rsi', 'score', 'eligible')
+
+    def __init__(self, symbols, price, volume_z, gap_pct, breakout, rsi, score, eligible):
+        self.symbols = symbols
+        self.price = price
+        self.volume_z = volume_z
+        self.gap_pct = gap_pct
+        self.breakout = breakout
+        self.rsi = rsi
+        self.score = score
+        self.eligible = eligible
+
+    def top(self, k: int = 10) -> List[Dict]:
+        """Top-k eligible symbols by composite score"""
+        scores = np.where(self.eligible, self.score, -np.inf)
+        k = min(k, int(self.eligible.sum()))
+        if k <= 0:
+            return []
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx])]
+        return [
+            {
+                'symbol': str(self.symbols[i]),
+                'price': round(float(self.price[i]), 2),
+                'volume_z': round(float(self.volume_z[i]), 1),
+                'gap_pct': round(float(self.gap_pct[i]), 1),
+                'breakout_pct': round(float((self.breakout[i] - 1.0) * 100.0), 1),
+                'rsi': round(float(self.rsi[i]), 0),
+                'score': round(float(self.score[i]), 2),
+            }
+            for i in idx
+        ]
+
+    def to_prompt_facts(self, k: int = 10) -> str:
+        """Compact one-line-per-symbol facts for the LLM prompt"""
+        lines = []
+        for c in self.top(k):
+            parts = [f"{c['symbol']} ${c['price']}", f"vol z={c['volume_z']}", f"gap {c['gap_pct']:+}%"]
+            if c['breakout_pct'] >= 0:
+                parts.append(f"{BREAKOUT_WINDOW}d high breakout {c['breakout_pct']:+}%")
+            parts.append(f"RSI {int(c['rsi'])}")
+            lines.append("- " + ", ".join(parts))
+        return "\n".join(lines)
+
+
+def screen(history: PriceHistory,
+           volume_window: int = VOLUME_WINDOW,
+           breakout_window: int = BREAKOUT_WINDOW,
+           rsi_period: int = RSI_PERIOD,
+           min_price: float = MIN_PRICE,
+           min_avg_volume: float = MIN_AVG_VOLUME) -> ScreenResult:
+    """Compute every screening signal for the whole universe in one pass"""
+    min_days = max(volume_window, breakout_window, rsi_period) + 1
+    if len(history.dates) < min_days:
+        raise ValueError(f"Screening needs at least {min_days} days of history, got {len(history.dates)}")
+
+    price = history.close[:, -1]
+    vol_z = volume_zscore(history.volume, volume_window)
+    gap = gap_percent(history.open, history.close)
+    brk = breakout_ratio(history.high, history.close, breakout_window)
+    rsi_values = rsi(history.close, rsi_period)
+
+    avg_volume = np.nanmean(history.volume[:, -volume_window - 1:-1], axis=1)
+    eligible = (
+        np.isfinite(price)
+        & (price >= min_price)
+        & (np.nan_to_num(avg_volume) >= min_avg_volume)
+    )
+
+    # Each component is clipped so a single extreme value cannot dominate
+    score = (
+        SCORE_WEIGHTS['volume_z'] * np.clip(vol_z, 0, 10)
+        + SCORE_WEIGHTS['gap_pct'] * np.clip(np.abs(gap), 0, 20) / 2.0
+        + SCORE_WEIGHTS['breakout'] * (brk >= 1.0)
+        + SCORE_WEIGHTS['rsi'] * np.clip(np.abs(rsi_values - 50.0), 0, 40) / 10.0
+    )
+
+    return ScreenResult(history.symbols, price, vol_z, gap, brk, rsi_values, score, eligible)
+
+
+def get_market_facts(history: Optional[PriceHistory], top_k: int = 10) -> Optional[str]:
+    """Screen the universe and return prompt-ready facts, or None if there is no data"""
+    if history is None:
+        return None
+    try:
+        result = screen(history)
+        facts = result.to_prompt_facts(top_k)
+        logger.info(f"Screened {len(history)} symbols, {int(result.eligible.sum())} eligible")
+        return facts or None
+    except Exception as e:
+        logger.warning(f"Market screening failed: {e}")
+        return None
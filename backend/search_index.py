@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Insight Search Index for Investment Assistant
+Local inverted index over insight text with Hebrew-aware tokenization and BM25 ranking
+"""
+
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+POSTINGS_FILE = 'postings.bin'
+LEXICON_FILE = 'lexicon.json'
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+NIQQUD_RE = re.compile('[֑-ׇ]')
+TOKEN_RE = re.compile(r"[א-תA-Za-z0-9]+(?:[.'׳״\"][א-תA-Za-z0-9]+)*")
+FINAL_LETTERS = str.maketrans({'ך': 'כ', 'ם': 'מ', 'ן': 'נ', 'ף': 'פ', 'ץ': 'צ'})
+HEBREW_LETTER_RE = re.compile('[א-ת]')
+
+# One-letter prefixes (ו ה ב ל מ ש כ) and their common combinations, longest first
+HEBREW_PREFIXES = tuple(sorted({
+    'ו', 'ה', 'ב', 'ל', 'מ', 'ש', 'כ',
+    'וה', 'וב', 'ול', 'ומ', 'וש', 'וכ',
+    'שה', 'שב', 'של', 'שמ', 'שכ', 'כש', 'מה', 'לה', 'בה', 'כה',
+    'ושה', 'ושב', 'ושל', 'וכש', 'ומה', 'שבה', 'שלה', 'כשה', 'לכש', 'מש',
+}, key=len, reverse=True))
+MIN_STEM_LENGTH = 3
+
+# Insight text that is worth searching: section -> fields
+INDEXED_FIELDS = {
+    'market_overview': ('summary', 'key_events', 'trending_sectors', 'changes_since_morning'),
+    'recommendations': ('symbol', 'reason', 'catalyst', 'risks', 'why_despite_risks'),
+    'sector_analysis': ('sector', 'reason', 'top_picks', 'risks'),
+    'alerts': ('title', 'message', 'description', 'symbol'),
+}
+
+
+def normalize_token(token: str) -> str:
+    """Strip niqqud and punctuation marks, fold final letters and case"""
+    token = NIQQUD_RE.sub('', token)
+    token = re.sub('[.\'"׳״]', '', token)
+    return token.translate(FINAL_LETTERS).lower()
+
+
+def token_forms(token: str) -> Tuple[str, ...]:
+    """
+    The normalized token plus its form with a Hebrew prefix stripped
+    (והמניות -> מניות). Both are indexed, so over-stripping a word that merely
+    starts with a prefix letter costs precision only slightly.
+    """
+    token = normalize_token(token)
+    if not token:
+        return ()
+    if HEBREW_LETTER_RE.match(token):
+        for prefix in HEBREW_PREFIXES:
+            if token.startswith(prefix) and len(token) - len(prefix) >= MIN_STEM_LENGTH:
+                return token, token[len(prefix):]
+    return (token,)
+
+
+def tokenize(text: str) -> List[str]:
+    terms = []
+    for match in TOKEN_RE.finditer(NIQQUD_RE.sub('', text or '')):
+        terms.extend(token_forms(match.group()))
+    return terms
+
+
+def _collect_text(value, out: List[str]) -> None:
+    if isinstance(value, str):
+        out.append(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_text(item, out)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_text(item, out)
+
+
+def insight_text(insight: Dict) -> str:
+    parts = []
+    for section, fields in INDEXED_FIELDS.items():
+        value = insight.get(section)
+        items = value if isinstance(value, list) else [value]
+        for item in items:
+            if isinstance(item, dict):
+                for field in fields:
+                    _collect_text(item.get(field), parts)
+    return '\n'.join(parts)
+
+
+def encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_postings(data, offset: int, length: int) -> List[Tuple[int, int]]:
+    """Decode (doc, tf) pairs stored as delta-encoded varints"""
+    postings = []
+    pos, end, doc = offset, offset + length, 0
+    values = []
+    while pos < end:
+        value, shift = 0, 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        values.append(value)
+        if len(values) == 2:
+            doc += values[0]
+            postings.append((doc, values[1]))
+            values = []
+    return postings
+
+
+class SearchIndex:
+    """
+    Append-only inverted index. Persisted postings are memory-mapped; new
+    documents are buffered in memory and appended to each term's block on save.
+    Document numbers only grow, so appending keeps every block sorted.
+    Re-indexing an id retires its old document number (a tombstone in `docs`)
+    and adds the new text under a fresh one; retired postings are dropped on
+    the next save.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._mmap = None
+        self.terms: Dict[str, List[int]] = {}   # term -> [offset, length, df, last_doc]
+        self.docs: List[Dict] = []
+        self.doc_numbers: Dict[str, int] = {}
+        self.total_length = 0
+        self._pending: Dict[str, List[Tuple[int, int]]] = {}
+        self._retired: set = set()
+        self._load()
+
+    def _load(self) -> None:
+        lexicon_path = os.path.join(self.directory, LEXICON_FILE)
+        postings_path = os.path.join(self.directory, POSTINGS_FILE)
+        if not os.path.exists(lexicon_path):
+            return
+        with open(lexicon_path, 'r', encoding='utf-8') as f:
+            lexicon = json.load(f)
+        self.terms = lexicon['terms']
+        self.docs = lexicon['docs']
+        self.total_length = lexicon['total_length']
+        self.doc_numbers = {doc['id']: n for n, doc in enumerate(self.docs) if not doc.get('retired')}
+        if os.path.getsize(postings_path) > 0:
+            with open(postings_path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.doc_numbers)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending or self._retired)
+
+    def add_insight(self, doc_id: str, insight: Dict, replace: bool = True) -> bool:
+        """
+        Index one insight. An id that is already indexed is re-indexed when
+        `replace` is set and its generated_at changed (insight ids are
+        deterministic per day, so a regeneration reuses the id); returns False
+        when nothing changed.
+        """
+        terms = Counter(tokenize(insight_text(insight)))
+        with self._lock:
+            if not doc_id:
+                return False
+            if doc_id in self.doc_numbers:
+                old = self.doc_numbers[doc_id]
+                if not replace or self.docs[old].get('generated_at') == insight.get('generated_at'):
+                    return False
+                self.total_length -= self.docs[old]['length']
+                self.docs[old] = {'id': doc_id, 'retired': True, 'length': 0}
+                self._retired.add(old)
+            doc_number = len(self.docs)
+            self.docs.append({
+                'id': doc_id,
+                'type': insight.get('type'),
+                'generated_at': insight.get('generated_at'),
+                'symbols': [r.get('symbol') for r in insight.get('recommendations') or [] if isinstance(r, dict)][:10],
+                'length': sum(terms.values()),
+            })
+            self.doc_numbers[doc_id] = doc_number
+            self.total_length += sum(terms.values())
+            for term, tf in terms.items():
+                self._pending.setdefault(term, []).append((doc_number, tf))
+        return True
+
+    def add_insights(self, insights: Iterable[Dict]) -> int:
+        """Backfill: ids that are already indexed are skipped"""
+        return sum(1 for insight in insights if self.add_insight(insight.get('id'), insight, replace=False))
+
+    def _postings(self, term: str) -> List[Tuple[int, int]]:
+        postings = []
+        entry = self.terms.get(term)
+        if entry and self._mmap is not None:
+            postings = decode_postings(self._mmap, entry[0], entry[1])
+        postings += self._pending.get(term, [])
+        if self._retired or len(self.doc_numbers) < len(self.docs):
+            postings = [(doc, tf) for doc, tf in postings if not self.docs[doc].get('retired')]
+        return postings
+
+    def search(self, query: str, limit: int = 20, insight_type: Optional[str] = None) -> List[Dict]:
+        """BM25 over the query's token forms; each document counts a query word once (its best form)"""
+        with self._lock:
+            n_docs = len(self.doc_numbers)
+            if not n_docs:
+                return []
+            avg_length = self.total_length / n_docs or 1.0
+            scores: Dict[int, float] = {}
+            matched: Dict[int, set] = {}
+
+            for word in TOKEN_RE.findall(NIQQUD_RE.sub('', query or '')):
+                best: Dict[int, float] = {}
+                for form in token_forms(word):
+                    postings = self._postings(form)
+                    if not postings:
+                        continue
+                    idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc, tf in postings:
+                        norm = BM25_K1 * (1 - BM25_B + BM25_B * self.docs[doc]['length'] / avg_length)
+                        score = idf * tf * (BM25_K1 + 1) / (tf + norm)
+                        if score > best.get(doc, 0.0):
+                            best[doc] = score
+                for doc, score in best.items():
+                    scores[doc] = scores.get(doc, 0.0) + score
+                    matched.setdefault(doc, set()).add(word)
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for doc, score in ranked:
+                info = self.docs[doc]
+                if insight_type and info.get('type') != insight_type:
+                    continue
+                results.append({
+                    'id': info['id'],
+                    'score': round(score, 4),
+                    'type': info.get('type'),
+                    'generated_at': info.get('generated_at'),
+                    'symbols': info.get('symbols', []),
+                    'matched': sorted(matched[doc]),
+                })
+                if len(results) >= limit:
+                    break
+            return results
+
+    def save(self) -> None:
+        """Append buffered postings to each term's block and atomically replace the files"""
+        with self._lock:
+            if not self._pending and not self._retired and os.path.exists(os.path.join(self.directory, LEXICON_FILE)):
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            data = bytearray()
+            terms = {}
+            for term in set(self.terms) | set(self._pending):
+                offset = len(data)
+                entry = self.terms.get(term)
+                last_doc, df = 0, 0
+                pending = self._pending.get(term, [])
+                if entry and self._mmap is not None:
+                    if self._retired:
+                        # Re-encode the block without the retired documents
+                        pending = [(doc, tf) for doc, tf in decode_postings(self._mmap, entry[0], entry[1])
+                                   if doc not in self._retired] + pending
+                    else:
+                        data += self._mmap[entry[0]:entry[0] + entry[1]]
+                        df, last_doc = entry[2], entry[3]
+                for doc, tf in pending:
+                    if doc in self._retired:
+                        continue
+                    encode_varint(doc - last_doc, data)
+                    encode_varint(tf, data)
+                    last_doc = doc
+                    df += 1
+                if df:
+                    terms[term] = [offset, len(data) - offset, df, last_doc]
+
+            postings_path = os.path.join(self.directory, POSTINGS_FILE)
+            lexicon_path = os.path.join(self.directory, LEXICON_FILE)
+            with open(postings_path + '.tmp', 'wb') as f:
+                f.write(data)
+            with open(lexicon_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'terms': terms, 'docs': self.docs, 'total_length': self.total_length},
+                          f, ensure_ascii=False, separators=(',', ':'))
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
+            os.replace(postings_path + '.tmp', postings_path)
+            os.replace(lexicon_path + '.tmp', lexicon_path)
+
+            self.terms = terms
+            self._pending = {}
+            self._retired = set()
+            if data:
+                with open(postings_path, 'rb') as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            logger.info(f"Search index saved: {len(self.docs)} insights, {len(terms)} terms, {len(data)} posting bytes")
+
+
+_index: Optional[SearchIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_search_index(directory: str) -> SearchIndex:
+    """Process-wide index instance for a directory"""
+    global _index
+    with _index_lock:
+        if _index is None or _index.directory != directory:
+            _index = SearchIndex(directory)
+        return _index
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Shared Context Generation for Investment Assistant
+Two-stage multi-profile pipeline: the market overview, sector analysis, alerts
+and a pool of candidate ideas are generated once per day and cached; each
+profile then gets a small personalization call that picks and sizes ideas
+from that pool. Storage is one shared document plus a small overlay per profile.
+"""
+
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from batch import TokenRateLimiter, finalize_profile_insight, DEFAULT_CONCURRENCY, BULK_WRITE_SIZE, MAX_REPORTED_ERRORS
+from context_shared import get_shared_prompt, get_profile_overlay_prompt, build_shared_digest, SHARED_PROMPT_VERSION
+from llm_client import extract_json
+from market_data import normalize_symbol
+from model_router import ROUTE_SHARED_CONTEXT, ROUTE_PROFILE_OVERLAY
+from token_counter import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SHARED_CONTEXT_COLLECTION = 'shared_context'
+PROFILE_OVERLAY_TYPE = 'profile_overlay'
+
+SHARED_SECTIONS = ('market_overview', 'sector_analysis', 'alerts', 'candidate_ideas')
+# Sizing fields an overlay may set on top of a shared idea
+OVERLAY_FIELDS = ('amount_ils', 'percentage_of_portfolio', 'action_hebrew')
+
+
+class SharedContextCache:
+    """
+    Shared context per day, in memory and in a backing store. Generation is
+    serialized so concurrent callers on the same day pay for it only once.
+    """
+
+    def __init__(self, load: Callable[[str], Optional[Dict]], save: Callable[[str, Dict], object]):
+        self.load = load
+        self.save = save
+        self._memory: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, day: str) -> Optional[Dict]:
+        shared = self._memory.get(day)
+        if shared is None:
+            shared = self.load(day)
+            if shared is not None:
+                self._memory[day] = shared
+        return shared
+
+    def get_or_create(self, day: str, generate: Callable[[], Dict]) -> Tuple[Dict, bool]:
+        """(shared context, whether it was generated by this call)"""
+        shared = self.get(day)
+        if shared is not None:
+            return shared, False
+        with self._lock:
+            shared = self.get(day)
+            if shared is not None:
+                return shared, False
+            shared = generate()
+            self.save(day, shared)
+            self._memory[day] = shared
+            return shared, True
+
+
+def _usage_tokens(result: Dict, default: int = 0) -> int:
+    return (result.get('usage') or {}).get('total_tokens') or default
+
+
+def generate_shared_context(router, system_prompt: str, day: str, date: Optional[str] = None,
+                            market_facts: Optional[str] = None) -> Dict:
+    """The profile-independent half of the daily insight, kept with enum codes unexpanded"""
+    messages = [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': get_shared_prompt(date, market_facts)},
+    ]
+    result = router.complete(ROUTE_SHARED_CONTEXT, messages)
+    data, _ = extract_json(result['choices'][0]['message']['content'])
+    missing = [key for key in ('market_overview', 'candidate_ideas') if not data.get(key)]
+    if missing:
+        raise ValueError(f"Shared context is missing {', '.join(missing)}")
+
+    shared = {key: data.get(key) for key in SHARED_SECTIONS if data.get(key) is not None}
+    shared.update({
+        'id': day,
+        'generated_at': datetime.utcnow().isoformat(),
+        'prompt_version': SHARED_PROMPT_VERSION,
+        'tokens': _usage_tokens(result),
+    })
+    logger.info(f"Generated shared context for {day}: {len(shared['candidate_ideas'])} candidate ideas")
+    return shared
+
+
+def compose_profile_insight(shared: Dict, overlay: Dict) -> Dict:
+    """
+    Full profile insight from the shared document and one overlay. Overlay picks
+    that are not in the shared idea pool are dropped.
+    """
+    ideas = {normalize_symbol(idea.get('symbol')): idea
+             for idea in shared.get('candidate_ideas') or [] if isinstance(idea, dict)}
+    recommendations = []
+    for pick in overlay.get('recommendations') or []:
+        idea = ideas.get(normalize_symbol(pick.get('symbol'))) if isinstance(pick, dict) else None
+        if idea is None:
+            continue
+        recommendation = {k: copy.deepcopy(v) for k, v in idea.items() if k != 'risk'}
+        recommendation.update({k: pick[k] for k in OVERLAY_FIELDS if pick.get(k) is not None})
+        recommendations.append(recommendation)
+
+    # Copied so expanding enum codes on the result never touches the cached shared document
+    insight = {key: copy.deepcopy(shared[key]) for key in ('market_overview', 'sector_analysis', 'alerts') if key in shared}
+    insight['recommendations'] = recommendations
+    if overlay.get('risk_management'):
+        insight['risk_management'] = overlay['risk_management']
+    return insight
+
+
+def build_overlay_document(overlay: Dict, profile_id: str, day: str) -> Dict:
+    """Only the per-profile part is stored; the rest is read from the shared document"""
+    return {
+        'type': PROFILE_OVERLAY_TYPE,
+        'profile_id': profile_id,
+        'shared_context_id': day,
+        'generated_at': f"{day}T{datetime.utcnow().strftime('%H:%M:%S')}",
+        'prompt_version': SHARED_PROMPT_VERSION,
+        'recommendations': [
+            dict({'symbol': normalize_symbol(pick.get('symbol'))},
+                 **{k: pick[k] for k in OVERLAY_FIELDS if pick.get(k) is not None})
+            for pick in overlay.get('recommendations') or [] if isinstance(pick, dict)
+        ],
+        'risk_management': overlay.get('risk_management'),
+    }
+
+
+def overlay_document_id(profile_id: str, day: str) -> str:
+    return f"{PROFILE_OVERLAY_TYPE}_{day}_{profile_id}"
+
+
+def load_profile_insight(profile_id: str, day: str, cache: SharedContextCache,
+                         get_overlay: Callable[[str], Optional[Dict]]) -> Optional[Dict]:
+    """Composed, validated profile insight for a day, or None if either half is missing"""
+    overlay = get_overlay(overlay_document_id(profile_id, day))
+    shared = cache.get(day) if overlay else None
+    if not shared:
+        return None
+    insight = finalize_profile_insight(compose_profile_insight(shared, overlay), profile_id, overlay.get('generated_at'))
+    insight['prompt_version'] = overlay.get('prompt_version', SHARED_PROMPT_VERSION)
+    insight['shared_context_id'] = day
+    return insight
+
+
+def run_shared_pipeline(profiles: List[Dict], router, cache: SharedContextCache,
+                        write_bulk: Callable[[List[Dict]], object], system_prompt: str, day: str,
+                        tokens_per_minute: int, date: Optional[str] = None, market_facts: Optional[str] = None,
+                        concurrency: int = DEFAULT_CONCURRENCY, bulk_size: int = BULK_WRITE_SIZE) -> Dict:
+    """
+    Generate (or reuse) the day's shared context, then one cheap overlay call per
+    profile under the token rate limit. The expensive market analysis is paid
+    once, so tokens and time per profile shrink as the profile count grows.
+    """
+    started = time.monotonic()
+    shared, created = cache.get_or_create(
+        day, lambda: generate_shared_context(router, system_prompt, day, date, market_facts)
+    )
+    digest = build_shared_digest(shared)
+    route = router.route(ROUTE_PROFILE_OVERLAY)
+    limiter = TokenRateLimiter(tokens_per_minute)
+    report = {
+        'ok': 0, 'failed': 0, 'errors': [],
+        'shared_generated': created,
+        'shared_tokens': shared.get('tokens', 0) if created else 0,
+        'overlay_tokens': 0,
+    }
+    pending_docs: List[Dict] = []
+    lock = threading.Lock()
+
+    def generate(profile):
+        profile_id = str(profile['id'])
+        messages = [
+            {'role': 'system', 'content': system_prompt},
+            {'role': 'user', 'content': get_profile_overlay_prompt(profile, digest)},
+        ]
+        reserved = sum(count_tokens(m['content']) for m in messages) + route['max_tokens']
+        limiter.acquire(reserved)
+        try:
+            result = router.complete(ROUTE_PROFILE_OVERLAY, messages)
+        except Exception:
+            limiter.settle(reserved, reserved)
+            raise
+        actual = _usage_tokens(result, reserved)
+        limiter.settle(reserved, actual)
+        overlay, _ = extract_json(result['choices'][0]['message']['content'])
+        document = build_overlay_document(overlay, profile_id, day)
+        if not document['recommendations']:
+            raise ValueError("Overlay picked no ideas from the shared pool")
+        # Validate the composed insight so a bad overlay fails here rather than on read
+        finalize_profile_insight(compose_profile_insight(shared, document), profile_id)
+        return document, actual
+
+    def run(profile):
+        try:
+            doc, tokens = generate(profile)
+        except Exception as e:
+            with lock:
+                report['failed'] += 1
+                if len(report['errors']) < MAX_REPORTED_ERRORS:
+                    report['errors'].append(f"{profile.get('id')}: {str(e)[:300]}")
+            return
+        with lock:
+            report['ok'] += 1
+            report['overlay_tokens'] += tokens
+            pending_docs.append(doc)
+            batch = pending_docs[:] if len(pending_docs) >= bulk_size else None
+            if batch:
+                pending_docs.clear()
+        if batch:
+            write_bulk(batch)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, profiles))
+    if pending_docs:
+        write_bulk(pending_docs)
+
+    total = report['shared_tokens'] + report['overlay_tokens']
+    report['tokens'] = total
+    report['tokens_per_profile'] = round(total / max(report['ok'], 1), 1)
+    report['seconds'] = round(time.monotonic() - started, 2)
+    logger.info(f"Shared-context batch: {report['ok']} overlays, {report['failed']} failed, "
+                f"{total} tokens ({report['tokens_per_profile']}/profile), {report['seconds']}s")
+    return report
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Afternoon Significance Pre-check for Investment Assistant
+Deterministic check of morning recommendations against current prices,
+so the afternoon LLM call is made only when a threshold was actually crossed
+"""
+
+import math
+import logging
+from datetime import date
+from typing import Dict, List, Optional
+
+from market_data import normalize_symbol, parse_number
+
+logger = logging.getLogger(__name__)
+
+# Same thresholds the afternoon prompt gives the model
+PRICE_MOVE_THRESHOLD_PCT = 3.0
+BENCHMARK_SYMBOLS = ['SPY', 'QQQ']
+
+
+class SignificanceResult:
+    """Outcome of the pre-check; `decided` is False when data was insufficient to skip the LLM"""
+
+    __slots__ = ('has_significant_changes', 'decided', 'reasons', 'checked_symbols', 'missing_symbols')
+
+    def __init__(self, has_significant_changes: bool, decided: bool, reasons: List[str],
+                 checked_symbols: List[str], missing_symbols: List[str]):
+        self.has_significant_changes = has_significant_changes
+        self.decided = decided
+        self.reasons = reasons
+        self.checked_symbols = checked_symbols
+        self.missing_symbols = missing_symbols
+
+    @property
+    def should_call_llm(self) -> bool:
+        return self.has_significant_changes or not self.decided
+
+    def to_dict(self) -> Dict:
+        return {
+            'has_significant_changes': self.has_significant_changes,
+            'decided': self.decided,
+            'reasons': self.reasons,
+            'checked_symbols': self.checked_symbols,
+            'missing_symbols': self.missing_symbols,
+        }
+
+
+def is_sell(action) -> bool:
+    action = str(action or '').strip().lower()
+    return action.startswith('sell') or action.startswith('למכור') or action.startswith('מכירה')
+
+
+def check_recommendation(rec: Dict, price: float,
+                         move_threshold_pct: float = PRICE_MOVE_THRESHOLD_PCT) -> List[str]:
+    """Threshold crossings for one morning recommendation at the given current price"""
+    symbol = normalize_symbol(rec.get('symbol'))
+    reasons = []
+    reference = parse_number(rec.get('current_price'))
+    target = parse_number(rec.get('target_price'))
+    stop = parse_number(rec.get('stop_loss'))
+    sell = is_sell(rec.get('action'))
+
+    if reference:
+        move_pct = (price / reference - 1.0) * 100.0
+        if abs(move_pct) > move_threshold_pct:
+            reasons.append(f"{symbol} moved {move_pct:+.1f}% since morning ({reference:g} -> {price:g})")
+
+    if stop:
+        if (not sell and price <= stop) or (sell and price >= stop):
+            reasons.append(f"{symbol} hit stop loss {stop:g} (now {price:g})")
+    if target:
+        if (not sell and price >= target) or (sell and price <= target):
+            reasons.append(f"{symbol} reached target {target:g} (now {price:g})")
+
+    return reasons
+
+
+def check_significance(morning_insight: Optional[Dict],
+                       current_prices: Dict[str, float],
+                       previous_closes: Optional[Dict[str, float]] = None,
+                       move_threshold_pct: float = PRICE_MOVE_THRESHOLD_PCT,
+                       min_coverage: float = 1.0) -> SignificanceResult:
+    """
+    Compare the morning recommendations with current prices.
+
+    The result is only `decided` when prices were available for at least
+    `min_coverage` of the recommended symbols; otherwise the caller should
+    fall back to the LLM.
+    """
+    if not morning_insight or not morning_insight.get('recommendations'):
+        return SignificanceResult(False, False, ["No morning recommendations to compare against"], [], [])
+
+    prices = {normalize_symbol(s): p for s, p in current_prices.items()}
+    reasons = []
+    checked, missing = [], []
+
+    for rec in morning_insight.get('recommendations', []):
+        symbol = normalize_symbol(rec.get('symbol'))
+        if not symbol:
+            continue
+        price = prices.get(symbol)
+        if price is None:
+            missing.append(symbol)
+            continue
+        checked.append(symbol)
+        reasons.extend(check_recommendation(rec, price, move_threshold_pct))
+
+    # Broad market move, e.g. SPY/QQQ more than the threshold off yesterday's close
+    for symbol, prev_close in (previous_closes or {}).items():
+        symbol = normalize_symbol(symbol)
+        price = prices.get(symbol)
+        if price and prev_close:
+            move_pct = (price / prev_close - 1.0) * 100.0
+            if abs(move_pct) > move_threshold_pct:
+                reasons.append(f"Market benchmark {symbol} moved {move_pct:+.1f}% today")
+
+    total = len(checked) + len(missing)
+    decided = total > 0 and len(checked) / total >= min_coverage
+    has_changes = len(reasons) > 0
+
+    logger.info(
+        f"Afternoon pre-check: {len(reasons)} crossings, "
+        f"{len(checked)}/{total} symbols priced, decided={decided}"
+    )
+    return SignificanceResult(has_changes, decided or has_changes, reasons, checked, missing)
+
+
+def precheck_from_history(morning_insight: Optional[Dict], history,
+                          move_threshold_pct: float = PRICE_MOVE_THRESHOLD_PCT,
+                          min_coverage: float = 1.0, today: Optional[date] = None) -> SignificanceResult:
+    """
+    Run the pre-check using the cached price history as the source of current
+    prices. The cache holds daily bars, so its last close is only a current
+    price when that bar is today's (a cache refreshed intraday); otherwise the
+    check is left undecided and the caller falls back to the LLM.
+    """
+    if history is None:
+        return SignificanceResult(False, False, ["No price data available"], [], [])
+
+    today = today or date.today()
+    last_bar = history.dates[-1].item() if len(history.dates) else None
+    if last_bar != today:
+        logger.info(f"Afternoon pre-check: price cache ends at {last_bar}, not {today} - no intraday prices")
+        return SignificanceResult(False, False, [f"Price cache has no bar for {today} (last bar {last_bar})"], [], [])
+
+    symbols = [rec.get('symbol') for rec in (morning_insight or {}).get('recommendations', [])]
+    current_prices = history.latest_prices(symbols + BENCHMARK_SYMBOLS)
+
+    # Today's bar against the previous session's close
+    previous_closes = {}
+    if history.close.shape[1] >= 2:
+        for symbol in BENCHMARK_SYMBOLS:
+            row = history.index_of(symbol)
+            if row is not None and not math.isnan(history.close[row, -2]):
+                previous_closes[symbol] = float(history.close[row, -2])
+
+    return check_significance(morning_insight, current_prices, previous_closes,
+                              move_threshold_pct, min_coverage)
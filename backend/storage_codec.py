@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Insight Storage Codec for Investment Assistant
+Compact Firestore encoding of insight documents with a per-document size budget
+"""
+
+import base64
+import json
+import logging
+import zlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from market_data import parse_number
+
+logger = logging.getLogger(__name__)
+
+# Firestore's hard limit is 1 MiB; stay well below it by default
+DEFAULT_SIZE_BUDGET = 64 * 1024
+
+# Long free-text fields the frontend cards rarely expand
+DEFAULT_COMPRESS_FIELDS = ('why_despite_risks', 'portfolio_impact', 'risks')
+
+# Fields shortened (longest first) when a document is over budget, and the
+# character caps tried in turn
+TRIM_FIELDS = DEFAULT_COMPRESS_FIELDS + ('reason', 'explanation', 'summary', 'action_required')
+TRIM_CAPS = (2000, 1000, 500, 250, 120)
+TRIM_MARKER = '…'
+
+NUMERIC_FIELDS = ('amount_ils', 'percentage_of_portfolio', 'current_price', 'target_price', 'stop_loss')
+
+TEXT_TABLE_FIELD = '_texts'
+BLOB_FIELD = '_blob'
+TEXT_REF_PREFIX = '\u0000t:'
+MIN_DEDUP_LENGTH = 40
+
+
+class StorageBudgetExceeded(ValueError):
+    """Raised when an encoded document is still over the size budget"""
+
+
+def firestore_size(value: Any) -> int:
+    """
+    Approximate Firestore storage size of a value, following the documented rules:
+    strings are UTF-8 bytes + 1, numbers and booleans 8/1 bytes, map keys count as strings,
+    plus 32 bytes of document overhead at the top level.
+    """
+    if value is None:
+        return 1
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, dict):
+        return sum(firestore_size(k) + firestore_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(firestore_size(v) for v in value)
+    return len(str(value).encode('utf-8')) + 1
+
+
+def document_size(doc: Dict) -> int:
+    return firestore_size(doc) + 32
+
+
+def _walk_strings(value, visit):
+    """Rebuild a nested value, passing every (key, string) pair through `visit`"""
+    if isinstance(value, dict):
+        return {k: (visit(k, v) if isinstance(v, str) else _walk_strings(v, visit)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [visit(None, v) if isinstance(v, str) else _walk_strings(v, visit) for v in value]
+    return value
+
+
+def normalize_numbers(doc: Dict) -> Dict:
+    """Store stringly typed numeric recommendation fields as numbers"""
+    for rec in doc.get('recommendations') or []:
+        if not isinstance(rec, dict):
+            continue
+        for field in NUMERIC_FIELDS:
+            if isinstance(rec.get(field), str):
+                number = parse_number(rec[field])
+                if number is not None:
+                    rec[field] = number
+    return doc
+
+
+def dedupe_text(doc: Dict, min_length: int = MIN_DEDUP_LENGTH) -> Dict:
+    """
+    Replace long strings that occur more than once with references into a
+    single `_texts` table (the model often repeats reasons across sections).
+    """
+    counts = {}
+
+    def count(_, text):
+        if len(text) >= min_length:
+            counts[text] = counts.get(text, 0) + 1
+        return text
+
+    _walk_strings(doc, count)
+    repeated = [text for text, n in counts.items() if n > 1]
+    if not repeated:
+        return doc
+
+    index = {text: i for i, text in enumerate(repeated)}
+    encoded = _walk_strings(doc, lambda _, text: f"{TEXT_REF_PREFIX}{index[text]}" if text in index else text)
+    encoded[TEXT_TABLE_FIELD] = repeated
+    return encoded
+
+
+def compress_fields(doc: Dict, field_names: Iterable[str]) -> Dict:
+    """
+    Move the named long-text fields (anywhere in the document) into one
+    zlib-compressed, base64-encoded `_blob` field keyed by their JSON path.
+    """
+    field_names = set(field_names)
+    moved = {}
+
+    def strip(value, path):
+        if isinstance(value, dict):
+            out = {}
+            for k, v in value.items():
+                child = f"{path}.{k}" if path else k
+                if k in field_names and isinstance(v, str):
+                    moved[child] = v
+                else:
+                    out[k] = strip(v, child)
+            return out
+        if isinstance(value, list):
+            return [strip(v, f"{path}[{i}]") for i, v in enumerate(value)]
+        return value
+
+    stripped = strip(doc, '')
+    if not moved:
+        return doc
+    payload = json.dumps(moved, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    stripped[BLOB_FIELD] = base64.b64encode(zlib.compress(payload, 9)).decode('ascii')
+    return stripped
+
+
+def trim_text(doc: Dict, cap: int, field_names: Iterable[str] = TRIM_FIELDS) -> Dict:
+    """
+    Shorten the named free-text fields to `cap` characters. Unlike dedupe and
+    compression the result is still plain text the frontend can render.
+    """
+    field_names = set(field_names)
+
+    def trim(key, text):
+        if key in field_names and len(text) > cap:
+            return text[:cap].rstrip() + TRIM_MARKER
+        return text
+
+    return _walk_strings(doc, trim)
+
+
+def _set_path(doc: Dict, path: str, value) -> None:
+    """Set a value at a path like 'recommendations[2].risks'"""
+    target = doc
+    parts = path.replace('[', '.[').split('.')
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        key = int(part[1:-1]) if part.startswith('[') else part
+        if last:
+            target[key] = value
+        else:
+            target = target[key]
+
+
+def decode_insight(doc: Dict) -> Dict:
+    """Reverse every storage rule; documents without encoded fields pass through unchanged"""
+    if not isinstance(doc, dict) or (TEXT_TABLE_FIELD not in doc and BLOB_FIELD not in doc):
+        return doc
+    doc = dict(doc)
+    blob = doc.pop(BLOB_FIELD, None)
+    texts = doc.pop(TEXT_TABLE_FIELD, None)
+
+    if texts:
+        def expand(_, text):
+            if text.startswith(TEXT_REF_PREFIX):
+                return texts[int(text[len(TEXT_REF_PREFIX):])]
+            return text
+        doc = _walk_strings(doc, expand)
+
+    if blob:
+        moved = json.loads(zlib.decompress(base64.b64decode(blob)).decode('utf-8'))
+        if texts:
+            moved = {k: texts[int(v[len(TEXT_REF_PREFIX):])] if v.startswith(TEXT_REF_PREFIX) else v
+                     for k, v in moved.items()}
+        for path, value in moved.items():
+            _set_path(doc, path, value)
+    return doc
+
+
+def encode_insight(doc: Dict, dedupe: bool = False, compress: Iterable[str] = (),
+                   budget: Optional[int] = DEFAULT_SIZE_BUDGET) -> Tuple[Dict, Dict]:
+    """
+    Apply the enabled storage rules in order and report bytes saved by each.
+
+    Number normalization always runs. Text deduplication and field
+    compression are opt-in because the frontend reads Firestore directly and
+    cannot decode them; when the document is over `budget` after the enabled
+    rules, long free-text fields are trimmed instead, and
+    StorageBudgetExceeded is raised if that is still not enough.
+    """
+    report = {'original_bytes': document_size(doc), 'rules': {}}
+
+    def apply(name, fn, current):
+        before = document_size(current)
+        result = fn(current)
+        report['rules'][name] = report['rules'].get(name, 0) + before - document_size(result)
+        return result
+
+    encoded = apply('normalize_numbers', normalize_numbers, json.loads(json.dumps(doc)))
+    compress = tuple(compress)
+    if dedupe:
+        encoded = apply('dedupe_text', dedupe_text, encoded)
+    if compress:
+        encoded = apply('compress_fields', lambda d: compress_fields(d, compress), encoded)
+
+    if budget and document_size(encoded) > budget:
+        logger.warning(f"Insight is {document_size(encoded)} bytes, over the {budget} byte budget - trimming long text fields")
+        for cap in TRIM_CAPS:
+            encoded = apply('trim_text', lambda d: trim_text(d, cap), encoded)
+            if document_size(encoded) <= budget:
+                break
+
+    report['encoded_bytes'] = document_size(encoded)
+    report['saved_bytes'] = report['original_bytes'] - report['encoded_bytes']
+    if budget and report['encoded_bytes'] > budget:
+        raise StorageBudgetExceeded(
+            f"Insight is {report['encoded_bytes']} bytes after encoding, over the {budget} byte budget"
+        )
+    return encoded, report
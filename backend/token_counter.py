@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Token Counting for Investment Assistant
+Per-segment prompt token counts, exact with tiktoken when installed, estimated otherwise
+"""
+
+import hashlib
+import logging
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'gpt-4o'
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+
+def is_exact() -> bool:
+    """True when counts come from the real tokenizer rather than the estimate"""
+    return tiktoken is not None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate: ~4 ASCII characters per token, while non-ASCII
+    (Hebrew) text tokenizes at roughly one token per 1-2 characters.
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - ascii_chars
+    return int(round(ascii_chars / 4.0 + other_chars / 1.5))
+
+
+@lru_cache(maxsize=256)
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Token count for a piece of text (memoized, so static segments are counted once)"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text))
+
+
+def measure_segments(segments: List[Tuple[str, str]], model: str = DEFAULT_MODEL) -> Dict:
+    """
+    Token counts for (name, text) prompt segments.
+    Everything before the final 'dynamic' segment is treated as the cacheable
+    prefix, joined the same way context.STATIC_PREFIX is so the hash and count
+    describe the bytes actually sent.
+    """
+    counts = {name: count_tokens(text, model) for name, text in segments}
+    static_text = "\n".join(text for name, text in segments if name != 'dynamic') + "\n"
+    static_tokens = count_tokens(static_text, model)
+    return {
+        'segments': counts,
+        'static_tokens': static_tokens,
+        'dynamic_tokens': counts.get('dynamic', 0),
+        'total_tokens': static_tokens + counts.get('dynamic', 0),
+        'static_sha256': hashlib.sha256(static_text.encode('utf-8')).hexdigest()[:16],
+        'exact': is_exact(),
+    }
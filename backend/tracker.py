@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Open Position Tracker for Investment Assistant
+Incremental mark-to-market of recommended positions, kept as a compact
+array-backed table instead of re-reading daily_insights every day
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from backtest import load_recommendations
+from market_data import PriceHistory
+
+logger = logging.getLogger(__name__)
+
+TRACKER_COLLECTION = 'tracker'
+TRACKER_DOCUMENT = 'open_positions'
+SNAPSHOT_COLLECTION = 'performance_snapshots'
+
+STATUS_OPEN = 'open'
+STATUS_TARGET = 'target_hit'
+STATUS_STOP = 'stop_hit'
+STATUS_EXPIRED = 'expired'
+
+_FLOAT_FIELDS = ('entry_price', 'target', 'stop', 'last_price')
+_INT_FIELDS = ('direction', 'horizon_days')
+_DATE_FIELDS = ('entry_date', 'priced_through')
+_STR_FIELDS = ('symbol', 'confidence', 'rec_type', 'insight_id')
+
+
+class PositionBook:
+    """
+    Open positions stored column-wise.
+    `priced_through` is the last session already applied to each position,
+    so an update only touches symbols with newer bars.
+    """
+
+    def __init__(self, columns: Optional[Dict] = None, watermark: Optional[str] = None):
+        columns = columns or {}
+        self.symbol = np.array(columns.get('symbol', []), dtype=str)
+        self.confidence = np.array(columns.get('confidence', []), dtype=object)
+        self.rec_type = np.array(columns.get('rec_type', []), dtype=object)
+        self.insight_id = np.array(columns.get('insight_id', []), dtype=object)
+        self.entry_price = np.array(columns.get('entry_price', []), dtype=np.float64)
+        self.target = np.array(columns.get('target', []), dtype=np.float64)
+        self.stop = np.array(columns.get('stop', []), dtype=np.float64)
+        self.last_price = np.array(columns.get('last_price', []), dtype=np.float64)
+        self.direction = np.array(columns.get('direction', []), dtype=np.int8)
+        self.horizon_days = np.array(columns.get('horizon_days', []), dtype=np.int64)
+        self.entry_date = np.array(columns.get('entry_date', []), dtype='datetime64[D]')
+        self.priced_through = np.array(columns.get('priced_through', []), dtype='datetime64[D]')
+        self.watermark = watermark
+
+    def __len__(self) -> int:
+        return len(self.symbol)
+
+    def _fields(self):
+        return _STR_FIELDS + _FLOAT_FIELDS + _INT_FIELDS + _DATE_FIELDS
+
+    def add_from_insights(self, insights: Iterable[Dict]) -> int:
+        """Append a position for every recommendation in the given insights"""
+        insights = list(insights)
+        recs = load_recommendations(insights)
+        if len(recs) == 0:
+            return 0
+
+        entry_price = recs.entry_price
+        self.symbol = np.concatenate([self.symbol, recs.symbols])
+        self.confidence = np.concatenate([self.confidence, recs.confidence])
+        self.rec_type = np.concatenate([self.rec_type, recs.rec_type])
+        self.insight_id = np.concatenate([self.insight_id, recs.insight_ids])
+        self.entry_price = np.concatenate([self.entry_price, entry_price])
+        self.target = np.concatenate([self.target, recs.target])
+        self.stop = np.concatenate([self.stop, recs.stop])
+        # Unknown until the first bar, so never-priced positions stay out of the return stats
+        self.last_price = np.concatenate([self.last_price, np.full(len(recs), np.nan)])
+        self.direction = np.concatenate([self.direction, recs.direction])
+        self.horizon_days = np.concatenate([self.horizon_days, recs.horizon_days])
+        self.entry_date = np.concatenate([self.entry_date, recs.entry_date])
+        # Nothing applied yet; the first update starts from the entry session
+        self.priced_through = np.concatenate([self.priced_through, recs.entry_date - 1])
+
+        stamps = [i.get('generated_at') for i in insights if i.get('generated_at')]
+        if stamps:
+            self.watermark = max([self.watermark] + stamps if self.watermark else stamps)
+        return len(recs)
+
+    def _take(self, mask: np.ndarray) -> Dict[str, np.ndarray]:
+        return {field: getattr(self, field)[mask] for field in self._fields()}
+
+    def _keep(self, mask: np.ndarray) -> None:
+        for field in self._fields():
+            setattr(self, field, getattr(self, field)[mask])
+
+    def mark_to_market(self, history: PriceHistory) -> Dict:
+        """
+        Apply bars newer than each position's `priced_through` date.
+        Positions whose symbols have no new bars are not touched.
+        Returns the positions closed by this update.
+        """
+        n = len(self)
+        if n == 0 or len(history.dates) == 0:
+            return {'updated': 0, 'closed': []}
+
+        rows = history.rows_for(self.symbol.tolist())
+        first_new = np.searchsorted(history.dates, self.priced_through, side='right')
+        stale = (rows >= 0) & (first_new < len(history.dates))
+        idx = np.flatnonzero(stale)
+        status = np.full(n, STATUS_OPEN, dtype=object)
+        exit_price = np.full(n, np.nan)
+
+        if len(idx):
+            r, s = rows[idx], first_new[idx]
+            width = len(history.dates) - int(s.min())
+            cols = s[:, None] + np.arange(width)[None, :]
+            in_window = cols < len(history.dates)
+            cols = np.minimum(cols, len(history.dates) - 1)
+            expiry = self.entry_date[idx] + self.horizon_days[idx]
+            in_window &= history.dates[cols] <= expiry[:, None]
+
+            high = history.high[r[:, None], cols]
+            low = history.low[r[:, None], cols]
+            close = history.close[r[:, None], cols]
+            in_window &= ~np.isnan(close)
+
+            target, stop = self.target[idx], self.stop[idx]
+            is_long = self.direction[idx] > 0
+            with np.errstate(invalid='ignore'):
+                target_touch = np.where(is_long[:, None], high >= target[:, None], low <= target[:, None]) & in_window
+                stop_touch = np.where(is_long[:, None], low <= stop[:, None], high >= stop[:, None]) & in_window
+
+            never = width
+            first_target = np.where(target_touch.any(axis=1), target_touch.argmax(axis=1), never)
+            first_stop = np.where(stop_touch.any(axis=1), stop_touch.argmax(axis=1), never)
+            hit_stop = (first_stop <= first_target) & (first_stop < never)
+            hit_target = first_target < first_stop
+            has_bar = in_window.any(axis=1)
+            last_valid = np.where(has_bar, width - 1 - in_window[:, ::-1].argmax(axis=1), 0)
+            last_close = close[np.arange(len(idx)), last_valid]
+            expired = ~hit_stop & ~hit_target & (history.dates[-1] >= expiry)
+
+            self.last_price[idx] = np.where(has_bar, last_close, self.last_price[idx])
+            self.priced_through[idx] = history.dates[-1]
+            status[idx] = np.select([hit_stop, hit_target, expired],
+                                    [STATUS_STOP, STATUS_TARGET, STATUS_EXPIRED], default=STATUS_OPEN)
+            exit_price[idx] = np.select([hit_stop, hit_target], [stop, target], default=self.last_price[idx])
+
+        # Symbols that never get prices still expire on schedule, without an exit price or return
+        unpriced_expired = (rows < 0) & (history.dates[-1] >= self.entry_date + self.horizon_days)
+        status[unpriced_expired] = STATUS_EXPIRED
+        exit_price[unpriced_expired] = self.last_price[unpriced_expired]
+
+        closing = status != STATUS_OPEN
+        closed_positions = self._take(closing)
+        closed = []
+        for i, pos in enumerate(np.flatnonzero(closing)):
+            entry = closed_positions['entry_price'][i]
+            ret = self.direction[pos] * (exit_price[pos] / entry - 1.0) if entry else np.nan
+            closed.append({
+                'symbol': str(closed_positions['symbol'][i]),
+                'status': status[pos],
+                'entry_price': _round(entry),
+                'exit_price': _round(exit_price[pos]),
+                'return_pct': _round(ret * 100),
+                'entry_date': str(closed_positions['entry_date'][i]),
+                'insight_id': closed_positions['insight_id'][i],
+            })
+        self._keep(~closing)
+
+        logger.info(f"Marked {len(idx)} of {n} positions to market, closed {len(closed)}")
+        return {'updated': int(len(idx)), 'closed': closed}
+
+    def unrealized_returns(self) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.direction * (self.last_price / self.entry_price - 1.0)
+
+    def to_document(self) -> Dict:
+        """Serialize as a single column-oriented Firestore document"""
+        columns = {}
+        for field in _STR_FIELDS:
+            columns[field] = [None if v is None else str(v) for v in getattr(self, field).tolist()]
+        for field in _FLOAT_FIELDS:
+            columns[field] = [None if np.isnan(v) else float(v) for v in getattr(self, field)]
+        for field in _INT_FIELDS:
+            columns[field] = [int(v) for v in getattr(self, field)]
+        for field in _DATE_FIELDS:
+            columns[field] = [str(v) for v in getattr(self, field)]
+        return {
+            'columns': columns,
+            'watermark': self.watermark,
+            'count': len(self),
+            'updated_at': datetime.utcnow().isoformat(),
+        }
+
+    @classmethod
+    def from_document(cls, doc: Optional[Dict]) -> 'PositionBook':
+        if not doc:
+            return cls()
+        columns = dict(doc.get('columns') or {})
+        for field in _FLOAT_FIELDS:
+            columns[field] = [np.nan if v is None else v for v in columns.get(field, [])]
+        return cls(columns, doc.get('watermark'))
+
+
+def _round(value, digits: int = 2):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def build_snapshot(book: PositionBook, closed: List[Dict], as_of: str) -> Dict:
+    """Small per-day performance summary of the book and the positions closed today"""
+    unrealized = book.unrealized_returns()
+    priced = ~np.isnan(unrealized)
+    snapshot = {
+        'date': as_of,
+        'open_positions': len(book),
+        'closed_today': closed,
+        'generated_at': datetime.utcnow().isoformat(),
+    }
+    if priced.any():
+        u = unrealized[priced]
+        order = np.argsort(u)
+        symbols = book.symbol[priced]
+        snapshot.update({
+            'avg_unrealized_pct': _round(u.mean() * 100),
+            'winners': int((u > 0).sum()),
+            'losers': int((u < 0).sum()),
+            'best': [{'symbol': str(symbols[i]), 'return_pct': _round(u[i] * 100)} for i in order[::-1][:3]],
+            'worst': [{'symbol': str(symbols[i]), 'return_pct': _round(u[i] * 100)} for i in order[:3]],
+        })
+    if closed:
+        returns = [c['return_pct'] for c in closed if c['return_pct'] is not None]
+        snapshot['realized_avg_pct'] = _round(np.mean(returns)) if returns else None
+    return snapshot
+
+
+def run_tracker_update(load_state, save_state, fetch_insights_since, save_snapshot,
+                       history: PriceHistory) -> Dict:
+    """
+    Daily incremental job: ingest insights newer than the watermark,
+    mark stale positions to market, persist the book and write a snapshot.
+    Storage is injected so the job can run against Firestore or locally.
+    """
+    book = PositionBook.from_document(load_state())
+    added = book.add_from_insights(fetch_insights_since(book.watermark))
+    result = book.mark_to_market(history)
+    as_of = str(history.dates[-1]) if len(history.dates) else datetime.utcnow().strftime('%Y-%m-%d')
+    snapshot = build_snapshot(book, result['closed'], as_of)
+    snapshot['added'] = added
+    snapshot['updated'] = result['updated']
+    save_state(book.to_document())
+    save_snapshot(as_of, snapshot)
+    return snapshot
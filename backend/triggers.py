@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Intraday Update Triggers for Investment Assistant
+Watches a price/volume feed for the symbols in the latest insight and starts a
+targeted update when a threshold is newly crossed, debounced and rate-limited.
+Needs an intraday quote feed: the price_history provider only yields quotes
+when the price cache holds a bar for today (i.e. is refreshed intraday).
+"""
+
+import csv
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from market_data import normalize_symbol, parse_number
+from significance import PRICE_MOVE_THRESHOLD_PCT, is_sell
+
+logger = logging.getLogger(__name__)
+
+EVENT_MOVE = 'move'
+EVENT_STOP_APPROACH = 'stop_approach'
+EVENT_TARGET_REACHED = 'target_reached'
+EVENT_VOLUME_SPIKE = 'volume_spike'
+ALL_EVENTS = frozenset({EVENT_MOVE, EVENT_STOP_APPROACH, EVENT_TARGET_REACHED, EVENT_VOLUME_SPIKE})
+
+
+# --- Price feed providers ---------------------------------------------------
+# A provider returns quotes {'symbol', 'price', 'volume', 'timestamp'} for the
+# requested symbols each time poll() is called.
+
+class ReplayFileProvider:
+    """
+    Replays quotes from a CSV (symbol,price,volume,timestamp) or NDJSON file.
+    Each poll returns the next timestamp's batch, so a recorded session can be
+    stepped through deterministically in tests.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._batches = self._load(path)
+        self._position = 0
+
+    @staticmethod
+    def _load(path: str) -> List[List[Dict]]:
+        with open(path, 'r', encoding='utf-8') as f:
+            if path.endswith('.csv'):
+                rows = list(csv.DictReader(f))
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+        batches: Dict[str, List[Dict]] = {}
+        for row in rows:
+            quote = {
+                'symbol': normalize_symbol(row.get('symbol')),
+                'price': parse_number(row.get('price')),
+                'volume': parse_number(row.get('volume')),
+                'timestamp': str(row.get('timestamp', '')),
+            }
+            batches.setdefault(quote['timestamp'], []).append(quote)
+        return [batches[ts] for ts in sorted(batches)]
+
+    @property
+    def exhausted(self) -> bool:
+        return self._position >= len(self._batches)
+
+    def poll(self, symbols: List[str]) -> List[Dict]:
+        if self.exhausted:
+            return []
+        wanted = {normalize_symbol(s) for s in symbols}
+        batch = self._batches[self._position]
+        self._position += 1
+        return [q for q in batch if q['symbol'] in wanted]
+
+
+class PriceHistoryProvider:
+    """
+    Latest bar of the cached price history (refreshed by whatever writes
+    MARKET_DATA_CACHE). The cache holds daily bars, so this is an intraday
+    feed only when that writer updates today's bar during the session; a
+    cache whose last bar is not today yields no quotes.
+    """
+
+    def __init__(self, get_history: Callable, today: Callable[[], date] = date.today):
+        self.get_history = get_history
+        self.today = today
+
+    def poll(self, symbols: List[str]) -> List[Dict]:
+        history = self.get_history()
+        if history is None or not len(history.dates):
+            return []
+        if history.dates[-1].item() != self.today():
+            logger.info(f"Price cache ends at {history.dates[-1]}, not today - no intraday quotes to evaluate")
+            return []
+        quotes = []
+        timestamp = str(history.dates[-1])
+        for symbol in symbols:
+            row = history.index_of(symbol)
+            if row is None:
+                continue
+            price = float(history.close[row, -1])
+            if price != price:
+                continue
+            quotes.append({
+                'symbol': normalize_symbol(symbol),
+                'price': price,
+                'volume': float(history.volume[row, -1]),
+                'timestamp': timestamp,
+            })
+        return quotes
+
+    def baseline_volumes(self, symbols: List[str], window: int = 20) -> Dict[str, float]:
+        history = self.get_history()
+        baselines = {}
+        if history is None or history.volume.shape[1] < 2:
+            return baselines
+        for symbol in symbols:
+            row = history.index_of(symbol)
+            if row is not None:
+                past = history.volume[row, -window - 1:-1]
+                baselines[normalize_symbol(symbol)] = float(past[past == past].mean()) if (past == past).any() else 0.0
+        return baselines
+
+
+PROVIDERS = {
+    'replay': lambda config, get_history: ReplayFileProvider(config['TRIGGER_REPLAY_FILE']),
+    'price_history': lambda config, get_history: PriceHistoryProvider(
+        get_history, lambda: datetime.now(ZoneInfo(config.get('TIMEZONE') or 'Asia/Jerusalem')).date()),
+}
+
+
+def get_provider(config: Dict, get_history: Callable):
+    name = config.get('TRIGGER_PROVIDER') or 'price_history'
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown trigger provider: {name}")
+    return PROVIDERS[name](config, get_history)
+
+
+# --- Trigger engine -----------------------------------------------------------
+
+@dataclass
+class TriggerRules:
+    move_pct: float = PRICE_MOVE_THRESHOLD_PCT
+    stop_proximity_pct: float = 1.0
+    volume_spike_ratio: float = 3.0
+    debounce_seconds: float = 1800
+    max_updates_per_hour: int = 2
+    # A fired condition re-arms only once it clears by this margin (percentage points)
+    hysteresis_pct: float = 0.5
+
+
+# Share of the spike ratio a volume spike has to fall below to re-arm
+VOLUME_REARM_FRACTION = 0.8
+
+
+class TriggerEngine:
+    """
+    Evaluates quotes against the recommendations of the current insight.
+    Events are edge-triggered: a (symbol, kind) condition fires when it is
+    crossed and stays quiet while it persists, re-arming only after it clears
+    by the hysteresis margin. Unchanged quotes are not re-evaluated, re-fires
+    are additionally debounced, and targeted updates are limited to
+    `max_updates_per_hour` in a sliding window.
+    """
+
+    def __init__(self, rules: Optional[TriggerRules] = None, clock: Callable[[], float] = time.time):
+        self.rules = rules or TriggerRules()
+        self.clock = clock
+        self._last_fired: Dict[tuple, float] = {}
+        self._active: set = set()
+        self._last_quote: Dict[str, tuple] = {}
+        self._updates = deque()
+        self._volume_baseline: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def set_volume_baselines(self, baselines: Dict[str, float]) -> None:
+        self._volume_baseline.update({normalize_symbol(s): v for s, v in baselines.items() if v})
+
+    def _check(self, rec: Dict, quote: Dict):
+        """
+        Events whose threshold is crossed, plus the kinds still within the
+        hysteresis margin of theirs (which must not re-arm yet)
+        """
+        symbol = quote['symbol']
+        price = quote.get('price')
+        if not price:
+            return [], set()
+        events, holding = [], set()
+        margin = self.rules.hysteresis_pct
+        reference = parse_number(rec.get('current_price'))
+        stop = parse_number(rec.get('stop_loss'))
+        target = parse_number(rec.get('target_price'))
+        sell = is_sell(rec.get('action'))
+
+        if reference:
+            move_pct = (price / reference - 1.0) * 100.0
+            if abs(move_pct) > self.rules.move_pct:
+                events.append({'kind': EVENT_MOVE, 'detail': f"{symbol} moved {move_pct:+.1f}% ({reference:g} -> {price:g})"})
+            elif abs(move_pct) > self.rules.move_pct - margin:
+                holding.add(EVENT_MOVE)
+        if stop:
+            distance_pct = (price / stop - 1.0) * 100.0 * (-1 if sell else 1)
+            if distance_pct <= self.rules.stop_proximity_pct:
+                events.append({'kind': EVENT_STOP_APPROACH, 'detail': f"{symbol} at {price:g} is within {max(distance_pct, 0):.1f}% of stop {stop:g}"})
+            elif distance_pct <= self.rules.stop_proximity_pct + margin:
+                holding.add(EVENT_STOP_APPROACH)
+        if target:
+            beyond_pct = (price / target - 1.0) * 100.0 * (-1 if sell else 1)
+            if beyond_pct >= 0:
+                events.append({'kind': EVENT_TARGET_REACHED, 'detail': f"{symbol} reached target {target:g} (now {price:g})"})
+            elif beyond_pct >= -margin:
+                holding.add(EVENT_TARGET_REACHED)
+
+        volume = quote.get('volume')
+        baseline = self._volume_baseline.get(symbol)
+        if volume and baseline and volume >= baseline * self.rules.volume_spike_ratio:
+            events.append({'kind': EVENT_VOLUME_SPIKE, 'detail': f"{symbol} volume {volume:,.0f} is {volume / baseline:.1f}x normal"})
+        elif volume and baseline and volume >= baseline * self.rules.volume_spike_ratio * VOLUME_REARM_FRACTION:
+            holding.add(EVENT_VOLUME_SPIKE)
+        elif volume and not baseline:
+            self._volume_baseline[symbol] = volume
+
+        for event in events:
+            event['symbol'] = symbol
+        return events, holding
+
+    def evaluate(self, insight: Optional[Dict], quotes: List[Dict]) -> List[Dict]:
+        """New threshold crossings: conditions that were not already active and are outside the debounce window"""
+        recs = {normalize_symbol(r.get('symbol')): r for r in (insight or {}).get('recommendations') or [] if isinstance(r, dict)}
+        now = self.clock()
+        fresh = []
+        with self._lock:
+            for quote in quotes:
+                symbol = quote['symbol']
+                rec = recs.get(symbol)
+                if rec is None:
+                    continue
+                # Same quote as last poll (e.g. a feed that has not ticked): nothing new to evaluate
+                seen = (quote.get('timestamp'), quote.get('price'), quote.get('volume'))
+                if self._last_quote.get(symbol) == seen:
+                    continue
+                self._last_quote[symbol] = seen
+
+                events, holding = self._check(rec, quote)
+                fired = {event['kind'] for event in events}
+                for kind in ALL_EVENTS - fired - holding:
+                    self._active.discard((symbol, kind))
+                for event in events:
+                    key = (symbol, event['kind'])
+                    if key in self._active:
+                        continue
+                    self._active.add(key)
+                    if now - self._last_fired.get(key, float('-inf')) < self.rules.debounce_seconds:
+                        continue
+                    self._last_fired[key] = now
+                    fresh.append(event)
+        return fresh
+
+    def allow_update(self) -> bool:
+        """Sliding one-hour rate limit on targeted updates"""
+        now = self.clock()
+        with self._lock:
+            while self._updates and now - self._updates[0] >= 3600:
+                self._updates.popleft()
+            if len(self._updates) >= self.rules.max_updates_per_hour:
+                return False
+            self._updates.append(now)
+            return True
+
+    def poll_once(self, provider, insight: Optional[Dict], on_update: Callable[[List[Dict]], object]) -> Dict:
+        """Poll the feed once; start a targeted update if anything fired and the rate limit allows"""
+        symbols = [r.get('symbol') for r in (insight or {}).get('recommendations') or [] if isinstance(r, dict)]
+        if not symbols:
+            return {'events': [], 'update_started': False, 'reason': 'No recommendations to watch'}
+
+        events = self.evaluate(insight, provider.poll(symbols))
+        if not events:
+            return {'events': [], 'update_started': False}
+        if not self.allow_update():
+            # Let the events fire again on a later poll instead of being swallowed by the debounce
+            with self._lock:
+                for event in events:
+                    key = (event['symbol'], event['kind'])
+                    self._last_fired.pop(key, None)
+                    self._active.discard(key)
+                    self._last_quote.pop(event['symbol'], None)
+            logger.info(f"Trigger events rate-limited: {[e['detail'] for e in events]}")
+            return {'events': events, 'update_started': False, 'reason': 'Rate limited'}
+
+        logger.info(f"Triggered targeted update: {[e['detail'] for e in events]}")
+        return {'events': events, 'update_started': True, 'update': on_update(events)}
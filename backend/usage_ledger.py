@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Usage Ledger for Investment Assistant
+One record per LLM call (tokens, cost, latency, retries, model, prompt
+version, parse strategy and outcome), buffered in memory and bulk-flushed to
+Firestore or local JSONL files, with aggregates by day and insight type
+"""
+
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+USAGE_COLLECTION = 'llm_usage'
+
+OUTCOME_OK = 'ok'
+OUTCOME_ERROR = 'error'
+OUTCOME_FAILED = 'failed'
+
+# USD per 1M tokens: (input, cached input, output)
+MODEL_PRICES = {
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+}
+
+GROUP_FIELDS = ('day', 'insight_type', 'route', 'model', 'prompt_version', 'outcome')
+
+DEFAULT_FLUSH_SIZE = 50
+DEFAULT_FLUSH_SECONDS = 60.0
+
+_current_generation = contextvars.ContextVar('usage_generation', default=None)
+
+
+def call_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    prices = MODEL_PRICES.get(model or '')
+    if prices is None:
+        return None
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    return round((uncached * prices[0] + cached_tokens * prices[1] + completion_tokens * prices[2]) / 1e6, 6)
+
+
+def _usage_tokens(usage: Optional[Dict]):
+    usage = usage or {}
+    return (usage.get('prompt_tokens') or 0, usage.get('completion_tokens') or 0,
+            (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0)
+
+
+def build_record(route: str, model: str, usage: Optional[Dict], latency_seconds: float,
+                 retries: int = 0, error: Optional[str] = None, loser_usage: Optional[Dict] = None) -> Dict:
+    """
+    One call's record. `loser_usage` is what the losing request of a hedged
+    call was billed; it is kept out of the token counts (they describe the
+    reply used) but included in cost_usd.
+    """
+    prompt_tokens, completion_tokens, cached_tokens = _usage_tokens(usage)
+    hedge_prompt_tokens, hedge_completion_tokens, hedge_cached_tokens = _usage_tokens(loser_usage)
+    cost = call_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+    if cost is not None and loser_usage:
+        cost = round(cost + call_cost(model, hedge_prompt_tokens, hedge_completion_tokens, hedge_cached_tokens), 6)
+    now = datetime.utcnow()
+    return {
+        'timestamp': now.isoformat(),
+        'day': now.strftime('%Y-%m-%d'),
+        'insight_type': route,
+        'route': route,
+        'model': model,
+        'prompt_version': None,
+        'generation_id': None,
+        'prompt_tokens': prompt_tokens,
+        'cached_tokens': cached_tokens,
+        'completion_tokens': completion_tokens,
+        'hedge_prompt_tokens': hedge_prompt_tokens,
+        'hedge_completion_tokens': hedge_completion_tokens,
+        'cost_usd': cost,
+        'latency_seconds': round(latency_seconds, 3),
+        'retries': retries,
+        'parse_strategy': None,
+        'schema_completeness': None,
+        'outcome': OUTCOME_ERROR if error else OUTCOME_OK,
+        'error': error[:300] if error else None,
+    }
+
+
+class Generation:
+    """The calls made while producing one insight; outcome and parse strategy are filled in as it finishes"""
+
+    def __init__(self, insight_type: str, prompt_version: Optional[str]):
+        self.insight_type = insight_type
+        self.prompt_version = prompt_version
+        self.generation_id = uuid.uuid4().hex[:12]
+        self.records: List[Dict] = []
+
+    def add(self, record: Dict) -> None:
+        record.update(insight_type=self.insight_type, prompt_version=self.prompt_version,
+                      generation_id=self.generation_id)
+        self.records.append(record)
+
+    def parsed(self, strategy: str) -> None:
+        if self.records:
+            self.records[-1]['parse_strategy'] = strategy
+
+    def completeness(self, score: float) -> None:
+        """Schema completeness (0-1) of the insight the last call produced"""
+        if self.records:
+            self.records[-1]['schema_completeness'] = score
+
+    def failed(self, error: BaseException) -> None:
+        """A call that returned fine but whose reply could not be used"""
+        for record in reversed(self.records):
+            if record['outcome'] == OUTCOME_OK:
+                record['outcome'] = OUTCOME_FAILED
+                record['error'] = f"{type(error).__name__}: {error}"[:300]
+                return
+
+
+def current_generation() -> Optional[Generation]:
+    return _current_generation.get()
+
+
+def mark_parsed(strategy: str) -> None:
+    """Record which parse strategy worked for the last call of the current generation"""
+    generation = _current_generation.get()
+    if generation is not None:
+        generation.parsed(strategy)
+
+
+# --- Sinks ----------------------------------------------------------------------
+
+class LocalLedgerSink:
+    """One JSONL file per day under `directory`"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def write(self, records: List[Dict]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        by_day: Dict[str, List[Dict]] = {}
+        for record in records:
+            by_day.setdefault(record['day'], []).append(record)
+        for day, items in by_day.items():
+            with open(os.path.join(self.directory, f"usage-{day}.jsonl"), 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(r, ensure_ascii=False) + '\n' for r in items)
+
+    def read(self, since_day: str) -> Iterator[Dict]:
+        for path in sorted(glob.glob(os.path.join(self.directory, 'usage-*.jsonl'))):
+            if os.path.basename(path)[len('usage-'):-len('.jsonl')] < since_day:
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+class FirestoreLedgerSink:
+    def __init__(self, add_bulk: Callable[[str, List[Dict]], object],
+                 stream_since: Callable[[str, str, str], Iterable[Dict]]):
+        self.add_bulk = add_bulk
+        self.stream_since = stream_since
+
+    def write(self, records: List[Dict]) -> None:
+        self.add_bulk(USAGE_COLLECTION, records)
+
+    def read(self, since_day: str) -> Iterator[Dict]:
+        return iter(self.stream_since(USAGE_COLLECTION, 'day', since_day))
+
+
+# --- Ledger ------------------------------------------------------------------------
+
+class UsageLedger:
+    """
+    Buffers records and hands them to the sink in bulk once `flush_size`
+    records are pending or the oldest has waited `flush_seconds` (a timer
+    flushes them even when no further call arrives). A failed flush keeps the
+    records for the next attempt.
+    """
+
+    def __init__(self, sink, flush_size: int = DEFAULT_FLUSH_SIZE, flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+                 max_buffer: int = 5000):
+        self.sink = sink
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self.max_buffer = max_buffer
+        self._buffer: List[Dict] = []
+        self._oldest = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def record_call(self, record: Dict) -> None:
+        """Attach to the current generation if there is one, otherwise buffer directly"""
+        generation = _current_generation.get()
+        if generation is not None:
+            generation.add(record)
+        else:
+            self.add([record])
+
+    def add(self, records: List[Dict]) -> None:
+        with self._lock:
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._buffer.extend(records)
+            if len(self._buffer) > self.max_buffer:
+                dropped = len(self._buffer) - self.max_buffer
+                del self._buffer[:dropped]
+                logger.warning(f"Usage ledger buffer full - dropped {dropped} oldest records")
+            due = len(self._buffer) >= self.flush_size or time.monotonic() - self._oldest >= self.flush_seconds
+            if not due:
+                self._schedule_flush()
+        if due:
+            self.flush()
+
+    def _schedule_flush(self) -> None:
+        """Start the flush timer if none is pending; called with _lock held"""
+        if self._timer is None:
+            self._timer = threading.Timer(self.flush_seconds, self._timed_flush)
+            self._timer.name = 'usage-ledger-flush'
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self) -> None:
+        with self._lock:
+            self._timer = None
+        self.flush()
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                records, self._buffer, self._oldest = self._buffer, [], None
+            if not records:
+                return 0
+            try:
+                self.sink.write(records)
+            except Exception as e:
+                logger.warning(f"Usage ledger flush of {len(records)} records failed: {e}")
+                with self._lock:
+                    self._buffer[:0] = records
+                    self._oldest = self._oldest or time.monotonic()
+                    self._schedule_flush()
+                return 0
+        logger.info(f"Usage ledger flushed {len(records)} records")
+        return len(records)
+
+    @contextmanager
+    def generation(self, insight_type: str, prompt_version: Optional[str] = None):
+        """Group the LLM calls of one insight; a failing body marks the last good call as failed"""
+        generation = Generation(insight_type, prompt_version)
+        token = _current_generation.set(generation)
+        try:
+            yield generation
+        except Exception as e:
+            generation.failed(e)
+            raise
+        finally:
+            _current_generation.reset(token)
+            if generation.records:
+                self.add(generation.records)
+
+    def records_since(self, days: int) -> List[Dict]:
+        self.flush()
+        since_day = (datetime.utcnow() - timedelta(days=max(days - 1, 0))).strftime('%Y-%m-%d')
+        return list(self.sink.read(since_day))
+
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(pct / 100.0 * len(values)))], 3)
+
+
+def aggregate(records: Iterable[Dict], group_by: Iterable[str] = ('day', 'insight_type')) -> List[Dict]:
+    """Totals, cost and latency percentiles per group"""
+    group_by = tuple(group_by)
+    for field in group_by:
+        if field not in GROUP_FIELDS:
+            raise ValueError(f"Cannot group usage by {field}; choose from {', '.join(GROUP_FIELDS)}")
+
+    groups: Dict[tuple, Dict] = {}
+    for record in records:
+        key = tuple(record.get(field) for field in group_by)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = dict(zip(group_by, key), calls=0, errors=0, failed=0, generations=set(),
+                                       prompt_tokens=0, cached_tokens=0, completion_tokens=0,
+                                       hedge_prompt_tokens=0, hedge_completion_tokens=0, cost_usd=0.0,
+                                       retries=0, latencies=[], parse_strategies={}, completeness=[])
+        group['calls'] += 1
+        group['errors'] += record.get('outcome') == OUTCOME_ERROR
+        group['failed'] += record.get('outcome') == OUTCOME_FAILED
+        if record.get('generation_id'):
+            group['generations'].add(record['generation_id'])
+        for field in ('prompt_tokens', 'cached_tokens', 'completion_tokens', 'hedge_prompt_tokens',
+                      'hedge_completion_tokens', 'retries'):
+            group[field] += record.get(field) or 0
+        group['cost_usd'] += record.get('cost_usd') or 0.0
+        if record.get('outcome') != OUTCOME_ERROR:
+            group['latencies'].append(record.get('latency_seconds') or 0.0)
+        if record.get('schema_completeness') is not None:
+            group['completeness'].append(record['schema_completeness'])
+        if record.get('parse_strategy'):
+            strategies = group['parse_strategies']
+            strategies[record['parse_strategy']] = strategies.get(record['parse_strategy'], 0) + 1
+
+    summary = []
+    for key in sorted(groups, key=lambda k: tuple(str(v) for v in k)):
+        group = groups[key]
+        latencies = group.pop('latencies')
+        completeness = group.pop('completeness')
+        group['generations'] = len(group['generations'])
+        group['cost_usd'] = round(group['cost_usd'], 4)
+        group['latency_p50_seconds'] = _percentile(latencies, 50)
+        group['latency_p95_seconds'] = _percentile(latencies, 95)
+        group['avg_completion_tokens'] = round(group['completion_tokens'] / max(group['calls'] - group['errors'], 1), 1)
+        # Replies that came back but could not be parsed or validated
+        group['parse_failure_rate'] = round(group['failed'] / max(group['calls'] - group['errors'], 1), 4)
+        group['avg_schema_completeness'] = round(sum(completeness) / len(completeness), 4) if completeness else None
+        summary.append(group)
+    return summary